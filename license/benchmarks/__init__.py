@@ -0,0 +1,50 @@
+"""
+.. module: license.benchmarks
+    :synopsis: Benchmarks for the license models.
+
+Each benchmark module is runnable on its own, e.g.
+``python -m license.benchmarks.memory``, and prints its results as JSON.
+``python -m license.benchmarks`` runs several of them into one document.
+"""
+from __future__ import unicode_literals
+import json
+import platform
+import sys
+from license import passwords
+
+
+#: Encoded password for the customers built by the benchmarks, so they do
+#: not measure password hashing.
+PASSWORD = passwords.hasher().encode('password')
+
+
+def metadata():
+    """Return the interpreter and machine the benchmarks ran on."""
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+    }
+
+
+def write_json(document, stream=None):
+    """Write `document` as JSON.
+
+    :param dict document: Document to write.
+    :param stream: File to write to, `sys.stdout` by default.
+    """
+    stream = stream or sys.stdout
+    stream.write(json.dumps(document, indent=2, sort_keys=True))
+    stream.write('\n')
+
+
+def emit(benchmark, results, stream=None):
+    """Write benchmark results as JSON.
+
+    :param str benchmark: Benchmark name.
+    :param list results: List of result dicts.
+    :param stream: File to write to, `sys.stdout` by default.
+    """
+    document = metadata()
+    document.update(benchmark=benchmark, results=results)
+    write_json(document, stream)
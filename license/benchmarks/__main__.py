@@ -0,0 +1,51 @@
+"""
+.. module: license.benchmarks.__main__
+    :synopsis: Run several benchmarks into one JSON document.
+
+::
+
+    python -m license.benchmarks hot_paths rejections --output results.json
+"""
+from __future__ import unicode_literals
+import argparse
+import importlib
+import sys
+from license.benchmarks import metadata, write_json
+
+
+BENCHMARKS = (
+    'hot_paths',
+    'rejections',
+    'memory',
+    'analytics',
+    'concurrency',
+    'aio',
+    'relicensing',
+    'snapshot',
+    'passwords',
+)
+
+
+def main(argv=None):
+    """Run the benchmarks with their default parameters."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('benchmarks', nargs='*', default=['hot_paths'],
+                        choices=BENCHMARKS,
+                        help='Benchmarks to run, hot_paths by default.')
+    parser.add_argument('--output', type=argparse.FileType('w'),
+                        help='File to write the JSON results to.')
+    args = parser.parse_args(argv)
+    document = metadata()
+    document['benchmarks'] = {}
+    for name in args.benchmarks:
+        module = importlib.import_module('license.benchmarks.' + name)
+        document['benchmarks'][name] = module.run()
+    try:
+        write_json(document, args.output)
+    finally:
+        if args.output not in (None, sys.stdout):
+            args.output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+.. module: license.benchmarks.aio
+    :synopsis: Concurrent license checks through the asyncio service.
+
+Fires batches of concurrent license checks against a SQLite repository,
+once spread over many customers and once concentrated on a few hot ones,
+where coalescing shares repository lookups (Python 3.5+)::
+
+    python -m license.benchmarks.aio --concurrency 1000 5000
+"""
+from __future__ import unicode_literals, division
+import argparse
+import asyncio
+from timeit import default_timer
+from license.benchmarks import PASSWORD
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.services.aio import LicenseService
+from license.storage.sqlite import SQLiteRepository
+
+
+CONCURRENCY = (100, 1000, 5000)
+
+
+def _throughput(service, emails, concurrency):
+    """Return checks per second of `concurrency` concurrent checks."""
+    async def batch():
+        await asyncio.gather(*[
+            service.is_licensed(emails[index % len(emails)], 'https://a')
+            for index in range(concurrency)])
+
+    loop = asyncio.new_event_loop()
+    try:
+        start = default_timer()
+        loop.run_until_complete(batch())
+        return concurrency / (default_timer() - start)
+    finally:
+        loop.close()
+
+
+def run(concurrency=CONCURRENCY, customers=1000, hot=10):
+    """Measure concurrent checks for every concurrency level.
+
+    :param concurrency: Concurrent checks per batch.
+    :param int customers: Customers in the repository.
+    :param int hot: Customers receiving every check in the hot batches.
+    :return: List of result dicts.
+    """
+    repository = SQLiteRepository()
+    emails = ['{0}@example.com'.format(i) for i in range(customers)]
+    repository.save_customers(
+        Customer('name', email, PASSWORD, Plan.SINGLE, encoded=True)
+        for email in emails)
+    results = []
+    for count in concurrency:
+        for name, targets in (('spread', emails), ('hot', emails[:hot])):
+            service = LicenseService(repository)
+            results.append({
+                'concurrency': count,
+                'customers': name,
+                'checks_per_sec': round(
+                    _throughput(service, targets, count)),
+                'repository_calls': service.calls,
+            })
+    repository.close()
+    return results
+
+
+def main(argv=None):
+    """Run the asyncio service benchmark."""
+    from license.benchmarks import emit
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=CONCURRENCY,
+                        help='Concurrent checks per batch.')
+    parser.add_argument('--customers', type=int, default=1000,
+                        help='Customers in the repository.')
+    args = parser.parse_args(argv)
+    emit('aio', run(args.concurrency, args.customers))
+
+
+if __name__ == '__main__':
+    main()
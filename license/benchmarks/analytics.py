@@ -0,0 +1,98 @@
+"""
+.. module: license.benchmarks.analytics
+    :synopsis: Revenue and allowance analytics over many customers.
+
+Compares :class:`~license.services.analytics.CustomerSnapshot` against
+iterating customers and calling :meth:`Plan.price` and
+:meth:`Plan.allowance` per row::
+
+    python -m license.benchmarks.analytics --customers 1000000
+"""
+from __future__ import unicode_literals, division
+import argparse
+from collections import Counter
+import timeit
+from license.benchmarks import PASSWORD
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.services.analytics import CustomerSnapshot
+
+
+def build_customers(count):
+    """Return `count` customers spread over every plan.
+
+    :param int count: Number of customers.
+    """
+    customers = []
+    for index in range(count):
+        plan_type = Plan.PLANS[index % len(Plan.PLANS)]
+        customer = Customer('name', 'email{0}'.format(index), PASSWORD,
+                            plan_type, encoded=True)
+        if index % 2:
+            customer.subscription.add_website('https://example.com')
+        customers.append(customer)
+    return customers
+
+
+def per_row(customers):
+    """Compute the analytics iterating customer objects."""
+    arr = 0
+    mix = Counter()
+    over = 0
+    for customer in customers:
+        subscription = customer.subscription
+        if subscription is None:
+            continue
+        plan = subscription.plan
+        arr += plan.price()
+        mix[plan.plan_type] += 1
+        allowance = plan.allowance()
+        if 0 < allowance < len(subscription.enabled_websites()):
+            over += 1
+    return arr, mix, over
+
+
+def aggregate(snapshot):
+    """Compute the analytics over a columnar snapshot."""
+    return (snapshot.revenue(), snapshot.plan_mix(),
+            snapshot.over_allowance(), snapshot.utilisation_histogram())
+
+
+def run(count=1000000, repeat=3):
+    """Time both implementations.
+
+    :param int count: Number of customers.
+    :param int repeat: Timings per implementation, the best is kept.
+    :return: List of result dicts.
+    """
+    customers = build_customers(count)
+    snapshot = CustomerSnapshot.from_customers(customers)
+    timings = [
+        ('per_row', lambda: per_row(customers)),
+        ('snapshot_and_aggregate',
+         lambda: aggregate(CustomerSnapshot.from_customers(customers))),
+        ('aggregate_only', lambda: aggregate(CustomerSnapshot(
+            snapshot.plan_codes,
+            snapshot.enabled,
+            snapshot.renewals
+        ))),
+    ]
+    return [{
+        'implementation': name,
+        'customers': count,
+        'seconds': min(timeit.repeat(func, number=1, repeat=repeat)),
+    } for name, func in timings]
+
+
+def main(argv=None):
+    """Run the analytics benchmark."""
+    from license.benchmarks import emit
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--customers', type=int, default=1000000,
+                        help='Number of customers.')
+    args = parser.parse_args(argv)
+    emit('analytics', run(args.customers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+.. module: license.benchmarks.concurrency
+    :synopsis: Throughput of a thread safe subscription under contention.
+
+Hammers a single Infinite subscription with add/disable/remove cycles from
+an increasing number of threads, and reports the single thread cost of the
+lock against an unlocked subscription::
+
+    python -m license.benchmarks.concurrency --threads 1 2 4 8
+"""
+from __future__ import unicode_literals, division
+import argparse
+import threading
+from timeit import default_timer
+from license.models.plan import Plan
+from license.models.subscription import Subscription
+
+
+THREADS = (1, 2, 4, 8)
+
+
+def _throughput(subscription, threads, number):
+    """Return operations per second of `threads` threads."""
+    def hammer(index):
+        urls = ['https://{0}-{1}.example.com'.format(index, i)
+                for i in range(number)]
+        for url in urls:
+            subscription.add_website(url)
+            subscription.disable_website(url)
+            subscription.remove_website(url)
+
+    workers = [threading.Thread(target=hammer, args=(index,))
+               for index in range(threads)]
+    start = default_timer()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return 3 * threads * number / (default_timer() - start)
+
+
+def run(threads=THREADS, number=20000):
+    """Measure throughput for each thread count.
+
+    :param threads: Thread counts.
+    :param int number: Add/disable/remove cycles per thread.
+    :return: List of result dicts.
+    """
+    results = [{
+        'threads': 1,
+        'thread_safe': False,
+        'ops_per_sec': round(_throughput(
+            Subscription(Plan.INFINITE, None, thread_safe=False), 1, number)),
+    }]
+    for count in threads:
+        subscription = Subscription(Plan.INFINITE, None, thread_safe=True)
+        results.append({
+            'threads': count,
+            'thread_safe': True,
+            'ops_per_sec': round(_throughput(subscription, count, number)),
+        })
+    return results
+
+
+def main(argv=None):
+    """Run the concurrency benchmark."""
+    from license.benchmarks import emit
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, nargs='+', default=THREADS,
+                        help='Thread counts.')
+    parser.add_argument('--number', type=int, default=20000,
+                        help='Add/disable/remove cycles per thread.')
+    args = parser.parse_args(argv)
+    emit('concurrency', run(args.threads, args.number))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+.. module: license.benchmarks.hot_paths
+    :synopsis: Latency of the license models hot paths.
+
+Times the model operations on subscriptions of increasing size. Each
+measurement runs a batch of operations on a freshly built subscription and
+keeps the best of several repeats::
+
+    python -m license.benchmarks.hot_paths --sizes 1 100 10000 100000
+"""
+from __future__ import unicode_literals, division
+import argparse
+import sys
+from timeit import default_timer
+from license.benchmarks import PASSWORD
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.models.selection import KeepRecentlyUsed
+
+
+SIZES = (1, 10, 100, 1000, 10000, 100000)
+
+
+def build_subscription(size, plan_type=Plan.INFINITE):
+    """Return a subscription holding `size` enabled websites.
+
+    :param int size: Number of websites.
+    :param str plan_type: Plan type, websites are added as Infinite.
+    """
+    customer = Customer('name', 'email@example.com', PASSWORD,
+                        Plan.INFINITE, encoded=True)
+    subscription = customer.subscription
+    subscription.add_websites(
+        'https://site{0}.example.com'.format(i) for i in range(size)
+    )
+    subscription.plan = Plan(plan_type)
+    return subscription
+
+
+def measure(setup, operation, number, repeat):
+    """Return the best time per operation, in seconds.
+
+    :param setup: Callable returning the state for one repeat, untimed.
+    :param operation: Callable taking the state and running `number`
+        operations.
+    :param int number: Operations per repeat.
+    :param int repeat: Repeats.
+    """
+    best = None
+    for _ in range(repeat):
+        state = setup()
+        start = default_timer()
+        operation(state)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / number
+
+
+def _new_urls(number):
+    return ['https://new{0}.example.com'.format(i) for i in range(number)]
+
+
+def _existing_urls(size, number):
+    return ['https://site{0}.example.com'.format(i % size)
+            for i in range(number)]
+
+
+def cases(size, number):
+    """Return ``(name, setup, operation, number)`` for subscription cases.
+
+    :param int size: Subscription size.
+    :param int number: Operations per batch for per-website operations.
+    """
+    new_urls = _new_urls(number)
+    existing = _existing_urls(size, min(number, size))
+    # Every other website used, most recently the last ones added.
+    recently_used = KeepRecentlyUsed(dict(
+        ('site{0}.example.com'.format(i), i) for i in range(0, size, 2)))
+
+    def add_website(subscription):
+        for url in new_urls:
+            subscription.add_website(url)
+
+    def disable_website(subscription):
+        for url in existing:
+            subscription.disable_website(url)
+
+    def remove_website(subscription):
+        for url in existing:
+            subscription.remove_website(url)
+
+    def enabled_websites(subscription):
+        for _ in range(10):
+            subscription.enabled_websites()
+
+    def snapshot(subscription):
+        for _ in range(number):
+            subscription.snapshot()
+
+    def disable_after_snapshot(subscription):
+        for url in existing:
+            subscription.snapshot()
+            subscription.disable_website(url)
+
+    return [
+        ('subscription.add_website',
+         lambda: build_subscription(size), add_website, number),
+        ('subscription.disable_website',
+         lambda: build_subscription(size), disable_website, len(existing)),
+        ('subscription.remove_website',
+         lambda: build_subscription(size), remove_website, len(existing)),
+        ('subscription.enabled_websites',
+         lambda: build_subscription(size), enabled_websites, 10),
+        ('subscription.snapshot',
+         lambda: build_subscription(size), snapshot, number),
+        ('subscription.snapshot.disable_website',
+         lambda: build_subscription(size), disable_after_snapshot,
+         len(existing)),
+        ('subscription.update_plan.upgrade',
+         lambda: build_subscription(size, Plan.SINGLE),
+         lambda subscription: subscription.update_plan(Plan.INFINITE), 1),
+        ('subscription.update_plan.downgrade',
+         lambda: build_subscription(size),
+         lambda subscription: subscription.update_plan(Plan.PLUS), 1),
+        ('subscription.update_plan.downgrade.recently_used',
+         lambda: build_subscription(size),
+         lambda subscription: subscription.update_plan(Plan.PLUS,
+                                                       recently_used), 1),
+        ('subscription.change_plan.downgrade',
+         lambda: build_subscription(size),
+         lambda subscription: subscription.change_plan(Plan.PLUS), 1),
+    ]
+
+
+def run(sizes=SIZES, number=1000, repeat=5):
+    """Run every hot path benchmark.
+
+    :param sizes: Subscription sizes.
+    :param int number: Operations per batch.
+    :param int repeat: Repeats, the best is kept.
+    :return: List of result dicts.
+    """
+    results = []
+
+    def subscribe(_):
+        for _ in range(number):
+            Customer('name', 'email', PASSWORD,
+                     encoded=True).subscribe(Plan.PLUS)
+
+    def plan(_):
+        for _ in range(number):
+            Plan(Plan.PLUS)
+
+    for name, operation in (('customer.subscribe', subscribe),
+                            ('plan.__init__', plan)):
+        results.append({
+            'operation': name,
+            'size': None,
+            'seconds_per_op': measure(lambda: None, operation, number,
+                                      repeat),
+        })
+    for size in sizes:
+        for name, setup, operation, ops in cases(size, number):
+            results.append({
+                'operation': name,
+                'size': size,
+                'seconds_per_op': measure(setup, operation, ops, repeat),
+            })
+    return results
+
+
+def main(argv=None):
+    """Run the hot paths benchmark."""
+    from license.benchmarks import emit
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='Subscription sizes.')
+    parser.add_argument('--number', type=int, default=1000,
+                        help='Operations per batch.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Repeats, the best is kept.')
+    parser.add_argument('--output', type=argparse.FileType('w'),
+                        help='File to write the JSON results to.')
+    args = parser.parse_args(argv)
+    try:
+        emit('hot_paths', run(args.sizes, args.number, args.repeat),
+             args.output)
+    finally:
+        if args.output not in (None, sys.stdout):
+            args.output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+.. module: license.benchmarks.memory
+    :synopsis: Per-object memory of the license models.
+
+Compares the slot based models against equivalent ``__dict__`` based
+classes, which is how the models were laid out before::
+
+    python -m license.benchmarks.memory --count 1000000
+"""
+from __future__ import unicode_literals, division
+import argparse
+import gc
+import sys
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+from license.benchmarks import PASSWORD
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.models.subscription import Subscription
+from license.models.website import Website
+
+
+class _DictWebsite(object):
+    """Website laid out with an instance ``__dict__``."""
+
+    def __init__(self, url, customer, enabled=True):
+        self.url = url
+        self.enabled = enabled
+        self.customer = customer
+
+
+class _DictPlan(object):
+    """Plan laid out with an instance ``__dict__``."""
+
+    def __init__(self, plan_type):
+        self.plan_type = plan_type
+
+
+class _DictSubscription(object):
+    """Subscription laid out with an instance ``__dict__``."""
+
+    def __init__(self, plan, user):
+        self.plan = _DictPlan(plan)
+        self.user = user
+        self._websites = []
+
+
+class _DictCustomer(object):
+    """Customer laid out with an instance ``__dict__``."""
+
+    def __init__(self, name, email, password):
+        self.name = name
+        self.email = email
+        self.password = password
+        self.subscription = None
+        self.subscription_renewal = None
+
+
+def measure(factory, count):
+    """Return the average bytes allocated per object built by `factory`.
+
+    Uses :mod:`tracemalloc` when available, otherwise falls back to
+    :func:`sys.getsizeof` of a single object and its ``__dict__``.
+
+    :param factory: Callable taking an index and returning an object.
+    :param int count: Number of objects to build.
+    """
+    gc.collect()
+    if tracemalloc is None:
+        obj = factory(0)
+        size = sys.getsizeof(obj)
+        if hasattr(obj, '__dict__'):
+            size += sys.getsizeof(obj.__dict__)
+        return size
+
+    objects = [None] * count
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for index in range(count):
+        objects[index] = factory(index)
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return used / count
+
+
+def run(count=1000000):
+    """Measure every model before (``__dict__``) and after (slots).
+
+    :param int count: Number of websites; other models use a tenth of it.
+    :return: List of result dicts.
+    """
+    urls = ['https://site{0}.example.com'.format(i) for i in range(count)]
+    owner = Customer('name', 'email@example.com', PASSWORD, encoded=True)
+    graphs = max(count // 10, 1)
+    cases = [
+        ('website', count,
+         lambda i: _DictWebsite(urls[i], owner),
+         lambda i: Website(urls[i], owner)),
+        ('plan', graphs,
+         lambda i: _DictPlan(Plan.PLUS),
+         lambda i: Plan(Plan.PLUS)),
+        ('subscription', graphs,
+         lambda i: _DictSubscription(Plan.PLUS, owner),
+         lambda i: Subscription(Plan.PLUS, owner)),
+        ('customer', graphs,
+         lambda i: _DictCustomer(urls[i], urls[i], PASSWORD),
+         lambda i: Customer(urls[i], urls[i], PASSWORD, encoded=True)),
+    ]
+    results = []
+    for name, objects, before, after in cases:
+        results.append({
+            'model': name,
+            'objects': objects,
+            'bytes_per_object_before': round(measure(before, objects), 1),
+            'bytes_per_object_after': round(measure(after, objects), 1),
+        })
+    return results
+
+
+def main(argv=None):
+    """Run the memory benchmark."""
+    from license.benchmarks import emit
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=1000000,
+                        help='Number of websites to allocate.')
+    args = parser.parse_args(argv)
+    emit('memory', run(args.count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+.. module: license.benchmarks.passwords
+    :synopsis: Login throughput of the password hasher.
+
+Verifies passwords on 1 to N hashing threads and reports logins per second
+and per core, plus the cost of a cached verification and of a login that
+rehashes an outdated password::
+
+    python -m license.benchmarks.passwords --logins 64 --workers 1 2 4
+"""
+from __future__ import unicode_literals, division
+import argparse
+import multiprocessing
+from timeit import default_timer
+from license import passwords
+from license.models.customer import Customer
+
+
+WORKERS = (1, multiprocessing.cpu_count())
+
+
+def run(workers=WORKERS, logins=32, n=2 ** 14):
+    """Measure login throughput.
+
+    :param workers: Hashing thread counts.
+    :param int logins: Logins per measure.
+    :param int n: scrypt cost, also used to derive the PBKDF2 iterations.
+    :return: List of result dicts.
+    """
+    cpus = multiprocessing.cpu_count()
+    results = []
+    for count in sorted(set(workers)):
+        hasher = passwords.PasswordHasher(n=n, iterations=16 * n,
+                                          workers=count)
+        encoded = hasher.encode('password')
+        try:
+            hasher.pool  # Start the threads before measuring.
+            start = default_timer()
+            pending = [hasher.verify_async('password', encoded)
+                       for _ in range(logins)]
+            for result in pending:
+                result.get()
+            elapsed = default_timer() - start
+        finally:
+            hasher.close()
+        rate = logins / elapsed
+        results.append({
+            'case': 'verify',
+            'algorithm': hasher.algorithm,
+            'workers': count,
+            'cpus': cpus,
+            'logins_per_sec': round(rate, 1),
+            'logins_per_sec_per_core': round(rate / min(count, cpus), 1),
+        })
+
+    hasher = passwords.PasswordHasher(n=n, iterations=16 * n,
+                                      cache_size=1024)
+    encoded = hasher.encode('password')
+    hasher.verify('password', encoded)
+    start = default_timer()
+    for _ in range(logins):
+        hasher.verify('password', encoded)
+    rate = logins / (default_timer() - start)
+    results.append({'case': 'verify_cached', 'algorithm': hasher.algorithm,
+                    'workers': 1, 'cpus': cpus,
+                    'logins_per_sec': round(rate, 1),
+                    'logins_per_sec_per_core': round(rate, 1)})
+
+    # Customers hashed with half the cost are rehashed on their first login.
+    previous = passwords.use_hasher(passwords.PasswordHasher(
+        n=n // 2, iterations=8 * n))
+    try:
+        customers = [Customer('name', 'email', 'password')
+                     for _ in range(logins)]
+        passwords.use_hasher(hasher)
+        start = default_timer()
+        for customer in customers:
+            customer.check_password('password')
+        rate = logins / (default_timer() - start)
+    finally:
+        passwords.use_hasher(previous)
+    results.append({'case': 'verify_rehash', 'algorithm': hasher.algorithm,
+                    'workers': 1, 'cpus': cpus,
+                    'logins_per_sec': round(rate, 1),
+                    'logins_per_sec_per_core': round(rate, 1)})
+    return results
+
+
+def main(argv=None):
+    """Run the password benchmark."""
+    from license.benchmarks import emit
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+', default=WORKERS,
+                        help='Hashing thread counts.')
+    parser.add_argument('--logins', type=int, default=32,
+                        help='Logins per measure.')
+    parser.add_argument('--cost', type=int, default=2 ** 14,
+                        help='scrypt cost (N).')
+    args = parser.parse_args(argv)
+    emit('passwords', run(args.workers, args.logins, args.cost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+.. module: license.benchmarks.rejections
+    :synopsis: Throughput of business-rule rejections.
+
+Compares the current rejection paths against the previous implementation,
+which formatted messages eagerly and logged them with ``LOG.exception``.
+Logging is configured the way production runs: ``license`` loggers at
+WARNING with a handler attached::
+
+    python -m license.benchmarks.rejections --number 100000
+"""
+from __future__ import unicode_literals, division
+import argparse
+import logging
+import timeit
+from license.benchmarks import PASSWORD
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.exceptions.plan import PlanUpgradeError
+from license.exceptions.subscription import (
+    SubscriptionWebsiteLimitReached,
+    SubscriptionPlanNotValid,
+)
+
+
+LEGACY_LOG = logging.getLogger('license.benchmarks.legacy')
+
+
+class _NullStream(object):
+    """Stream discarding everything written to it."""
+
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+
+def _legacy_upgrade(plan, new_plan):
+    """Plan.upgrade rejection as previously implemented."""
+    current_plan_weight = Plan.PLANS.index(plan.plan_type)
+    new_plan_weight = Plan.PLANS.index(new_plan)
+    if current_plan_weight > new_plan_weight:
+        LEGACY_LOG.exception(
+            "Error upgrading plan from '{plan}' to '{new_plan}'".format(
+                plan=plan.plan_type,
+                new_plan=new_plan
+            )
+        )
+        raise PlanUpgradeError(
+            "'{plan}' cannot be upgraded to '{new_plan}'".format(
+                plan=plan.plan_type,
+                new_plan=new_plan
+            )
+        )
+
+
+def _legacy_add_website(subscription, url):
+    """Subscription.add_website rejection as previously implemented."""
+    count = len(subscription.enabled_websites())
+    if subscription.plan.allowance() > 0 and \
+            count >= subscription.plan.allowance():
+        LEGACY_LOG.exception(
+            "Allowance for plan '{plan}' has been reached".format(
+                plan=subscription.plan
+            )
+        )
+        raise SubscriptionWebsiteLimitReached(
+            "Cannot add any more websites to plan '{plan}'".format(
+                plan=subscription.plan
+            )
+        )
+
+
+def _legacy_update_plan(subscription, new_plan):
+    """Subscription.update_plan rejection as previously implemented."""
+    for change in (subscription.plan.upgrade, subscription.plan.downgrade):
+        try:
+            change(new_plan)
+        except Exception:
+            LEGACY_LOG.exception("Error changing plan")
+    LEGACY_LOG.exception(
+        "Error modifying subscription '{subscription}' to '{plan}'".format(
+            subscription=subscription,
+            plan=new_plan
+        )
+    )
+    raise SubscriptionPlanNotValid(
+        "'{subscription}' cannot be updated to plan '{new_plan}'".format(
+            subscription=subscription,
+            new_plan=new_plan
+        )
+    )
+
+
+def _throughput(func, args, error, number):
+    """Return rejections per second of `func(*args)`."""
+    def rejected():
+        try:
+            func(*args)
+        except error:
+            pass
+    return number / timeit.timeit(rejected, number=number)
+
+
+def run(number=100000):
+    """Measure every rejection path before and after.
+
+    :param int number: Rejections per measurement.
+    :return: List of result dicts.
+    """
+    logger = logging.getLogger('license')
+    saved = logger.handlers[:], logger.level, logger.propagate
+    logger.handlers = [logging.StreamHandler(_NullStream())]
+    logger.setLevel(logging.WARNING)
+    logger.propagate = False
+    try:
+        return _run(number)
+    finally:
+        logger.handlers, level, logger.propagate = saved
+        logger.setLevel(level)
+
+
+def _run(number):
+    customer = Customer('name', 'email@example.com', PASSWORD, Plan.SINGLE,
+                        encoded=True)
+    subscription = customer.subscription
+    subscription.add_website('https://example.com')
+    infinite = Plan(Plan.INFINITE)
+    cases = [
+        ('plan_upgrade', PlanUpgradeError,
+         (_legacy_upgrade, (infinite, Plan.SINGLE)),
+         (infinite.upgrade, (Plan.SINGLE,))),
+        ('add_website_limit', SubscriptionWebsiteLimitReached,
+         (_legacy_add_website, (subscription, 'https://other.com')),
+         (subscription.add_website, ('https://other.com',))),
+        ('update_plan_invalid', SubscriptionPlanNotValid,
+         (_legacy_update_plan, (subscription, 'not valid')),
+         (subscription.update_plan, ('not valid',))),
+    ]
+    results = []
+    for name, error, before, after in cases:
+        results.append({
+            'path': name,
+            'number': number,
+            'rejections_per_sec_before': round(
+                _throughput(before[0], before[1], error, number)),
+            'rejections_per_sec_after': round(
+                _throughput(after[0], after[1], error, number)),
+        })
+    return results
+
+
+def main(argv=None):
+    """Run the rejections benchmark."""
+    from license.benchmarks import emit
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=100000,
+                        help='Rejections per measurement.')
+    args = parser.parse_args(argv)
+    emit('rejections', run(args.number))
+
+
+if __name__ == '__main__':
+    main()
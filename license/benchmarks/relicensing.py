@@ -0,0 +1,77 @@
+"""
+.. module: license.benchmarks.relicensing
+    :synopsis: Scaling of the relicensing engine across processes.
+
+Downgrades a base of Infinite customers to Single with an increasing number
+of worker processes::
+
+    python -m license.benchmarks.relicensing --processes 1 2 4 8
+"""
+from __future__ import unicode_literals, division
+import argparse
+import multiprocessing
+from timeit import default_timer
+from license.benchmarks import PASSWORD
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.services.relicensing import RelicensingEngine
+
+
+PROCESSES = (1, 2, 4, 8)
+
+
+def build_customers(count, websites):
+    """Return `count` Infinite customers with `websites` websites each."""
+    customers = []
+    for index in range(count):
+        customer = Customer('name', '{0}@example.com'.format(index),
+                            PASSWORD, Plan.INFINITE, encoded=True)
+        customer.subscription.add_websites(
+            ['https://{0}-{1}.example.com'.format(index, i)
+             for i in range(websites)])
+        customers.append(customer)
+    return customers
+
+
+def run(processes=PROCESSES, customers=100000, websites=20):
+    """Measure a full downgrade for every process count.
+
+    :param processes: Worker process counts.
+    :param int customers: Customers to downgrade.
+    :param int websites: Websites per customer.
+    :return: List of result dicts.
+    """
+    base = build_customers(customers, websites)
+    results = []
+    for count in processes:
+        engine = RelicensingEngine(processes=count)
+        start = default_timer()
+        report = engine.run(base, Plan.SINGLE)
+        elapsed = default_timer() - start
+        results.append({
+            'processes': count,
+            'cpus': multiprocessing.cpu_count(),
+            'customers': customers,
+            'websites_disabled': report.disabled_count(),
+            'customers_per_sec': round(customers / elapsed),
+        })
+    return results
+
+
+def main(argv=None):
+    """Run the relicensing benchmark."""
+    from license.benchmarks import emit
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--processes', type=int, nargs='+',
+                        default=PROCESSES, help='Worker process counts.')
+    parser.add_argument('--customers', type=int, default=100000,
+                        help='Customers to downgrade.')
+    parser.add_argument('--websites', type=int, default=20,
+                        help='Websites per customer.')
+    args = parser.parse_args(argv)
+    emit('relicensing',
+         run(args.processes, args.customers, args.websites))
+
+
+if __name__ == '__main__':
+    main()
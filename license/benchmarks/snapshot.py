@@ -0,0 +1,91 @@
+"""
+.. module: license.benchmarks.snapshot
+    :synopsis: Worker warm start from a snapshot against SQLite.
+
+Writes the same customers to a snapshot and to a SQLite database, then
+times opening each, reading one customer and loading every customer::
+
+    python -m license.benchmarks.snapshot --customers 100000
+"""
+from __future__ import unicode_literals, division
+import argparse
+import os
+import shutil
+import tempfile
+from timeit import default_timer
+from license.benchmarks.relicensing import build_customers
+from license.storage.snapshot import SnapshotReader, write_snapshot
+from license.storage.sqlite import SQLiteRepository
+
+
+def _timed(func, *args):
+    """Return the seconds taken by `func(*args)` and its result."""
+    start = default_timer()
+    result = func(*args)
+    return default_timer() - start, result
+
+
+def _measure(name, repository_factory, write, customers, email):
+    """Time writing, opening, one lookup and a full load of a storage."""
+    write_time, _ = _timed(write, customers)
+    open_time, repository = _timed(repository_factory)
+    try:
+        lookup_time, _ = _timed(repository.get_customer, email)
+        load_time, loaded = _timed(
+            lambda: sum(1 for _ in repository.iter_customers()))
+    finally:
+        repository.close()
+    return {
+        'storage': name,
+        'customers': loaded,
+        'write_sec': round(write_time, 3),
+        'open_sec': round(open_time, 6),
+        'first_lookup_sec': round(lookup_time, 6),
+        'load_all_sec': round(load_time, 3),
+    }
+
+
+def run(customers=100000, websites=5):
+    """Compare snapshot and SQLite warm starts.
+
+    :param int customers: Customers to store.
+    :param int websites: Websites per customer.
+    :return: List of result dicts.
+    """
+    base = build_customers(customers, websites)
+    email = base[-1].email
+    directory = tempfile.mkdtemp()
+    try:
+        snapshot = os.path.join(directory, 'customers.snapshot')
+        database = os.path.join(directory, 'customers.db')
+
+        def write_database(customers):
+            repository = SQLiteRepository(database)
+            repository.save_customers(customers)
+            repository.close()
+
+        return [
+            _measure('snapshot', lambda: SnapshotReader(snapshot),
+                     lambda customers: write_snapshot(customers, snapshot),
+                     base, email),
+            _measure('sqlite', lambda: SQLiteRepository(database),
+                     write_database, base, email),
+        ]
+    finally:
+        shutil.rmtree(directory)
+
+
+def main(argv=None):
+    """Run the snapshot benchmark."""
+    from license.benchmarks import emit
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--customers', type=int, default=100000,
+                        help='Customers to store.')
+    parser.add_argument('--websites', type=int, default=5,
+                        help='Websites per customer.')
+    args = parser.parse_args(argv)
+    emit('snapshot', run(args.customers, args.websites))
+
+
+if __name__ == '__main__':
+    main()
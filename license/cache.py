@@ -0,0 +1,84 @@
+"""
+.. module: license.cache
+    :synopsis: Bounded LRU cache.
+"""
+from __future__ import unicode_literals
+from collections import OrderedDict
+import threading
+
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """Thread safe, size bounded, least recently used cache.
+
+    Counts hits, misses and evictions so callers can expose them.
+    """
+
+    def __init__(self, maxsize=1024):
+        """LRU cache.
+
+        :param int maxsize: Maximum number of entries.
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1.")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of entries."""
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """Return whether `key` is cached, without touching it."""
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Return the value for `key` and mark it as recently used.
+
+        :param key: Cache key.
+        :param default: Returned when `key` is not cached.
+        """
+        with self._lock:
+            value = self._entries.pop(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Cache `value` for `key`, evicting the least recently used entry
+        when full."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Remove `key` and return its value or `default`."""
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def clear(self):
+        """Remove every entry, counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return a dict with size, maxsize, hits, misses and evictions."""
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
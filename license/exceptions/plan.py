@@ -36,3 +36,13 @@ class PlanDowngradeError(Exception):
     """
 
     pass
+
+
+@python_2_unicode_compatible
+class PlanCatalogError(Exception):
+    """Plan catalog error.
+
+    Used when a plan catalog configuration is not valid.
+    """
+
+    pass
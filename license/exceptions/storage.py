@@ -0,0 +1,27 @@
+"""
+.. module: license.exceptions.storage
+    :synopsis: Storage exceptions.
+"""
+from __future__ import unicode_literals
+from future.utils import python_2_unicode_compatible
+
+
+@python_2_unicode_compatible
+class CustomerNotFound(Exception):
+    """Customer not found.
+
+    Used when a customer does not exist in a repository.
+    """
+
+    pass
+
+
+@python_2_unicode_compatible
+class SnapshotFormatError(Exception):
+    """Snapshot format error.
+
+    Used when a file is not a snapshot or was written by an unsupported
+    version of the snapshot format.
+    """
+
+    pass
@@ -0,0 +1,235 @@
+"""
+.. module: license.instrumentation
+    :synopsis: Opt-in latency and rejection metrics for the license models.
+
+Instrumentation wraps the model methods listed in :data:`INSTRUMENTED`
+when :func:`enable` is called and puts the original functions back on
+:func:`disable`, so it costs nothing while disabled::
+
+    from license import instrumentation
+    instrumentation.enable()
+    ...
+    print(instrumentation.render())
+"""
+from __future__ import unicode_literals
+import functools
+import logging
+import threading
+from bisect import bisect_left
+from timeit import default_timer
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.models.subscription import Subscription
+
+
+LOG = logging.getLogger(__name__)
+
+#: Latency buckets in seconds.
+LATENCY_BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001,
+    0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.1, 1.0,
+)
+#: Enabled websites buckets.
+SIZE_BUCKETS = (0, 1, 3, 10, 30, 100, 1000, 10000, 100000)
+
+#: Class -> names of the methods instrumented.
+INSTRUMENTED = (
+    (Customer, ('subscribe',)),
+    (Plan, ('upgrade', 'downgrade')),
+    (Subscription, (
+        'add_website',
+        'add_websites',
+        'disable_website',
+        'disable_websites',
+        'remove_website',
+        'remove_websites',
+        'update_plan',
+        'change_plan',
+        'enforce_allowance',
+        'enabled_websites',
+        'is_licensed',
+    )),
+)
+
+
+class Histogram(object):
+    """Cumulative histogram with fixed buckets."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        """Histogram.
+
+        :param tuple buckets: Sorted upper bounds, ``+Inf`` is implicit.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """Record `value`."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Yield ``(upper bound, count)`` with ``+Inf`` last."""
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+def _labels(**labels):
+    """Return a Prometheus label set."""
+    return ','.join(
+        '%s="%s"' % (name, value.replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in sorted(labels.items())
+    )
+
+
+class Metrics(object):
+    """Metrics recorded by the instrumented methods.
+
+    Call counts are the ``_count`` of the latency histograms.
+    """
+
+    def __init__(self):
+        """Metrics."""
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget every observation."""
+        with self._lock:
+            #: operation -> latency :class:`Histogram`
+            self.latency = {}
+            #: (operation, exception name) -> count
+            self.rejections = {}
+            #: :class:`Histogram` of enabled websites per subscription call.
+            self.sizes = Histogram(SIZE_BUCKETS)
+
+    def observe(self, operation, seconds, size=None, error=None):
+        """Record a call of `operation`.
+
+        :param str operation: ``Class.method``
+        :param float seconds: Call duration.
+        :param int size: Enabled websites of the subscription, if any.
+        :param error: Exception raised by the call, if any.
+        """
+        with self._lock:
+            histogram = self.latency.get(operation)
+            if histogram is None:
+                histogram = self.latency[operation] = Histogram(
+                    LATENCY_BUCKETS)
+            histogram.observe(seconds)
+            if size is not None:
+                self.sizes.observe(size)
+            if error is not None:
+                key = (operation, type(error).__name__)
+                self.rejections[key] = self.rejections.get(key, 0) + 1
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP license_operation_seconds Latency of license operations.',
+            '# TYPE license_operation_seconds histogram',
+        ]
+        with self._lock:
+            for operation in sorted(self.latency):
+                histogram = self.latency[operation]
+                for bound, count in histogram.cumulative():
+                    lines.append('license_operation_seconds_bucket{%s} %d' % (
+                        _labels(operation=operation, le=str(bound)), count))
+                labels = _labels(operation=operation)
+                lines.append('license_operation_seconds_sum{%s} %r' % (
+                    labels, float(histogram.sum)))
+                lines.append('license_operation_seconds_count{%s} %d' % (
+                    labels, histogram.count))
+
+            lines.extend([
+                '# HELP license_rejections_total Operations rejected, by '
+                'exception.',
+                '# TYPE license_rejections_total counter',
+            ])
+            for (operation, exception), count in sorted(
+                    self.rejections.items()):
+                lines.append('license_rejections_total{%s} %d' % (
+                    _labels(operation=operation, exception=exception),
+                    count))
+
+            lines.extend([
+                '# HELP license_subscription_enabled_websites Enabled '
+                'websites of the subscriptions operated on.',
+                '# TYPE license_subscription_enabled_websites histogram',
+            ])
+            for bound, count in self.sizes.cumulative():
+                lines.append(
+                    'license_subscription_enabled_websites_bucket{%s} %d' %
+                    (_labels(le=str(bound)), count))
+            lines.append('license_subscription_enabled_websites_sum %d' %
+                         self.sizes.sum)
+            lines.append('license_subscription_enabled_websites_count %d' %
+                         self.sizes.count)
+        return '\n'.join(lines) + '\n'
+
+
+#: Metrics recorded while instrumentation is enabled.
+METRICS = Metrics()
+
+# (class, name) -> original function, while enabled.
+_originals = {}
+
+
+def _wrap(cls, name, function, metrics):
+    """Return `function` recording its calls into `metrics`."""
+    operation = '%s.%s' % (cls.__name__, name)
+    sized = cls is Subscription
+
+    @functools.wraps(function)
+    def instrumented(self, *args, **kwargs):
+        start = default_timer()
+        try:
+            result = function(self, *args, **kwargs)
+        except Exception as error:
+            metrics.observe(operation, default_timer() - start,
+                            self.enabled_count() if sized else None, error)
+            raise
+        metrics.observe(operation, default_timer() - start,
+                        self.enabled_count() if sized else None)
+        return result
+    return instrumented
+
+
+def enable(metrics=None):
+    """Instrument the model methods.
+
+    :param metrics: :class:`Metrics` to record into, :data:`METRICS` by
+        default.
+    """
+    metrics = metrics or METRICS
+    disable()
+    for cls, names in INSTRUMENTED:
+        for name in names:
+            function = cls.__dict__[name]
+            _originals[(cls, name)] = function
+            setattr(cls, name, _wrap(cls, name, function, metrics))
+    LOG.info("License instrumentation enabled")
+
+
+def disable():
+    """Restore the original model methods."""
+    for (cls, name), function in list(_originals.items()):
+        setattr(cls, name, function)
+        del _originals[(cls, name)]
+
+
+def is_enabled():
+    """Return whether instrumentation is enabled."""
+    return bool(_originals)
+
+
+def render():
+    """Return :data:`METRICS` in the Prometheus text exposition format."""
+    return METRICS.render()
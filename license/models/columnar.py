@@ -0,0 +1,362 @@
+"""
+.. module: license.models.columnar
+    :synopsis: Columnar website index for very large subscriptions.
+"""
+from __future__ import unicode_literals
+from future.utils import python_2_unicode_compatible
+from itertools import compress
+import logging
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+from license.models.urls import canonicalize
+from license.models.website import Website
+
+
+LOG = logging.getLogger(__name__)
+
+_ENABLED = b'\x01'
+
+_URLS, _POSITIONS, _FLAGS = '_urls', '_positions', '_flags'
+# Column -> function copying it.
+_COLUMNS = {_URLS: list, _POSITIONS: dict, _FLAGS: bytearray}
+
+
+class WebsiteView(Website):
+    """Website backed by a :class:`ColumnarWebsiteIndex`.
+
+    Views are built on access and read/write through to the index, so
+    enabling or disabling a view keeps the index counters consistent. Views
+    of an index owned by a subscription write through the subscription
+    instead, so disabling them is the same as :meth:`disable_website
+    <license.models.subscription.Subscription.disable_website>`; they
+    cannot be enabled again.
+    """
+
+    __slots__ = ('_index', '_url')
+
+    def __init__(self, index, url):
+        """Website view.
+
+        :param index: :class:`ColumnarWebsiteIndex` holding the website.
+        :param str url: Website url.
+        """
+        self._index = index
+        self._url = url
+
+    @property
+    def url(self):
+        """Website url."""
+        return self._url
+
+    @property
+    def customer(self):
+        """Customer who registered the site."""
+        return self._index.customer
+
+    @property
+    def enabled(self):
+        """Whether the website is enabled. `False` once removed."""
+        return self._index.is_enabled(self._url)
+
+    @enabled.setter
+    def enabled(self, enabled):
+        owner = self._index.owner
+        if owner is None:
+            self._index._set_enabled(self._url, enabled)
+        elif enabled:
+            if not owner.is_licensed(self._url):
+                raise ValueError(
+                    "Websites of a subscription cannot be enabled again.")
+        else:
+            owner.disable_website(self._url)
+
+
+class _LazyWebsites(Sequence):
+    """Sequence of urls materialized as :class:`WebsiteView` on access."""
+
+    __slots__ = ('_index', '_urls')
+
+    def __init__(self, index, urls):
+        self._index = index
+        self._urls = urls
+
+    def __len__(self):
+        return len(self._urls)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [WebsiteView(self._index, url) for url in self._urls[item]]
+        return WebsiteView(self._index, self._urls[item])
+
+    def __iter__(self):
+        index = self._index
+        for url in self._urls:
+            yield WebsiteView(index, url)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+@python_2_unicode_compatible
+class ColumnarWebsiteIndex(object):
+    """Columnar, url-keyed index of websites.
+
+    Drop-in replacement for :class:`~license.models.website_index.WebsiteIndex`
+    meant for subscriptions with a very large number of websites. Instead of
+    one :class:`~license.models.website.Website` per site it keeps:
+
+    - a list of urls in insertion order (`None` for removed websites),
+    - a canonical url -> position dict,
+    - a :class:`bytearray` with one enabled flag per position.
+
+    Filtering enabled websites and trimming them on downgrades run over the
+    flags with C level operations; websites are only materialized as
+    :class:`WebsiteView` when accessed.
+
+    :meth:`copy` shares the columns between both indexes, each of them
+    copies a column before changing it: disabling websites only copies the
+    flags.
+    """
+
+    __slots__ = (
+        'customer',
+        'owner',
+        'enabled_count',
+        '_urls',
+        '_positions',
+        '_flags',
+        '_removed',
+        '_shared',
+    )
+
+    def __init__(self, websites=None, customer=None, owner=None):
+        """Columnar website index.
+
+        :param websites: Websites to index, in insertion order.
+        :param customer: Customer who registered the sites.
+        :param owner: :class:`~license.models.subscription.Subscription`
+            holding the index, which writes through views go to.
+        """
+        self.customer = customer
+        self.owner = owner
+        self.enabled_count = 0
+        self._urls = []
+        self._positions = {}
+        self._flags = bytearray()
+        self._removed = 0
+        # Names of the columns shared with a copy.
+        self._shared = set()
+        for website in websites or []:
+            self.append(website)
+
+    def __len__(self):
+        """Number of websites in the index."""
+        return len(self._positions)
+
+    def __iter__(self):
+        """Iterate over websites in insertion order."""
+        for url in self._urls:
+            if url is not None:
+                yield WebsiteView(self, url)
+
+    def __contains__(self, url):
+        """Return whether a website with `url` is indexed."""
+        return canonicalize(url) in self._positions
+
+    def get(self, url):
+        """Return the website for `url` or `None`."""
+        position = self._positions.get(canonicalize(url))
+        if position is None:
+            return None
+        return WebsiteView(self, self._urls[position])
+
+    def append(self, website):
+        """Append a website to the index.
+
+        :param website: :class:`~license.models.website.Website` to add.
+        :return: `True` if added, `False` if the url was already indexed.
+        """
+        url = website.url
+        key = canonicalize(url)
+        if key in self._positions:
+            return False
+
+        if self._shared:
+            self._own(_URLS, _POSITIONS, _FLAGS)
+        self._positions[key] = len(self._urls)
+        self._urls.append(url)
+        if website.enabled:
+            self._flags.append(1)
+            self.enabled_count += 1
+        else:
+            self._flags.append(0)
+        return True
+
+    def remove(self, url):
+        """Remove the website for `url`.
+
+        :param str url: Url of website to remove.
+        :return: A detached :class:`~license.models.website.Website` for the
+            removed website or `None`.
+        """
+        key = canonicalize(url)
+        if key not in self._positions:
+            return None
+
+        if self._shared:
+            self._own(_URLS, _POSITIONS, _FLAGS)
+        position = self._positions.pop(key)
+
+        url = self._urls[position]
+        enabled = bool(self._flags[position])
+        self._urls[position] = None
+        self._flags[position] = 0
+        if enabled:
+            self.enabled_count -= 1
+        self._removed += 1
+        if self._removed > len(self._urls) // 2:
+            self._compact()
+        return Website(url, self.customer, enabled)
+
+    def pop(self):
+        """Remove the last website added.
+
+        :return: A detached :class:`~license.models.website.Website` for the
+            removed website or `None` if the index is empty.
+        """
+        if self._shared:
+            self._own(_URLS, _POSITIONS, _FLAGS)
+        while self._urls and self._urls[-1] is None:
+            self._urls.pop()
+            self._flags.pop()
+            self._removed -= 1
+        if not self._urls:
+            return None
+
+        url = self._urls.pop()
+        enabled = bool(self._flags.pop())
+        del self._positions[canonicalize(url)]
+        if enabled:
+            self.enabled_count -= 1
+        return Website(url, self.customer, enabled)
+
+    def disable(self, url):
+        """Disable the website for `url`.
+
+        :param str url: Url of website to disable.
+        :return: `True` if a website was disabled.
+        """
+        position = self._positions.get(canonicalize(url))
+        if position is None or not self._flags[position]:
+            return False
+
+        if self._shared:
+            self._own(_FLAGS)
+        self._flags[position] = 0
+        self.enabled_count -= 1
+        return True
+
+    def is_enabled(self, url):
+        """Return whether the website for `url` exists and is enabled."""
+        position = self._positions.get(canonicalize(url))
+        return position is not None and bool(self._flags[position])
+
+    def enabled_urls(self):
+        """Return urls of enabled websites in insertion order."""
+        return list(compress(self._urls, self._flags))
+
+    def enabled_keys(self):
+        """Return canonical urls of enabled websites."""
+        flags = self._flags
+        return [key for key, position in self._positions.items()
+                if flags[position]]
+
+    def enabled(self):
+        """Return enabled websites in insertion order."""
+        return _LazyWebsites(self, self.enabled_urls())
+
+    def trim_enabled(self, allowance):
+        """Disable enabled websites beyond `allowance`.
+
+        The first `allowance` enabled websites, in insertion order, are kept.
+        A negative allowance is unlimited and nothing is disabled.
+
+        :param int allowance: Number of enabled websites to keep.
+        :return: Sequence of websites disabled.
+        """
+        if allowance < 0 or self.enabled_count <= allowance:
+            return []
+
+        if self._shared:
+            self._own(_FLAGS)
+        flags = self._flags
+        cut = -1
+        for _ in range(allowance + 1):
+            cut = flags.index(_ENABLED, cut + 1)
+        disabled = list(compress(self._urls[cut:], flags[cut:]))
+        flags[cut:] = bytearray(len(flags) - cut)
+        self.enabled_count = allowance
+        return _LazyWebsites(self, disabled)
+
+    def copy(self):
+        """Return a copy of the index in constant time.
+
+        Columns are shared until either index changes them.
+        """
+        index = ColumnarWebsiteIndex(customer=self.customer, owner=self.owner)
+        index.enabled_count = self.enabled_count
+        index._urls = self._urls
+        index._positions = self._positions
+        index._flags = self._flags
+        index._removed = self._removed
+        index._shared = set(_COLUMNS)
+        self._shared = set(_COLUMNS)
+        return index
+
+    def _own(self, *columns):
+        """Copy the `columns` shared with another index."""
+        for column in columns:
+            if column in self._shared:
+                setattr(self, column, _COLUMNS[column](getattr(self, column)))
+                self._shared.discard(column)
+
+    def _set_enabled(self, url, enabled):
+        position = self._positions.get(canonicalize(url))
+        if position is None or bool(self._flags[position]) == bool(enabled):
+            return
+
+        if self._shared:
+            self._own(_FLAGS)
+        self._flags[position] = 1 if enabled else 0
+        self.enabled_count += 1 if enabled else -1
+
+    def _compact(self):
+        """Drop removed websites and renumber positions."""
+        renumbered = []
+        shift = 0
+        for url in self._urls:
+            if url is None:
+                shift += 1
+            renumbered.append(shift)
+        flags = bytearray(
+            flag for url, flag in zip(self._urls, self._flags)
+            if url is not None
+        )
+        self._urls = [url for url in self._urls if url is not None]
+        self._flags = flags
+        self._positions = {key: pos - renumbered[pos]
+                           for key, pos in self._positions.items()}
+        self._removed = 0
+
+    def __str__(self):
+        """Str -> enabled/total websites."""
+        return "{enabled}/{total} websites".format(
+            enabled=self.enabled_count,
+            total=len(self)
+        )
+
+    def __repr__(self):
+        """Repr -> ColumnarWebsiteIndex(enabled/total)."""
+        return "ColumnarWebsiteIndex({index})".format(index=self)
@@ -6,6 +6,8 @@ from __future__ import unicode_literals
 from future.utils import python_2_unicode_compatible
 import logging
 from datetime import datetime, timedelta
+from license import passwords
+from license.models import signals
 from license.models.subscription import Subscription
 from license.exceptions.subscription import SubscriptionExistent
 
@@ -17,23 +19,62 @@ LOG = logging.getLogger(__name__)
 class Customer(object):
     """Client model."""
 
-    def __init__(self, name, email, password, plan=None):
+    __slots__ = (
+        'name',
+        'email',
+        'password',
+        'subscription',
+        'subscription_renewal',
+    )
+
+    def __init__(self, name, email, password, plan=None, encoded=False):
         """Client class to hold subscription types.
 
         :param str name: client's name.
         :param str email: client's email.
-        :param str password: client's password.
+        :param str password: client's plain text password, only its
+            :mod:`license.passwords` encoded form is kept.
         :param str plan: Plan type, one of:
             ['Single', 'Plus', 'Infinite'].
+        :param bool encoded: Whether `password` is encoded already, for
+            customers loaded from storage only.
         """
         self.name = name
         self.email = email
-        self.password = password
+        if encoded:
+            self.password = password
+        else:
+            self.password = passwords.make_password(password)
         self.subscription = None
         self.subscription_renewal = None
         if plan:
             self.subscribe(plan)
 
+    def set_password(self, password):
+        """Encode and set a new password.
+
+        :param str password: Plain text password.
+        :return: self for chain-ability.
+        """
+        self.password = passwords.hasher().encode(password)
+        return self
+
+    def check_password(self, password):
+        """Return whether `password` is the customer's password.
+
+        Passwords encoded with other parameters than the current hasher's
+        are rehashed on success.
+
+        :param str password: Plain text password.
+        """
+        hasher = passwords.hasher()
+        if not hasher.verify(password, self.password):
+            return False
+        if hasher.needs_rehash(self.password):
+            LOG.info("Rehashing password of '%s'", self.email)
+            self.password = hasher.encode(password)
+        return True
+
     def subscribe(self, plan):
         """Subscribe client to a plan.
 
@@ -45,6 +86,8 @@ class Customer(object):
 
         self.subscription = Subscription(plan, self)
         self.subscription_renewal = datetime.utcnow() + timedelta(days=365)
+        if signals.receivers:
+            signals.send(signals.SUBSCRIBE, self, plan)
         return self
 
     def __str__(self):
@@ -1,44 +1,72 @@
 """
 .. module: license.models.plan
     :synopsis: Plan model..
+
+Plans are defined by a :class:`PlanCatalog`, loaded from ``plans.json``
+next to this module unless the ``LICENSE_PLAN_CATALOG`` environment
+variable points to another file. Ranks follow the order of the plans in
+the catalog, so tiers are added or repriced without code changes.
 """
 from __future__ import unicode_literals
 from future.utils import python_2_unicode_compatible
+import io
+import json
 import logging
+import os
 from license.exceptions.plan import (
     PlanTypeError,
     PlanUpgradeError,
-    PlanDowngradeError
+    PlanDowngradeError,
+    PlanCatalogError,
 )
 
 
 LOG = logging.getLogger(__name__)
 
+DEFAULT_CATALOG = os.path.join(os.path.dirname(__file__), 'plans.json')
+
 
 @python_2_unicode_compatible
 class Plan(object):
     """Plan model.
 
-    There are three types of subscriptions: Single, Plus and Infinite.
+    There are three types of subscriptions in the default catalog: Single,
+    Plus and Infinite.
     The 'Single' plan has an allowance of 1.
     The 'Plus' plan has an allowance of 3.
     The 'Infinite' plan has an infinite allowance represented by a -1.
+
+    Plans are immutable flyweights owned by the current catalog:
+    ``Plan(plan_type)`` returns the shared instance for `plan_type` and
+    :meth:`upgrade` and :meth:`downgrade` return the new plan instead of
+    changing this one. :attr:`PLANS`, :attr:`ALLOWANCE` and :attr:`PRICES`
+    mirror the current catalog, in its default currency.
     """
 
     SINGLE = 'Single'
     PLUS = 'Plus'
     INFINITE = 'Infinite'
-    PLANS = [SINGLE, PLUS, INFINITE]
-    ALLOWANCE = {
-        SINGLE: 1,
-        PLUS: 3,
-        INFINITE: -1,
-    }
-    PRICES = {
-        SINGLE: 49.00,
-        PLUS: 99.00,
-        INFINITE: 249.00,
-    }
+    PLANS = []
+    ALLOWANCE = {}
+    PRICES = {}
+    # Canonical plan type strings, so every plan shares the same objects.
+    _PLAN_TYPES = {plan_type: plan_type
+                   for plan_type in (SINGLE, PLUS, INFINITE)}
+
+    __slots__ = ('plan_type', 'rank', 'currency', '_allowance', '_prices')
+
+    def __new__(cls, plan_type, websites=None):
+        """Return the shared plan of `plan_type`.
+
+        :param str plan_type: One of :attr:`PLANS`.
+        :raise: :class:`PlanTypeError` if there is no such plan.
+        """
+        plan = _catalog.get(plan_type)
+        if plan is None:
+            raise PlanTypeError(
+                "Plan type '%s' does not exists." % (plan_type,)
+            )
+        return plan
 
     def __init__(self, plan_type, websites=None):
         """Plan model.
@@ -46,100 +74,85 @@ class Plan(object):
         :param str subscription_type: one of 'Single', 'Plus' or 'Infinite'.
         :param str webstie: Websites attached to the subscription.
         """
-        if plan_type not in self.PLANS:
-            raise PlanTypeError(
-                "Plan type '{plan_type}' does not exists.".format(
-                    plan_type=plan_type
-                )
-            )
-        self.plan_type = plan_type
+        pass
+
+    @classmethod
+    def _create(cls, plan_type, rank, allowance, prices, currency):
+        """Build a catalog plan, bypassing the flyweight lookup."""
+        plan = object.__new__(cls)
+        set_attribute = super(Plan, plan).__setattr__
+        set_attribute('plan_type',
+                      cls._PLAN_TYPES.setdefault(plan_type, plan_type))
+        set_attribute('rank', rank)
+        set_attribute('currency', currency)
+        set_attribute('_allowance', allowance)
+        set_attribute('_prices', prices)
+        return plan
+
+    def __setattr__(self, name, value):
+        """Plans are shared, so they cannot be changed."""
+        raise AttributeError("Plan objects are immutable.")
+
+    def __reduce__(self):
+        """Unpickle to the shared plan of the receiving process."""
+        return Plan, (self.plan_type,)
 
     def allowance(self):
         """Return a plan's allowance."""
-        return self.ALLOWANCE.get(self.plan_type, -1)
+        return self._allowance
+
+    def price(self, currency=None):
+        """Return a plan's price.
+
+        :param str currency: Currency code, the catalog's default currency
+            if not given.
+        :raise: :class:`KeyError` if the plan has no price in `currency`.
+        """
+        return self._prices[currency or self.currency]
 
-    def price(self):
-        """Return a plan's price."""
-        return self.PRICES[self.plan_type]
+    def prices(self):
+        """Return a dict of currency -> price."""
+        return dict(self._prices)
 
     def upgrade(self, new_plan):
         """Upgrade plan.
 
         :param str new_plan: One of :attr:`PLANS`
-        :return: self for chain-ability
+        :return: The plan of `new_plan`.
         :raise: :class:`PlanUpgradeError` if there's an error while upgrading.
         """
-        current_plan_weight = self.PLANS.index(self.plan_type)
-        try:
-            new_plan_weight = self.PLANS.index(new_plan)
-        except ValueError:
-            LOG.exception(
-                "Error upgrading plan from '{plan}' to '{new_plan}'".format(
-                    plan=self.plan_type,
-                    new_plan=new_plan
-                )
+        transition = plan_transition(self.plan_type, new_plan)
+        if transition is None or transition == DOWNGRADE:
+            LOG.info(
+                "Error upgrading plan from '%s' to '%s'",
+                self.plan_type,
+                new_plan
             )
             raise PlanUpgradeError(
-                "'{plan}' cannot be upgraded to '{new_plan}'".format(
-                    plan=self.plan_type,
-                    new_plan=new_plan
-                )
-            )
-        if current_plan_weight > new_plan_weight:
-            LOG.exception(
-                "Error upgrading plan from '{plan}' to '{new_plan}'".format(
-                    plan=self.plan_type,
-                    new_plan=new_plan
-                )
+                "'%s' cannot be upgraded to '%s'" % (self.plan_type, new_plan)
             )
-            raise PlanUpgradeError(
-                "'{plan}' cannot be upgraded to '{new_plan}'".format(
-                    plan=self.plan_type,
-                    new_plan=new_plan
-                )
-            )
-        self.plan_type = new_plan
-        return self
+        return _catalog[new_plan]
 
     def downgrade(self, new_plan):
         """Downgrade plan.
 
         :param str new_plan: One of :attr:`PLANS`
-        :return: self for chain-ability
+        :return: The plan of `new_plan`.
         :raise: :class:`PlanDowngradeError` if there's an error while
             upgrading.
         """
-        current_plan_weight = self.PLANS.index(self.plan_type)
-        try:
-            new_plan_weight = self.PLANS.index(new_plan)
-        except ValueError:
-            LOG.exception(
-                "Error downgrading plan from '{plan}' to '{new_plan}'".format(
-                    plan=self.plan_type,
-                    new_plan=new_plan
-                )
+        transition = plan_transition(self.plan_type, new_plan)
+        if transition is None or transition == UPGRADE:
+            LOG.info(
+                "Error downgrading plan from '%s' to '%s'",
+                self.plan_type,
+                new_plan
             )
             raise PlanDowngradeError(
-                "'{plan}' cannot be downgraded to '{new_plan}'".format(
-                    plan=self.plan_type,
-                    new_plan=new_plan
-                )
+                "'%s' cannot be downgraded to '%s'" %
+                (self.plan_type, new_plan)
             )
-        if current_plan_weight < new_plan_weight:
-            LOG.exception(
-                "Error downgrading plan from '{plan}' to '{new_plan}'".format(
-                    plan=self.plan_type,
-                    new_plan=new_plan
-                )
-            )
-            raise PlanDowngradeError(
-                "'{plan}' cannot be downgraded to '{new_plan}'".format(
-                    plan=self.plan_type,
-                    new_plan=new_plan
-                )
-            )
-        self.plan_type = new_plan
-        return self
+        return _catalog[new_plan]
 
     def __str__(self):
         """Str -> Plan Type (Price): Allowance."""
@@ -154,3 +167,172 @@ class Plan(object):
         return "Plan({plan_type})""".format(
             plan_type=self.plan_type
         )
+
+
+class PlanCatalog(object):
+    """Immutable, indexed set of plans.
+
+    Built from a configuration dict::
+
+        {
+            "currency": "USD",
+            "plans": [
+                {"name": "Single", "allowance": 1,
+                 "prices": {"USD": 49.0, "EUR": 45.0}},
+                ...
+            ]
+        }
+
+    Plans are ranked in the order they are listed, cheapest first, and
+    every plan needs a price in the default currency.
+    """
+
+    def __init__(self, config):
+        """Plan catalog.
+
+        :param dict config: Catalog configuration.
+        :raise: :class:`PlanCatalogError` if `config` is not valid.
+        """
+        try:
+            currency = config['currency']
+            specs = config['plans']
+            plans = []
+            for rank, spec in enumerate(specs):
+                prices = dict(spec['prices'])
+                allowance = spec['allowance']
+                if (isinstance(allowance, bool) or
+                        not isinstance(allowance, int) or
+                        allowance == 0 or allowance < -1):
+                    raise PlanCatalogError(
+                        "Plan '%s' allowance must be a positive integer or "
+                        "-1." % (spec['name'],)
+                    )
+                if currency not in prices:
+                    raise PlanCatalogError(
+                        "Plan '%s' has no '%s' price." %
+                        (spec['name'], currency)
+                    )
+                plans.append(Plan._create(spec['name'], rank, allowance,
+                                          prices, currency))
+        except (KeyError, TypeError, AttributeError) as error:
+            raise PlanCatalogError("Invalid plan catalog: %r" % (error,))
+
+        self.config = config
+        self.currency = currency
+        self._plans = tuple(plans)
+        self._by_type = {plan.plan_type: plan for plan in plans}
+        if len(self._by_type) != len(plans):
+            raise PlanCatalogError("Plan names must be unique.")
+        if not plans:
+            raise PlanCatalogError("A catalog needs at least one plan.")
+        #: Plan type -> rank.
+        self.ranks = {plan.plan_type: plan.rank for plan in plans}
+        #: (current plan type, new plan type) -> transition.
+        self.transitions = {
+            (current.plan_type, new.plan_type): (
+                UPGRADE if new.rank > current.rank else
+                DOWNGRADE if new.rank < current.rank else
+                UNCHANGED
+            )
+            for current in plans
+            for new in plans
+        }
+
+    @classmethod
+    def load(cls, path):
+        """Load a catalog from the JSON file `path`."""
+        with io.open(path, encoding='utf-8') as config:
+            try:
+                return cls(json.load(config))
+            except ValueError as error:
+                raise PlanCatalogError(
+                    "'%s' is not valid JSON: %s" % (path, error))
+
+    def get(self, plan_type, default=None):
+        """Return the plan of `plan_type` or `default`."""
+        return self._by_type.get(plan_type, default)
+
+    def __getitem__(self, plan_type):
+        """Return the plan of `plan_type`.
+
+        :raise: :class:`PlanTypeError` if there is no such plan.
+        """
+        try:
+            return self._by_type[plan_type]
+        except (KeyError, TypeError):
+            raise PlanTypeError(
+                "Plan type '%s' does not exists." % (plan_type,)
+            )
+
+    def __contains__(self, plan_type):
+        """Whether `plan_type` is in the catalog."""
+        return plan_type in self._by_type
+
+    def __iter__(self):
+        """Iterate over plans, cheapest first."""
+        return iter(self._plans)
+
+    def __len__(self):
+        """Number of plans."""
+        return len(self._plans)
+
+    def plan_types(self):
+        """Return the plan types, cheapest first."""
+        return [plan.plan_type for plan in self._plans]
+
+
+UPGRADE = 'upgrade'
+DOWNGRADE = 'downgrade'
+UNCHANGED = 'unchanged'
+
+#: Plan type -> rank, lower ranks are cheaper plans.
+PLAN_RANKS = {}
+
+#: (current plan type, new plan type) -> one of :data:`UPGRADE`,
+#: :data:`DOWNGRADE` or :data:`UNCHANGED`. Invalid transitions are missing.
+PLAN_TRANSITIONS = {}
+
+_catalog = None
+
+
+def catalog():
+    """Return the current :class:`PlanCatalog`."""
+    return _catalog
+
+
+def use_catalog(new_catalog):
+    """Make `new_catalog` the current catalog.
+
+    Plans and transitions are looked up through the current catalog, which
+    is replaced with a single assignment, so concurrent lookups see either
+    catalog but never a partial one. :attr:`Plan.PLANS`,
+    :attr:`Plan.ALLOWANCE`, :attr:`Plan.PRICES`, :data:`PLAN_RANKS` and
+    :data:`PLAN_TRANSITIONS` are replaced by the new catalog's, not updated
+    in place; names imported from this module keep the previous catalog's.
+    Existing subscriptions keep the plan objects of the previous catalog.
+
+    :param new_catalog: :class:`PlanCatalog`
+    """
+    global _catalog, PLAN_RANKS, PLAN_TRANSITIONS
+    plans = list(new_catalog)
+    Plan.PLANS = [plan.plan_type for plan in plans]
+    Plan.ALLOWANCE = {plan.plan_type: plan.allowance() for plan in plans}
+    Plan.PRICES = {plan.plan_type: plan.price() for plan in plans}
+    PLAN_RANKS = new_catalog.ranks
+    PLAN_TRANSITIONS = new_catalog.transitions
+    _catalog = new_catalog
+
+
+def plan_transition(plan_type, new_plan):
+    """Return the transition from `plan_type` to `new_plan`.
+
+    :param str plan_type: Current plan type.
+    :param str new_plan: New plan type.
+    :return: :data:`UPGRADE`, :data:`DOWNGRADE`, :data:`UNCHANGED` or `None`
+        if `new_plan` is not a valid plan.
+    """
+    return _catalog.transitions.get((plan_type, new_plan))
+
+
+use_catalog(PlanCatalog.load(
+    os.environ.get('LICENSE_PLAN_CATALOG') or DEFAULT_CATALOG))
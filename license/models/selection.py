@@ -0,0 +1,133 @@
+"""
+.. module: license.models.selection
+    :synopsis: Policies choosing the websites kept on downgrades.
+
+A policy gets the urls of the enabled websites of a subscription, in
+insertion order, and the number of them the new plan allows; it returns the
+urls to disable. Selections are deterministic: ties are broken by insertion
+order, older websites first.
+"""
+from __future__ import unicode_literals
+import logging
+from license.models.urls import canonicalize
+
+
+LOG = logging.getLogger(__name__)
+
+
+class SelectionPolicy(object):
+    """Selection policy interface."""
+
+    def select(self, urls, allowance):
+        """Return the urls to disable so at most `allowance` stay enabled.
+
+        :param list urls: Urls of enabled websites in insertion order.
+        :param int allowance: Websites to keep, negative for unlimited.
+        :return: List of urls to disable, in insertion order.
+        """
+        if allowance < 0 or len(urls) <= allowance:
+            return []
+        kept = set(self.keep(urls, allowance))
+        return [url for position, url in enumerate(urls)
+                if position not in kept]
+
+    def keep(self, urls, allowance):
+        """Return the positions in `urls` of the websites to keep.
+
+        :param list urls: Urls of enabled websites in insertion order.
+        :param int allowance: Websites to keep, at most ``len(urls)``.
+        :return: Iterable of `allowance` positions.
+        """
+        raise NotImplementedError()
+
+
+class KeepOldest(SelectionPolicy):
+    """Keep the websites added first.
+
+    Same selection as :meth:`Subscription.update_plan
+    <license.models.subscription.Subscription.update_plan>` without a
+    policy.
+    """
+
+    def select(self, urls, allowance):
+        """Return the urls after the first `allowance` ones."""
+        if allowance < 0:
+            return []
+        return list(urls[allowance:])
+
+    def keep(self, urls, allowance):
+        """Return the first `allowance` positions."""
+        return range(allowance)
+
+
+class KeepRecentlyUsed(SelectionPolicy):
+    """Keep the most recently used websites.
+
+    Websites never used are kept last, oldest first.
+    """
+
+    def __init__(self, last_used):
+        """Most recently used selection.
+
+        :param dict last_used: Canonical url -> time of last use, any
+            comparable value such as a timestamp.
+        """
+        self.last_used = last_used
+
+    def keep(self, urls, allowance):
+        """Return the positions of the `allowance` most recently used
+        websites."""
+        last_used = self.last_used
+        used = []
+        unused = []
+        times = {}
+        for position, url in enumerate(urls):
+            used_at = last_used.get(canonicalize(url))
+            if used_at is None:
+                unused.append(position)
+            else:
+                times[position] = used_at
+                used.append(position)
+        # Sorts are stable, even reversed: ties keep insertion order.
+        used.sort(key=times.__getitem__, reverse=True)
+        return (used + unused)[:allowance]
+
+
+class KeepPinned(SelectionPolicy):
+    """Keep the websites pinned by the customer.
+
+    Pinned websites are kept first, oldest first if there are more than
+    the allowance; the remaining slots are filled by another policy.
+    """
+
+    def __init__(self, pinned, then=None):
+        """Pinned selection.
+
+        :param pinned: Urls pinned by the customer.
+        :param then: :class:`SelectionPolicy` choosing among websites not
+            pinned, :class:`KeepOldest` by default.
+        """
+        self.pinned = frozenset(canonicalize(url) for url in pinned)
+        self.then = then or KeepOldest()
+
+    def keep(self, urls, allowance):
+        """Return the positions of pinned websites, then of those chosen by
+        :attr:`then`."""
+        pinned = []
+        others = []
+        for position, url in enumerate(urls):
+            if canonicalize(url) in self.pinned:
+                pinned.append(position)
+            else:
+                others.append(position)
+        kept = pinned[:allowance]
+        slots = min(allowance - len(kept), len(others))
+        if slots > 0:
+            rest = [urls[position] for position in others]
+            kept.extend(others[position]
+                        for position in self.then.keep(rest, slots))
+        return kept
+
+
+#: Default policy.
+KEEP_OLDEST = KeepOldest()
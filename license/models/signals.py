@@ -0,0 +1,40 @@
+"""
+.. module: license.models.signals
+    :synopsis: Notifications of model mutations.
+
+Receivers are called after a mutation has been applied, with the event
+name, the object that changed (the customer for :data:`SUBSCRIBE`, the
+subscription otherwise) and the event's value (plan type or url).
+Mutations that change nothing send nothing.
+"""
+from __future__ import unicode_literals
+
+
+SUBSCRIBE = 'subscribe'
+ADD_WEBSITE = 'add_website'
+DISABLE_WEBSITE = 'disable_website'
+REMOVE_WEBSITE = 'remove_website'
+UPDATE_PLAN = 'update_plan'
+CHANGE_PLAN = 'change_plan'
+
+#: Connected receivers; models only call :func:`send` when it is not empty,
+#: so mutations cost nothing extra while nobody listens.
+receivers = []
+
+
+def connect(receiver):
+    """Connect `receiver(event, instance, value)` to every mutation."""
+    if receiver not in receivers:
+        receivers.append(receiver)
+
+
+def disconnect(receiver):
+    """Disconnect `receiver`, if connected."""
+    if receiver in receivers:
+        receivers.remove(receiver)
+
+
+def send(event, instance, value):
+    """Notify every receiver of `event`."""
+    for receiver in list(receivers):
+        receiver(event, instance, value)
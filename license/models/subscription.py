@@ -5,39 +5,179 @@
 from __future__ import unicode_literals
 from future.utils import python_2_unicode_compatible
 import logging
-from license.models.plan import Plan
+import threading
+from collections import OrderedDict
+from license.models import signals
+from license.models.plan import Plan, UPGRADE, plan_transition
+from license.models.selection import KEEP_OLDEST
+from license.models.urls import canonicalize
 from license.models.website import Website
+from license.models.website_index import WebsiteIndex
+from license.models.columnar import ColumnarWebsiteIndex
 from license.exceptions.subscription import (
     SubscriptionWebsiteLimitReached,
     SubscriptionPlanNotValid
 )
-from license.exceptions.plan import (
-    PlanUpgradeError,
-    PlanDowngradeError
-)
 
 
 LOG = logging.getLogger(__name__)
 
 
+class _NullLock(object):
+    """Lock doing nothing, used when thread safety is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_LOCK = _NullLock()
+
+
 @python_2_unicode_compatible
 class Subscription(object):
     """Subscription model.
 
     This model will hold the plan type and the websites attached to a client
+
+    Bulk operations (:meth:`add_websites`, :meth:`disable_websites` and
+    :meth:`remove_websites`) return a report mapping each url to one of the
+    result constants below instead of raising on the first failure.
+
+    Websites are kept in a :class:`WebsiteIndex` which is swapped for a
+    :class:`ColumnarWebsiteIndex` once the subscription holds more than
+    :attr:`COLUMNAR_THRESHOLD` websites.
+
+    Subscriptions are not thread safe unless created with `thread_safe`
+    (defaults to :attr:`THREAD_SAFE`): every operation then runs under a
+    per-subscription lock, so concurrent :meth:`add_website` calls cannot
+    both pass the allowance check.
+
+    Effective changes are announced through :mod:`license.models.signals`.
+
+    When :attr:`QUOTA` is set, allowance checks reserve slots in that
+    shared :class:`~license.storage.quota.Quota`, keyed by the customer's
+    email, and disabled or removed websites release them. Allowance is then
+    enforced across every process sharing the quota. Reservations count at
+    least the local enabled websites, so subscriptions loaded from storage
+    seed the quota on their first check.
+
+    :meth:`snapshot` returns a :class:`SubscriptionSnapshot` sharing the
+    website index; the subscription copies the index before its next
+    change, so readers of the snapshot never see it change.
+
+    Downgrades can be enforced later: :meth:`change_plan` only changes the
+    plan and :meth:`enforce_allowance` disables the websites chosen by
+    :meth:`excess_websites`, possibly in several batches, see
+    :class:`~license.services.enforcement.EnforcementWorker`.
     """
 
-    def __init__(self, plan, user):
-        """Subscription class."""
+    ADDED = 'added'
+    EXISTS = 'exists'
+    LIMIT_REACHED = 'limit_reached'
+    DISABLED = 'disabled'
+    REMOVED = 'removed'
+    UNCHANGED = 'unchanged'
+    NOT_FOUND = 'not_found'
+    COLUMNAR_THRESHOLD = 10000
+    THREAD_SAFE = False
+    QUOTA = None
+
+    __slots__ = (
+        'plan',
+        'user',
+        '_websites',
+        '_lock',
+        '_version',
+        '_entitlements',
+        '_shared',
+    )
+
+    def __init__(self, plan, user, thread_safe=None):
+        """Subscription class.
+
+        :param str plan: Plan type.
+        :param user: Customer owning the subscription.
+        :param bool thread_safe: Whether to lock every operation,
+            :attr:`THREAD_SAFE` by default.
+        """
         self.plan = Plan(plan)
         self.user = user
-        self._websites = []
+        self._websites = WebsiteIndex()
+        if thread_safe is None:
+            thread_safe = self.THREAD_SAFE
+        self._lock = threading.RLock() if thread_safe else _NULL_LOCK
+        self._version = 0
+        self._entitlements = None
+        self._shared = False
+
+    @property
+    def thread_safe(self):
+        """Whether operations run under a lock."""
+        return self._lock is not _NULL_LOCK
+
+    @property
+    def version(self):
+        """Counter increased every time the subscription changes."""
+        return self._version
+
+    def is_licensed(self, url):
+        """Return whether `url` is an enabled website of the subscription.
+
+        :param str url: Website's url.
+        """
+        with self._lock:
+            return self._websites.is_enabled(url)
+
+    def entitlements(self):
+        """Return the canonical urls of enabled websites as a
+        :class:`frozenset`.
+
+        The set is cached until the subscription changes. Urls must go
+        through :func:`~license.models.urls.canonicalize` before being
+        looked up in it.
+        """
+        with self._lock:
+            if self._entitlements is None:
+                self._entitlements = frozenset(self._websites.enabled_keys())
+            return self._entitlements
+
+    def snapshot(self):
+        """Return a point-in-time, read-only view of the subscription.
+
+        Taking a snapshot is constant time: the website index is shared
+        with the snapshot and only copied by the next change of the
+        subscription.
+
+        :return: :class:`SubscriptionSnapshot`
+        """
+        with self._lock:
+            self._shared = True
+            return SubscriptionSnapshot(self.plan, self.user, self._version,
+                                        self._websites, self._entitlements)
+
+    def websites(self):
+        """Return an iterator over all websites, in insertion order.
+
+        Thread safe subscriptions iterate over a copy taken under the lock.
+        """
+        with self._lock:
+            if self._lock is _NULL_LOCK:
+                return iter(self._websites)
+            return iter(list(self._websites))
+
+    def enabled_count(self):
+        """Return the number of enabled websites."""
+        return self._websites.enabled_count
 
     def enabled_websites(self):
         """Return all enabled websites for this subscription."""
-        return [
-            website for website in self._websites if website.enabled
-        ]
+        with self._lock:
+            return self._websites.enabled()
 
     def add_website(self, url):
         """Add website to subscription.
@@ -45,26 +185,110 @@ class Subscription(object):
         :param str url: website's url.
         :return: self for chain-ability
         """
-        enabled_websites = self.enabled_websites()
-        count = len(enabled_websites)
-        if self.plan.allowance() > 0 and count >= self.plan.allowance():
-            LOG.exception(
-                "Allowance for plan '{plan}' has been reached".format(
-                    plan=self.plan
-                )
-            )
-            raise SubscriptionWebsiteLimitReached(
-                "Cannot add any more websites to plan '{plan}'".format(
-                    plan=self.plan
+        with self._lock:
+            allowance = self.plan.allowance()
+            quota = self._quota()
+            if quota is None:
+                full = (allowance > 0 and
+                        self._websites.enabled_count >= allowance)
+            elif url in self._websites:
+                return self
+            else:
+                full = not quota.reserve(self.user.email, 1, allowance,
+                                         self._websites.enabled_count)
+            if full:
+                LOG.info("Allowance for plan '%s' has been reached", self.plan)
+                raise SubscriptionWebsiteLimitReached(
+                    "Cannot add any more websites to plan '%s'" % (self.plan,)
                 )
-            )
-        websites = [website for website in self._websites
-                    if website.url == url]
-        if websites:
+            if url in self._websites:
+                return self
+
+            self._own()
+            self._websites.append(Website(url, self.user))
+            self._changed()
+            self._check_backend()
+            if signals.receivers:
+                signals.send(signals.ADD_WEBSITE, self, url)
             return self
 
-        self._websites.append(Website(url, self.user))
-        return self
+    def add_websites(self, urls):
+        """Add several websites to subscription.
+
+        The allowance is evaluated once for the whole batch; websites are
+        added in order until it is used up and the rest are reported as
+        :attr:`LIMIT_REACHED`. Repeated urls are reported once.
+
+        :param list urls: websites' urls.
+        :return: :class:`OrderedDict` of url -> :attr:`ADDED`,
+            :attr:`EXISTS` or :attr:`LIMIT_REACHED`.
+        """
+        with self._lock:
+            report = OrderedDict()
+            added = False
+            allowance = self.plan.allowance()
+            available = None
+            quota = self._quota()
+            if quota is not None:
+                urls = list(urls)
+                new = set(canonicalize(url) for url in urls
+                          if url not in self._websites)
+                available = quota.reserve(self.user.email, len(new),
+                                          allowance,
+                                          self._websites.enabled_count)
+            elif allowance > 0:
+                available = allowance - self._websites.enabled_count
+
+            for url in urls:
+                if url in report:
+                    continue
+                if url in self._websites:
+                    report[url] = self.EXISTS
+                elif available is not None and available <= 0:
+                    report[url] = self.LIMIT_REACHED
+                else:
+                    self._own()
+                    self._websites.append(Website(url, self.user))
+                    report[url] = self.ADDED
+                    added = True
+                    if available is not None:
+                        available -= 1
+
+            if (available is not None and available <= 0 and
+                    LOG.isEnabledFor(logging.INFO)):
+                rejected = sum(1 for result in report.values()
+                               if result == self.LIMIT_REACHED)
+                if rejected:
+                    LOG.info(
+                        "Allowance for plan '%s' reached, %d website(s) not "
+                        "added",
+                        self.plan,
+                        rejected
+                    )
+            if added:
+                self._changed()
+            self._check_backend()
+            if added:
+                self._send(signals.ADD_WEBSITE, report, self.ADDED)
+            return report
+
+    def restore_websites(self, websites):
+        """Restore websites, e.g. when loading from storage.
+
+        Websites are appended as they are, without checking the allowance,
+        so previously disabled websites stay disabled.
+
+        :param websites: Iterable of `(url, enabled)` tuples in insertion
+            order.
+        :return: self for chain-ability
+        """
+        with self._lock:
+            self._own()
+            for url, enabled in websites:
+                self._websites.append(Website(url, self.user, bool(enabled)))
+            self._changed()
+            self._check_backend()
+            return self
 
     def remove_website(self, url=None):
         """Remove a website from subscription.
@@ -73,72 +297,242 @@ class Subscription(object):
 
         :param str url: Url of website to remove.
         """
-        if not len(self._websites):
-            return self
-
-        if url:
-            self._websites = [website for website in self._websites
-                              if website.url != url]
-        else:
-            self._websites.pop()
+        with self._lock:
+            if not len(self._websites):
+                return self
 
-        return self
+            self._own()
+            if url:
+                removed = self._websites.remove(url)
+            else:
+                removed = self._websites.pop()
+            if removed is not None:
+                self._changed()
+                if removed.enabled:
+                    self._release(1)
+                if signals.receivers:
+                    signals.send(signals.REMOVE_WEBSITE, self, removed.url)
+            return self
 
     def disable_website(self, url):
         """Disable a specific website.
 
         :param str url: Url of website to disable.
         """
-        websites = [website for website in self._websites
-                    if website.url == url]
-        if not websites:
+        with self._lock:
+            if self._websites.is_enabled(url):
+                self._own()
+            if self._websites.disable(url):
+                self._changed()
+                self._release(1)
+                if signals.receivers:
+                    signals.send(signals.DISABLE_WEBSITE, self, url)
             return self
 
-        website = websites[0]
-        website.enabled = False
-        return self
+    def disable_websites(self, urls):
+        """Disable several websites.
+
+        :param list urls: Urls of websites to disable.
+        :return: :class:`OrderedDict` of url -> :attr:`DISABLED`,
+            :attr:`UNCHANGED` (already disabled) or :attr:`NOT_FOUND`.
+        """
+        with self._lock:
+            report = OrderedDict()
+            changed = False
+            self._own()
+            for url in urls:
+                if url in report:
+                    continue
+                if self._websites.disable(url):
+                    report[url] = self.DISABLED
+                    changed = True
+                elif url in self._websites:
+                    report[url] = self.UNCHANGED
+                else:
+                    report[url] = self.NOT_FOUND
+            if changed:
+                self._changed()
+                self._release(sum(1 for result in report.values()
+                                  if result == self.DISABLED))
+                self._send(signals.DISABLE_WEBSITE, report, self.DISABLED)
+            return report
+
+    def remove_websites(self, urls):
+        """Remove several websites from subscription.
 
-    def update_plan(self, new_plan):
+        :param list urls: Urls of websites to remove.
+        :return: :class:`OrderedDict` of url -> :attr:`REMOVED` or
+            :attr:`NOT_FOUND`.
+        """
+        with self._lock:
+            report = OrderedDict()
+            changed = False
+            released = 0
+            self._own()
+            for url in urls:
+                if url in report:
+                    continue
+                removed = self._websites.remove(url)
+                if removed is not None:
+                    report[url] = self.REMOVED
+                    changed = True
+                    released += 1 if removed.enabled else 0
+                else:
+                    report[url] = self.NOT_FOUND
+            if changed:
+                self._changed()
+                self._release(released)
+                self._send(signals.REMOVE_WEBSITE, report, self.REMOVED)
+            return report
+
+    def update_plan(self, new_plan, policy=None):
         """Update plan.
 
-        This method will upgrade or downgrade the plan.
+        This method will upgrade or downgrade the plan, the transition is
+        looked up in :data:`~license.models.plan.PLAN_TRANSITIONS`. Enabled
+        websites over the new allowance are disabled on downgrades, the
+        oldest ones by default.
+
+        With a `policy`, this is :meth:`change_plan` followed by
+        :meth:`enforce_allowance` on the websites chosen by the policy, and
+        announced as such.
 
         :param str new_plan: New plan name.
+        :param policy: :class:`~license.models.selection.SelectionPolicy`
+            choosing the websites kept on downgrades.
         """
-        upgraded = False
-        downgraded = False
-        try:
-            self.plan.upgrade(new_plan)
-            upgraded = True
-        except PlanUpgradeError:
-            pass
-        try:
-            self.plan.downgrade(new_plan)
-            downgraded = True
-        except PlanDowngradeError:
-            pass
-        if downgraded:
-            enabled_websites = self.enabled_websites()
-            if len(enabled_websites) > self.plan.allowance():
-                for website in enabled_websites[self.plan.allowance():]:
-                    website.enabled = False
+        with self._lock:
+            if policy is not None:
+                self.change_plan(new_plan)
+                self.enforce_allowance(self.excess_websites(policy))
+                return self
+
+            if self._set_plan(new_plan) != UPGRADE:
+                self._own()
+                self._release(len(
+                    self._websites.trim_enabled(self.plan.allowance())))
+            self._changed()
+            if signals.receivers:
+                signals.send(signals.UPDATE_PLAN, self, new_plan)
             return self
-        if upgraded:
+
+    def change_plan(self, new_plan):
+        """Change plan without enforcing its allowance.
+
+        Enabled websites over the allowance of a lower plan stay enabled
+        until disabled with :meth:`enforce_allowance`; no website can be
+        added meanwhile.
+
+        :param str new_plan: New plan name.
+        :return: self for chain-ability
+        """
+        with self._lock:
+            self._set_plan(new_plan)
+            self._changed()
+            if signals.receivers:
+                signals.send(signals.CHANGE_PLAN, self, new_plan)
             return self
 
-        # If we couldn't upgrade or downgrade then we raise an error.
-        LOG.exception(
-            "Error modifying subscription '{subscription}' to '{plan}'".format(
-                subscription=self,
-                plan=new_plan
+    def excess_websites(self, policy=None):
+        """Return the urls of enabled websites over the allowance.
+
+        :param policy: :class:`~license.models.selection.SelectionPolicy`
+            choosing the websites kept, the oldest ones by default.
+        :return: List of urls to disable, in insertion order.
+        """
+        with self._lock:
+            allowance = self.plan.allowance()
+            if allowance < 0 or self._websites.enabled_count <= allowance:
+                return []
+            policy = policy or KEEP_OLDEST
+            return policy.select(self._websites.enabled_urls(), allowance)
+
+    def enforce_allowance(self, urls):
+        """Disable websites of `urls`, in order, while more websites are
+        enabled than the plan allows.
+
+        :param list urls: Urls, usually from :meth:`excess_websites`.
+        :return: List of urls disabled.
+        """
+        with self._lock:
+            allowance = self.plan.allowance()
+            websites = self._websites
+            disabled = []
+            for url in urls:
+                if allowance < 0 or websites.enabled_count <= allowance:
+                    break
+                if not disabled:
+                    self._own()
+                    websites = self._websites
+                if websites.disable(url):
+                    disabled.append(url)
+            if disabled:
+                self._changed()
+                self._release(len(disabled))
+                if signals.receivers:
+                    for url in disabled:
+                        signals.send(signals.DISABLE_WEBSITE, self, url)
+            return disabled
+
+    def _set_plan(self, new_plan):
+        """Upgrade or downgrade the plan.
+
+        :return: The transition, see
+            :func:`~license.models.plan.plan_transition`.
+        :raise: :class:`SubscriptionPlanNotValid`
+        """
+        transition = plan_transition(self.plan.plan_type, new_plan)
+        if transition == UPGRADE:
+            self.plan = self.plan.upgrade(new_plan)
+        elif transition is not None:
+            self.plan = self.plan.downgrade(new_plan)
+        else:
+            # Invalid plans are not in the transitions table.
+            LOG.info(
+                "Error modifying subscription '%s' to '%s'", self, new_plan
             )
-        )
-        raise SubscriptionPlanNotValid(
-            "'{subscription}' cannot be updated to plan '{new_plan}'".format(
-                subscription=self,
-                new_plan=new_plan
+            raise SubscriptionPlanNotValid(
+                "'%s' cannot be updated to plan '%s'" % (self, new_plan)
             )
-        )
+        return transition
+
+    def _quota(self):
+        """Return :attr:`QUOTA` if it applies to this subscription."""
+        if self.user is None:
+            return None
+        return self.QUOTA
+
+    def _release(self, count):
+        """Release `count` slots of :attr:`QUOTA`, if any."""
+        quota = self._quota()
+        if count and quota is not None:
+            quota.release(self.user.email, count)
+
+    def _own(self):
+        """Copy the website index if it is shared with a snapshot."""
+        if self._shared:
+            self._websites = self._websites.copy()
+            self._shared = False
+
+    def _changed(self):
+        """Record a change, invalidating cached entitlements."""
+        self._version += 1
+        self._entitlements = None
+
+    def _send(self, event, report, result):
+        """Send `event` for every url of a bulk `report` with `result`."""
+        if signals.receivers:
+            for url, outcome in report.items():
+                if outcome == result:
+                    signals.send(event, self, url)
+
+    def _check_backend(self):
+        """Switch to a columnar index once above the threshold."""
+        if (len(self._websites) > self.COLUMNAR_THRESHOLD and
+                isinstance(self._websites, WebsiteIndex)):
+            LOG.info("Switching '%s' to a columnar website index", self)
+            self._websites = ColumnarWebsiteIndex(self._websites, self.user,
+                                                  self)
 
     def __str__(self):
         """Str -> Plan: User."""
@@ -153,3 +547,72 @@ class Subscription(object):
             plan=self.plan,
             user=self.user
         )
+
+
+class SubscriptionSnapshot(object):
+    """Immutable, point-in-time view of a :class:`Subscription`.
+
+    Exposes the read methods of a subscription over the plan and website
+    index the subscription had when :meth:`Subscription.snapshot` was
+    called, so reports can iterate it without locks while the subscription
+    keeps changing. Disabling the website views of a columnar snapshot
+    disables them in the subscription, never in the snapshot.
+    """
+
+    __slots__ = ('plan', 'user', 'version', '_websites', '_entitlements')
+
+    def __init__(self, plan, user, version, websites, entitlements=None):
+        """Subscription snapshot.
+
+        :param plan: :class:`~license.models.plan.Plan` of the subscription.
+        :param user: Customer owning the subscription.
+        :param int version: Subscription version.
+        :param websites: Website index, which must not change anymore.
+        :param frozenset entitlements: Entitlements, if already computed.
+        """
+        set_attribute = super(SubscriptionSnapshot, self).__setattr__
+        set_attribute('plan', plan)
+        set_attribute('user', user)
+        set_attribute('version', version)
+        set_attribute('_websites', websites)
+        set_attribute('_entitlements', entitlements)
+
+    def __setattr__(self, name, value):
+        """Snapshots cannot be changed."""
+        raise AttributeError("Subscription snapshots are immutable.")
+
+    def __len__(self):
+        """Number of websites."""
+        return len(self._websites)
+
+    def is_licensed(self, url):
+        """Return whether `url` was an enabled website."""
+        return self._websites.is_enabled(url)
+
+    def entitlements(self):
+        """Return the canonical urls of enabled websites as a
+        :class:`frozenset`."""
+        if self._entitlements is None:
+            super(SubscriptionSnapshot, self).__setattr__(
+                '_entitlements', frozenset(self._websites.enabled_keys()))
+        return self._entitlements
+
+    def websites(self):
+        """Return an iterator over all websites, in insertion order."""
+        return iter(self._websites)
+
+    def enabled_count(self):
+        """Return the number of enabled websites."""
+        return self._websites.enabled_count
+
+    def enabled_websites(self):
+        """Return enabled websites in insertion order."""
+        return self._websites.enabled()
+
+    def __repr__(self):
+        """Repr -> SubscriptionSnapshot(plan, user, version)."""
+        return "SubscriptionSnapshot({plan}, {user}, {version})".format(
+            plan=self.plan,
+            user=self.user,
+            version=self.version
+        )
@@ -0,0 +1,76 @@
+"""
+.. module: license.models.urls
+    :synopsis: Website url canonicalization.
+
+Websites are indexed by the canonical form of their url, so different
+spellings of the same site share one allowance slot::
+
+    >>> canonicalize('http://WWW.Example.com/')
+    'example.com'
+    >>> canonicalize('https://example.com/shop/?page=2#top')
+    'example.com/shop?page=2'
+"""
+from __future__ import unicode_literals
+import logging
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+#: Maximum number of memoized urls.
+MEMO_SIZE = 100000
+
+# url -> canonical form. A plain dict is an order of magnitude faster than
+# :class:`~license.cache.LRUCache` on hits, which is what matters on the
+# hot paths, so it is simply emptied when full.
+_memo = {}
+
+
+def canonicalize(url):
+    """Return the canonical form of `url`.
+
+    The scheme, default ports, user info, a leading ``www.``, trailing dots
+    and slashes and the fragment are dropped, the host is lower cased and
+    IDNA encoded. Paths and queries are kept as they are.
+
+    :param str url: Website url, with or without scheme.
+    """
+    canonical = _memo.get(url)
+    if canonical is None:
+        canonical = _canonicalize(url)
+        if len(_memo) >= MEMO_SIZE:
+            _memo.clear()
+        _memo[url] = canonical
+    return canonical
+
+
+def _canonicalize(url):
+    """Uncached :func:`canonicalize`."""
+    url = url.strip()
+    if '://' not in url:
+        url = 'http://' + url
+    parts = urlsplit(url)
+    host = (parts.hostname or '').rstrip('.')
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        LOG.debug("Cannot IDNA encode host '%s'", host)
+    if host.startswith('www.'):
+        host = host[4:]
+    if ':' in host:
+        host = '[%s]' % (host,)
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        host = '%s:%d' % (host, port)
+    canonical = host + parts.path.rstrip('/')
+    if parts.query:
+        canonical += '?' + parts.query
+    return canonical
@@ -14,6 +14,8 @@ LOG = logging.getLogger(__name__)
 class Website(object):
     """Website model."""
 
+    __slots__ = ('url', 'enabled', 'customer')
+
     def __init__(self, url, customer, enabled=True):
         """Initialize website obj.
 
@@ -0,0 +1,210 @@
+"""
+.. module: license.models.website_index
+    :synopsis: Ordered website index.
+"""
+from __future__ import unicode_literals
+from future.utils import python_2_unicode_compatible
+from collections import OrderedDict
+import logging
+import sys
+from license.models.urls import canonicalize
+from license.models.website import Website
+
+
+LOG = logging.getLogger(__name__)
+
+# Plain dicts keep insertion order from Python 3.7 on and are smaller.
+_OrderedDict = dict if sys.version_info >= (3, 7) else OrderedDict
+
+
+@python_2_unicode_compatible
+class WebsiteIndex(object):
+    """Ordered, url-keyed index of websites.
+
+    Websites are keyed by their canonical url (see
+    :func:`~license.models.urls.canonicalize`), so every spelling of a url
+    finds the same website and duplicates are not indexed twice. Keeps
+    insertion order, which is needed to remove the last website added
+    and to trim enabled websites on downgrades, while making lookups by url
+    constant time. The number of enabled websites is maintained on every
+    mutation so allowance checks do not need to scan the websites.
+
+    .. note:: Websites held in an index should be disabled through the index,
+        otherwise :attr:`enabled_count` will drift.
+
+    :meth:`copy` shares the websites with the copy; each index copies a
+    website the first time it changes it.
+    """
+
+    __slots__ = ('_websites', 'enabled_count', '_owned')
+
+    def __init__(self, websites=None):
+        """Website index.
+
+        :param list websites: Websites to index, in insertion order.
+        """
+        self._websites = _OrderedDict()
+        self.enabled_count = 0
+        # Keys of the websites copied since :meth:`copy`, `None` when every
+        # website belongs to this index.
+        self._owned = None
+        for website in websites or []:
+            self.append(website)
+
+    def __len__(self):
+        """Number of websites in the index."""
+        return len(self._websites)
+
+    def __iter__(self):
+        """Iterate over websites in insertion order."""
+        return iter(self._websites.values())
+
+    def __contains__(self, url):
+        """Return whether a website with `url` is indexed."""
+        return canonicalize(url) in self._websites
+
+    def get(self, url):
+        """Return the website for `url` or `None`."""
+        return self._websites.get(canonicalize(url))
+
+    def append(self, website):
+        """Append a website to the index.
+
+        :param website: :class:`~license.models.website.Website` to add.
+        :return: `True` if added, `False` if the url was already indexed.
+        """
+        key = canonicalize(website.url)
+        if key in self._websites:
+            return False
+
+        self._websites[key] = website
+        if website.enabled:
+            self.enabled_count += 1
+        return True
+
+    def remove(self, url):
+        """Remove the website for `url`.
+
+        :param str url: Url of website to remove.
+        :return: The removed website or `None`.
+        """
+        website = self._websites.pop(canonicalize(url), None)
+        if website is not None and website.enabled:
+            self.enabled_count -= 1
+        return website
+
+    def pop(self):
+        """Remove the last website added.
+
+        :return: The removed website or `None` if the index is empty.
+        """
+        if not self._websites:
+            return None
+
+        _, website = self._websites.popitem()
+        if website.enabled:
+            self.enabled_count -= 1
+        return website
+
+    def disable(self, url):
+        """Disable the website for `url`.
+
+        :param str url: Url of website to disable.
+        :return: `True` if a website was disabled.
+        """
+        key = canonicalize(url)
+        website = self._websites.get(key)
+        if website is None or not website.enabled:
+            return False
+
+        self._own(key, website).enabled = False
+        self.enabled_count -= 1
+        return True
+
+    def is_enabled(self, url):
+        """Return whether the website for `url` exists and is enabled."""
+        website = self._websites.get(canonicalize(url))
+        return website is not None and website.enabled
+
+    def enabled_urls(self):
+        """Return urls of enabled websites in insertion order."""
+        return [
+            website.url for website in self._websites.values()
+            if website.enabled
+        ]
+
+    def enabled_keys(self):
+        """Return canonical urls of enabled websites."""
+        return [
+            key for key, website in self._websites.items() if website.enabled
+        ]
+
+    def enabled(self):
+        """Return enabled websites in insertion order."""
+        return [
+            website for website in self._websites.values() if website.enabled
+        ]
+
+    def trim_enabled(self, allowance):
+        """Disable enabled websites beyond `allowance`.
+
+        The first `allowance` enabled websites, in insertion order, are kept.
+        A negative allowance is unlimited and nothing is disabled.
+
+        :param int allowance: Number of enabled websites to keep.
+        :return: List of websites disabled.
+        """
+        if allowance < 0 or self.enabled_count <= allowance:
+            return []
+
+        trimmed = []
+        kept = 0
+        for key, website in self._websites.items():
+            if not website.enabled:
+                continue
+            if kept < allowance:
+                kept += 1
+                continue
+            trimmed.append((key, website))
+        disabled = []
+        for key, website in trimmed:
+            website = self._own(key, website)
+            website.enabled = False
+            disabled.append(website)
+        self.enabled_count -= len(disabled)
+        return disabled
+
+    def copy(self):
+        """Return a copy of the index in a single C level dict copy.
+
+        Websites are shared until either index changes them.
+        """
+        index = WebsiteIndex()
+        index._websites = _OrderedDict(self._websites)
+        index.enabled_count = self.enabled_count
+        index._owned = set()
+        self._owned = set()
+        return index
+
+    def _own(self, key, website):
+        """Return `website`, copied first if shared with another index."""
+        owned = self._owned
+        if owned is None or key in owned:
+            return website
+        website = Website(website.url, website.customer, website.enabled)
+        self._websites[key] = website
+        owned.add(key)
+        return website
+
+    def __str__(self):
+        """Str -> enabled/total websites."""
+        return "{enabled}/{total} websites".format(
+            enabled=self.enabled_count,
+            total=len(self)
+        )
+
+    def __repr__(self):
+        """Repr -> WebsiteIndex(websites)."""
+        return "WebsiteIndex({websites})".format(
+            websites=list(self._websites.values())
+        )
@@ -0,0 +1,273 @@
+"""
+.. module: license.passwords
+    :synopsis: Password hashing.
+
+Passwords are stored encoded as ``algorithm$parameters$salt$hash``::
+
+    scrypt$16384$8$1$<salt>$<hash>
+    pbkdf2_sha256$260000$<salt>$<hash>
+
+scrypt, which is memory-hard, is used when :mod:`hashlib` provides it and
+PBKDF2-SHA256 otherwise. The parameters are part of the encoded password,
+so changing the cost of the current hasher (see :func:`use_hasher`) only
+affects new hashes; existing ones are upgraded when their owner logs in,
+see :meth:`Customer.check_password
+<license.models.customer.Customer.check_password>`.
+"""
+from __future__ import unicode_literals
+import base64
+import hashlib
+import hmac
+import logging
+import multiprocessing
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+from license.cache import LRUCache
+
+
+LOG = logging.getLogger(__name__)
+
+SCRYPT = 'scrypt'
+PBKDF2 = 'pbkdf2_sha256'
+ALGORITHMS = (SCRYPT, PBKDF2) if hasattr(hashlib, 'scrypt') else (PBKDF2,)
+
+# Number of parameters of each algorithm in the encoded form.
+_PARAMETERS = {SCRYPT: 3, PBKDF2: 1}
+
+
+def _b64encode(data):
+    """Unpadded base64 of `data`."""
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data):
+    """Decode unpadded base64 `data`."""
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+def _bytes(password):
+    """Return `password` as UTF-8 bytes."""
+    if isinstance(password, bytes):
+        return password
+    return password.encode('utf-8')
+
+
+def _split(encoded):
+    """Return ``(algorithm, parameters, salt, hash)`` of `encoded` or
+    `None` if it is not an encoded password."""
+    if not encoded or '$' not in encoded:
+        return None
+    parts = encoded.split('$')
+    count = _PARAMETERS.get(parts[0])
+    if count is None or len(parts) != count + 3:
+        return None
+    try:
+        parameters = tuple(int(value) for value in parts[1:-2])
+    except ValueError:
+        return None
+    return parts[0], parameters, parts[-2], parts[-1]
+
+
+def is_encoded(value):
+    """Return whether `value` is an encoded password, as opposed to a
+    plain text one."""
+    return _split(value) is not None
+
+
+class PasswordHasher(object):
+    """Hashes and verifies passwords.
+
+    Hashing is deliberately slow, so the ``*_async`` methods run it on a
+    pool of threads: the key derivation functions of :mod:`hashlib` release
+    the GIL, so hashing does not block the calling thread and uses every
+    core. The pool is only started on first use.
+
+    Successful verifications can be remembered in a cache keyed by an HMAC
+    of the encoded and plain password under a random per-process key, so
+    repeated logins skip the key derivation. The cache is off by default:
+    it trades the cost of a memory-hard hash for the cost of an HMAC for
+    anyone able to read the process' memory.
+    """
+
+    def __init__(self, algorithm=None, n=2 ** 14, r=8, p=1,
+                 iterations=260000, salt_size=16, workers=None,
+                 cache_size=0):
+        """Password hasher.
+
+        :param str algorithm: :data:`SCRYPT` or :data:`PBKDF2`, the first
+            of :data:`ALGORITHMS` by default.
+        :param int n: scrypt CPU/memory cost, a power of 2.
+        :param int r: scrypt block size.
+        :param int p: scrypt parallelization.
+        :param int iterations: PBKDF2 iterations.
+        :param int salt_size: Salt bytes.
+        :param int workers: Hashing threads, the number of CPUs by default.
+        :param int cache_size: Successful verifications remembered, 0 to
+            disable the cache.
+        :raise: :class:`ValueError` if `algorithm` is not available.
+        """
+        algorithm = algorithm or ALGORITHMS[0]
+        if algorithm not in ALGORITHMS:
+            raise ValueError(
+                "Password algorithm '%s' is not available." % (algorithm,))
+        self.algorithm = algorithm
+        if algorithm == SCRYPT:
+            self.parameters = (n, r, p)
+        else:
+            self.parameters = (iterations,)
+        self.salt_size = salt_size
+        self.workers = workers or multiprocessing.cpu_count()
+        self.hits = 0
+        self._cache = LRUCache(cache_size) if cache_size else None
+        self._cache_key = os.urandom(32)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _derive(self, algorithm, parameters, password, salt):
+        """Run the key derivation function."""
+        if algorithm == SCRYPT:
+            n, r, p = parameters
+            return hashlib.scrypt(
+                _bytes(password), salt=salt, n=n, r=r, p=p,
+                maxmem=129 * r * (n + p) + 2 ** 20, dklen=32)
+        return hashlib.pbkdf2_hmac(
+            'sha256', _bytes(password), salt, parameters[0])
+
+    def encode(self, password, salt=None):
+        """Return `password` encoded with the current parameters.
+
+        :param str password: Plain text password.
+        :param bytes salt: Salt, random by default.
+        """
+        salt = salt or os.urandom(self.salt_size)
+        digest = self._derive(self.algorithm, self.parameters, password, salt)
+        return '$'.join(
+            [self.algorithm] +
+            [str(value) for value in self.parameters] +
+            [_b64encode(salt), _b64encode(digest)]
+        )
+
+    def verify(self, password, encoded):
+        """Return whether `password` matches the `encoded` password.
+
+        :param str password: Plain text password.
+        :param str encoded: Encoded password.
+        """
+        parts = _split(encoded)
+        if parts is None or parts[0] not in ALGORITHMS:
+            return False
+
+        key = None
+        if self._cache is not None:
+            key = hmac.new(self._cache_key,
+                           _bytes(encoded) + b'\0' + _bytes(password),
+                           hashlib.sha256).digest()
+            if self._cache.get(key):
+                self.hits += 1
+                return True
+
+        algorithm, parameters, salt, digest = parts
+        try:
+            salt, digest = _b64decode(salt), _b64decode(digest)
+            derived = self._derive(algorithm, parameters, password, salt)
+        except (TypeError, ValueError) as error:
+            LOG.warning("Cannot verify malformed password hash: %s", error)
+            return False
+        valid = hmac.compare_digest(derived, digest)
+        if valid and key is not None:
+            self._cache.set(key, True)
+        return valid
+
+    def needs_rehash(self, encoded):
+        """Return whether `encoded` uses other parameters than the current
+        ones."""
+        parts = _split(encoded)
+        return parts is None or parts[:2] != (self.algorithm, self.parameters)
+
+    @property
+    def pool(self):
+        """Thread pool running the ``*_async`` methods."""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def encode_async(self, password, callback=None):
+        """Encode `password` on the pool.
+
+        :return: :class:`multiprocessing.pool.AsyncResult` of
+            :meth:`encode`.
+        """
+        return self.pool.apply_async(self.encode, (password,),
+                                     callback=callback)
+
+    def verify_async(self, password, encoded, callback=None):
+        """Verify `password` on the pool.
+
+        :return: :class:`multiprocessing.pool.AsyncResult` of
+            :meth:`verify`.
+        """
+        return self.pool.apply_async(self.verify, (password, encoded),
+                                     callback=callback)
+
+    def encode_many(self, passwords):
+        """Encode several passwords in parallel.
+
+        :param list passwords: Plain text passwords.
+        :return: List of encoded passwords, in the same order.
+        """
+        passwords = list(passwords)
+        if len(passwords) < 2 or self.workers == 1:
+            return [self.encode(password) for password in passwords]
+        return self.pool.map(self.encode, passwords, chunksize=1)
+
+    def stats(self):
+        """Return a dict with the algorithm, parameters and cache hits."""
+        return {
+            'algorithm': self.algorithm,
+            'parameters': list(self.parameters),
+            'workers': self.workers,
+            'cache_hits': self.hits,
+            'cache_size': len(self._cache) if self._cache is not None else 0,
+        }
+
+    def close(self):
+        """Stop the thread pool, if started."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+
+_hasher = PasswordHasher()
+
+
+def hasher():
+    """Return the current :class:`PasswordHasher`."""
+    return _hasher
+
+
+def use_hasher(new_hasher):
+    """Make `new_hasher` the current hasher.
+
+    Passwords encoded with other parameters are rehashed on their next
+    successful check.
+
+    :param new_hasher: :class:`PasswordHasher`
+    :return: The previous hasher.
+    """
+    global _hasher
+    previous, _hasher = _hasher, new_hasher
+    return previous
+
+
+def make_password(password):
+    """Return plain text `password` encoded by the current hasher.
+
+    Passwords are always hashed, even when they look encoded: trusting
+    them would let clients store a hash of their choice, and choose its
+    cost.
+    """
+    return _hasher.encode(password)
@@ -0,0 +1,203 @@
+"""
+.. module: license.services.aio
+    :synopsis: Asyncio facade over the license operations.
+
+Requires Python 3.5+. Repository work is blocking, so every operation runs
+in an executor; the event loop only coordinates requests. License checks
+are answered from an :class:`~license.services.entitlements.EntitlementCache`
+and only reach the repository on a miss.
+"""
+from __future__ import unicode_literals
+import asyncio
+import logging
+import weakref
+from license.models.urls import canonicalize
+from license.services.entitlements import EntitlementCache
+
+
+LOG = logging.getLogger(__name__)
+
+
+class LicenseService(object):
+    """Asyncio license service backed by a repository.
+
+    Identical concurrent lookups (same operation and arguments) share one
+    executor call, concurrency against the repository is bounded by a
+    semaphore and mutations of the same customer are serialized, so each
+    one loads, changes and saves the customer without losing updates.
+
+    License checks use :attr:`entitlements`, which mutations through the
+    service invalidate. Cache misses wait for pending mutations of the
+    customer, so they never cache the state a mutation is replacing.
+    Changes made elsewhere, e.g. by another process, need an explicit
+    ``service.entitlements.invalidate(email)``.
+    """
+
+    def __init__(self, repository, max_concurrency=64, executor=None,
+                 cache_size=10000):
+        """License service.
+
+        :param repository: :class:`~license.storage.repository.Repository`
+            holding the customers. It must be usable from several threads.
+        :param int max_concurrency: Maximum number of operations running in
+            the executor at once.
+        :param executor: :class:`concurrent.futures.Executor` to run
+            repository work in, the loop's default executor when `None`.
+        :param int cache_size: Maximum number of customers whose
+            entitlements are cached.
+        """
+        self.repository = repository
+        self.entitlements = EntitlementCache(repository.get_customer,
+                                             cache_size)
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.calls = 0
+        self.coalesced = 0
+        self._semaphore = None
+        self._inflight = {}
+        self._locks = weakref.WeakValueDictionary()
+
+    async def _run(self, func, *args):
+        """Run `func(*args)` in the executor once a slot is free."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            self.calls += 1
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+
+    async def _coalesce(self, key, func, *args):
+        """Run `func(*args)` unless an identical call is in flight, in which
+        case wait for its result instead.
+
+        Coroutine functions are awaited, other functions run in the
+        executor.
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            if asyncio.iscoroutinefunction(func):
+                future = asyncio.ensure_future(func(*args))
+            else:
+                future = asyncio.ensure_future(self._run(func, *args))
+            self._inflight[key] = future
+            future.add_done_callback(
+                lambda done: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded so a cancelled caller does not cancel the others.
+        return await asyncio.shield(future)
+
+    def _lock(self, email):
+        """Return the lock serializing the changes of customer `email`."""
+        lock = self._locks.get(email)
+        if lock is None:
+            lock = self._locks[email] = asyncio.Lock()
+        return lock
+
+    async def _mutate(self, email, func, *args):
+        """Load customer `email`, apply `func(customer, *args)` and save
+        it, one mutation per customer at a time."""
+        async with self._lock(email):
+            return await self._run(self._apply, email, func, args)
+
+    def _apply(self, email, func, args):
+        """Executor side of :meth:`_mutate`."""
+        customer = self.repository.get_customer(email)
+        result = func(customer, *args)
+        self.repository.save_customer(customer)
+        self.entitlements.invalidate(email)
+        return result
+
+    def _save(self, customer):
+        """Executor side of :meth:`save_customer`."""
+        self.repository.save_customer(customer)
+        self.entitlements.invalidate(customer.email)
+
+    async def _load_entitlements(self, email):
+        """Load the entitlements of customer `email` once its pending
+        mutations are saved."""
+        async with self._lock(email):
+            return await self._run(self.entitlements.entitlements, email)
+
+    async def get_customer(self, email):
+        """Return customer `email`.
+
+        :param str email: Customer's email.
+        :raise: :class:`~license.exceptions.storage.CustomerNotFound`
+        """
+        return await self._coalesce(
+            ('get_customer', email), self.repository.get_customer, email)
+
+    async def is_licensed(self, email, url):
+        """Return whether `url` is licensed for customer `email`.
+
+        :param str email: Customer's email.
+        :param str url: Website's url.
+        """
+        urls = self.entitlements.cached(email)
+        if urls is None:
+            urls = await self._coalesce(
+                ('entitlements', email), self._load_entitlements, email)
+        return canonicalize(url) in urls
+
+    async def save_customer(self, customer):
+        """Save a new or changed customer.
+
+        :param customer: :class:`~license.models.customer.Customer`.
+        :return: The customer.
+        """
+        async with self._lock(customer.email):
+            await self._run(self._save, customer)
+        return customer
+
+    async def subscribe(self, email, plan):
+        """Subscribe customer `email` to `plan`.
+
+        :param str email: Customer's email.
+        :param str plan: Plan type.
+        :return: The subscription.
+        """
+        def subscribe(customer, plan):
+            return customer.subscribe(plan).subscription
+        return await self._mutate(email, subscribe, plan)
+
+    async def add_website(self, email, url):
+        """Add website `url` to the subscription of customer `email`.
+
+        :return: The subscription.
+        """
+        def add_website(customer, url):
+            return customer.subscription.add_website(url)
+        return await self._mutate(email, add_website, url)
+
+    async def disable_website(self, email, url):
+        """Disable website `url` of customer `email`.
+
+        :return: The subscription.
+        """
+        def disable_website(customer, url):
+            return customer.subscription.disable_website(url)
+        return await self._mutate(email, disable_website, url)
+
+    async def update_plan(self, email, plan):
+        """Update the subscription plan of customer `email`.
+
+        :return: The subscription.
+        """
+        def update_plan(customer, plan):
+            return customer.subscription.update_plan(plan)
+        return await self._mutate(email, update_plan, plan)
+
+    def stats(self):
+        """Return a dict with executor calls, coalesced lookups and
+        lookups in flight.
+
+        See :meth:`EntitlementCache.stats
+        <license.services.entitlements.EntitlementCache.stats>` for the
+        license checks answered from the cache.
+        """
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'inflight': len(self._inflight),
+        }
@@ -0,0 +1,162 @@
+"""
+.. module: license.services.analytics
+    :synopsis: Revenue and allowance analytics over the customer base.
+"""
+from __future__ import unicode_literals, division
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from datetime import datetime
+import logging
+from license.models.plan import Plan
+
+
+LOG = logging.getLogger(__name__)
+
+#: Plan code of customers without a subscription.
+NO_PLAN = -1
+
+# array typecodes must be native strings on Python 2.
+_PLAN_CODE, _COUNT, _TIMESTAMP = str('b'), str('l'), str('d')
+_EPOCH = datetime(1970, 1, 1)
+_NO_RENEWAL = float('nan')
+
+
+def _timestamp(value):
+    """Return naive UTC `value` as seconds since the epoch."""
+    return (value - _EPOCH).total_seconds()
+
+
+class CustomerSnapshot(object):
+    """Columnar snapshot of the customer base.
+
+    Holds one row per customer in three :class:`array.array` columns:
+
+    - ``plan_codes``: plan rank, see
+      :data:`~license.models.plan.PLAN_RANKS`, or :data:`NO_PLAN`,
+    - ``enabled``: number of enabled websites,
+    - ``renewals``: renewal date as a UTC timestamp, `nan` if none.
+
+    Aggregations reduce the columns with C level builtins (``Counter`` over
+    ``zip`` of columns, ``sorted``) and then work on the handful of distinct
+    keys, instead of calling :meth:`Plan.price` and :meth:`Plan.allowance`
+    for every customer. Reductions are computed once per snapshot.
+    """
+
+    def __init__(self, plan_codes=None, enabled=None, renewals=None):
+        """Customer snapshot.
+
+        :param plan_codes: Iterable of plan codes.
+        :param enabled: Iterable of enabled website counts.
+        :param renewals: Iterable of renewal timestamps.
+        """
+        self.plan_codes = array(_PLAN_CODE, plan_codes or [])
+        self.enabled = array(_COUNT, enabled or [])
+        self.renewals = array(_TIMESTAMP, renewals or [])
+        self._plan_counts = None
+        self._usage_counts = None
+        self._sorted_renewals = None
+
+    @classmethod
+    def from_customers(cls, customers):
+        """Snapshot `customers`.
+
+        :param customers: Iterable of
+            :class:`~license.models.customer.Customer`.
+        """
+        snapshot = cls()
+        plan_codes = snapshot.plan_codes.append
+        enabled = snapshot.enabled.append
+        renewals = snapshot.renewals.append
+        for customer in customers:
+            subscription = customer.subscription
+            if subscription is None:
+                plan_codes(NO_PLAN)
+                enabled(0)
+            else:
+                plan_codes(subscription.plan.rank)
+                enabled(subscription.enabled_count())
+            renewal = customer.subscription_renewal
+            renewals(_NO_RENEWAL if renewal is None else _timestamp(renewal))
+        return snapshot
+
+    def __len__(self):
+        """Number of customers."""
+        return len(self.plan_codes)
+
+    def plan_mix(self):
+        """Return an :class:`OrderedDict` of plan type -> customers."""
+        if self._plan_counts is None:
+            self._plan_counts = Counter(self.plan_codes)
+        counts = self._plan_counts
+        return OrderedDict(
+            (plan_type, counts[rank])
+            for rank, plan_type in enumerate(Plan.PLANS)
+        )
+
+    def revenue(self):
+        """Return annual and monthly recurring revenue.
+
+        Plan prices are yearly, subscriptions renew every 365 days.
+
+        :return: dict with ``arr`` and ``mrr``.
+        """
+        arr = sum(count * Plan.PRICES[plan_type]
+                  for plan_type, count in self.plan_mix().items())
+        return {'arr': arr, 'mrr': arr / 12}
+
+    def utilisation_histogram(self, bins=(0.25, 0.5, 0.75, 1.0)):
+        """Return the seat utilisation histogram of plans with an allowance.
+
+        Utilisation is enabled websites over allowance. Bucket ``i`` counts
+        customers with utilisation in ``(bins[i - 1], bins[i]]``, the first
+        bucket starts at 0 and an extra last bucket counts customers over
+        ``bins[-1]``.
+
+        :param tuple bins: Sorted bucket upper bounds.
+        :return: List of ``len(bins) + 1`` counts.
+        """
+        histogram = [0] * (len(bins) + 1)
+        for (code, enabled), count in self._usage().items():
+            allowance = self._allowance(code)
+            if allowance <= 0:
+                continue
+            histogram[bisect_left(bins, enabled / allowance)] += count
+        return histogram
+
+    def over_allowance(self):
+        """Return an :class:`OrderedDict` of plan type -> customers with more
+        enabled websites than their allowance."""
+        over = OrderedDict((plan_type, 0) for plan_type in Plan.PLANS)
+        for (code, enabled), count in self._usage().items():
+            allowance = self._allowance(code)
+            if 0 < allowance < enabled:
+                over[Plan.PLANS[code]] += count
+        return over
+
+    def renewals_between(self, start, end):
+        """Return the number of renewals in ``[start, end)``.
+
+        :param datetime start: Lower bound.
+        :param datetime end: Upper bound.
+        """
+        if self._sorted_renewals is None:
+            # nan != nan, which drops customers without a renewal.
+            self._sorted_renewals = sorted(
+                renewal for renewal in self.renewals if renewal == renewal
+            )
+        renewals = self._sorted_renewals
+        return (bisect_left(renewals, _timestamp(end)) -
+                bisect_left(renewals, _timestamp(start)))
+
+    def _usage(self):
+        """Count customers by (plan code, enabled websites)."""
+        if self._usage_counts is None:
+            self._usage_counts = Counter(zip(self.plan_codes, self.enabled))
+        return self._usage_counts
+
+    @staticmethod
+    def _allowance(code):
+        if code == NO_PLAN:
+            return 0
+        return Plan.ALLOWANCE[Plan.PLANS[code]]
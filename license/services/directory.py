@@ -0,0 +1,292 @@
+"""
+.. module: license.services.directory
+    :synopsis: Customer collection indexed by email, plan and renewal date.
+"""
+from __future__ import unicode_literals
+from bisect import bisect_right
+import logging
+from license.models import signals
+
+
+LOG = logging.getLogger(__name__)
+
+# Plan type argument meaning every customer.
+_ALL = object()
+
+
+class _SortedKeys(object):
+    """Sorted list of keys, merged lazily.
+
+    New keys are queued and merged on the next read, so bulk loads cost one
+    sort instead of an insertion each. Keys are never removed eagerly:
+    readers skip those that are no longer current and the list is rebuilt
+    once stale keys outnumber the current ones.
+    """
+
+    __slots__ = ('_keys', '_listed', '_pending', '_is_current')
+
+    def __init__(self, is_current):
+        """Sorted keys.
+
+        :param is_current: Callable returning whether a key still belongs
+            to the index.
+        """
+        self._keys = []
+        self._listed = set()
+        self._pending = []
+        self._is_current = is_current
+
+    def add(self, key):
+        """Add `key`, if not listed already."""
+        if key not in self._listed:
+            self._listed.add(key)
+            self._pending.append(key)
+
+    def take(self, after, limit, stop=None):
+        """Return up to `limit` current keys greater than `after`.
+
+        :param after: Exclusive lower bound, `None` to start at the first
+            key.
+        :param int limit: Maximum number of keys.
+        :param stop: Callable returning whether iteration should stop at a
+            key, which is not returned.
+        """
+        if self._pending:
+            self._pending.sort()
+            self._keys.extend(self._pending)
+            self._keys.sort()
+            self._pending = []
+        keys = self._keys
+        is_current = self._is_current
+        taken = []
+        position = 0 if after is None else bisect_right(keys, after)
+        while position < len(keys) and len(taken) < limit:
+            key = keys[position]
+            position += 1
+            if stop is not None and stop(key):
+                break
+            if is_current(key):
+                taken.append(key)
+        return taken
+
+    def compact(self, current):
+        """Drop stale keys if they outnumber the `current` count."""
+        if len(self._listed) > 2 * current + 64:
+            self.take(None, 0)
+            self._keys = [key for key in self._keys if self._is_current(key)]
+            self._listed = set(self._keys)
+
+
+class CustomerDirectory(object):
+    """In memory collection of customers.
+
+    Customers are hashed by email and by plan type, and kept in a secondary
+    index ordered by renewal date. Listings are paginated with a cursor,
+    the email of the last customer returned, and are streamed by
+    generators one page at a time, so they never copy the whole collection
+    and stay consistent while customers are added or removed.
+
+    Once :meth:`attach` is called, :meth:`Customer.subscribe
+    <license.models.customer.Customer.subscribe>`,
+    :meth:`Subscription.update_plan
+    <license.models.subscription.Subscription.update_plan>` and
+    :meth:`~license.models.subscription.Subscription.change_plan` keep the
+    indexes of customers in the directory up to date; other changes of
+    `subscription_renewal` need a :meth:`reindex`.
+    """
+
+    #: Plan index key of customers without a subscription.
+    UNSUBSCRIBED = None
+
+    def __init__(self, customers=None):
+        """Customer directory.
+
+        :param customers: Customers to add.
+        """
+        self._customers = {}
+        # email -> (plan type, renewal date) the customer is indexed under.
+        self._indexed = {}
+        # plan type -> {email: customer}
+        self._plans = {}
+        self._emails = _SortedKeys(self._customers.__contains__)
+        self._plan_emails = {}
+        self._renewals = _SortedKeys(self._is_renewal)
+        for customer in customers or []:
+            self.add(customer)
+
+    def __len__(self):
+        """Number of customers."""
+        return len(self._customers)
+
+    def __contains__(self, email):
+        """Return whether a customer with `email` is in the directory."""
+        return email in self._customers
+
+    def __iter__(self):
+        """Iterate over customers in email order."""
+        return self.iter_customers()
+
+    def get(self, email, default=None):
+        """Return the customer with `email` or `default`."""
+        return self._customers.get(email, default)
+
+    def add(self, customer):
+        """Add or replace the customer with `customer`'s email.
+
+        :param customer: :class:`~license.models.customer.Customer`.
+        :return: self for chain-ability
+        """
+        self.remove(customer.email)
+        self._customers[customer.email] = customer
+        self._emails.add(customer.email)
+        self._index(customer)
+        return self
+
+    def remove(self, email):
+        """Remove the customer with `email`.
+
+        :param str email: Customer's email.
+        :return: The removed customer or `None`.
+        """
+        customer = self._customers.pop(email, None)
+        if customer is not None:
+            self._unindex(email)
+            self._emails.compact(len(self._customers))
+        return customer
+
+    def reindex(self, customer):
+        """Update the plan and renewal indexes of `customer`.
+
+        :param customer: Customer in the directory.
+        :return: self for chain-ability
+        """
+        if self._customers.get(customer.email) is customer:
+            self._unindex(customer.email)
+            self._index(customer)
+        return self
+
+    def count(self, plan_type):
+        """Return the number of customers on `plan_type`.
+
+        :param str plan_type: Plan type or :attr:`UNSUBSCRIBED`.
+        """
+        return len(self._plans.get(plan_type, ()))
+
+    def page(self, cursor=None, limit=100, plan_type=_ALL):
+        """Return a page of customers in email order.
+
+        :param str cursor: Email of the last customer of the previous page,
+            `None` for the first page.
+        :param int limit: Maximum number of customers.
+        :param str plan_type: Only list customers on `plan_type`, which may
+            be :attr:`UNSUBSCRIBED`. Every customer by default.
+        :return: ``(customers, cursor)``, `cursor` being `None` after the
+            last page.
+        """
+        if plan_type is _ALL:
+            emails = self._emails.take(cursor, limit)
+            customers = self._customers
+        else:
+            index = self._plan_emails.get(plan_type)
+            emails = [] if index is None else index.take(cursor, limit)
+            customers = self._plans.get(plan_type, {})
+        page = [customers[email] for email in emails]
+        next_cursor = emails[-1] if len(emails) == limit else None
+        return page, next_cursor
+
+    def pages(self, cursor=None, limit=100, plan_type=_ALL):
+        """Yield pages of customers in email order, see :meth:`page`."""
+        while True:
+            page, cursor = self.page(cursor, limit, plan_type)
+            if page:
+                yield page
+            if cursor is None:
+                return
+
+    def iter_customers(self, cursor=None, plan_type=_ALL, page_size=1000):
+        """Yield customers in email order, fetched a page at a time.
+
+        :param str cursor: Only yield customers with a greater email.
+        :param str plan_type: Only yield customers on `plan_type`.
+        :param int page_size: Customers fetched per page.
+        """
+        for page in self.pages(cursor, page_size, plan_type):
+            for customer in page:
+                yield customer
+
+    def renewing(self, until, since=None, page_size=1000):
+        """Yield customers renewing between `since` and `until` included,
+        in renewal order.
+
+        :param datetime until: Latest renewal date.
+        :param datetime since: Earliest renewal date, unbounded by default.
+        :param int page_size: Customers fetched per page.
+        """
+        cursor = None if since is None else (since, '')
+
+        def stop(key):
+            return key[0] > until
+
+        while True:
+            keys = self._renewals.take(cursor, page_size, stop)
+            for _, email in keys:
+                yield self._customers[email]
+            if len(keys) < page_size:
+                return
+            cursor = keys[-1]
+
+    def attach(self):
+        """Keep indexes up to date on subscriptions and plan updates.
+
+        :return: self for chain-ability
+        """
+        signals.connect(self._receive)
+        return self
+
+    def detach(self):
+        """Stop following subscriptions and plan updates.
+
+        :return: self for chain-ability
+        """
+        signals.disconnect(self._receive)
+        return self
+
+    def _receive(self, event, instance, value):
+        """Signal receiver."""
+        if event == signals.SUBSCRIBE:
+            self.reindex(instance)
+        elif (event in (signals.UPDATE_PLAN, signals.CHANGE_PLAN) and
+              instance.user is not None):
+            self.reindex(instance.user)
+
+    def _index(self, customer):
+        """Add `customer` to the plan and renewal indexes."""
+        email = customer.email
+        subscription = customer.subscription
+        plan_type = (self.UNSUBSCRIBED if subscription is None
+                     else subscription.plan.plan_type)
+        renewal = customer.subscription_renewal
+        self._indexed[email] = (plan_type, renewal)
+        self._plans.setdefault(plan_type, {})[email] = customer
+        emails = self._plan_emails.get(plan_type)
+        if emails is None:
+            members = self._plans[plan_type]
+            emails = self._plan_emails[plan_type] = _SortedKeys(
+                members.__contains__)
+        emails.add(email)
+        if renewal is not None:
+            self._renewals.add((renewal, email))
+
+    def _unindex(self, email):
+        """Remove `email` from the plan and renewal indexes."""
+        plan_type, _ = self._indexed.pop(email)
+        members = self._plans[plan_type]
+        del members[email]
+        self._plan_emails[plan_type].compact(len(members))
+        self._renewals.compact(len(self._indexed))
+
+    def _is_renewal(self, key):
+        """Return whether renewal index `key` is current."""
+        renewal, email = key
+        indexed = self._indexed.get(email)
+        return indexed is not None and indexed[1] == renewal
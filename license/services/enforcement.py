@@ -0,0 +1,281 @@
+"""
+.. module: license.services.enforcement
+    :synopsis: Downgrades enforced in the background, in batches.
+
+:meth:`Subscription.update_plan
+<license.models.subscription.Subscription.update_plan>` disables the
+websites over a lower allowance before returning, which for large
+subscriptions keeps the customer waiting. :meth:`EnforcementWorker.downgrade`
+commits the plan change at once and leaves the disabling to a background
+thread. The subscription is shared with that thread, so it must be thread
+safe::
+
+    subscription = Subscription(Plan.INFINITE, customer, thread_safe=True)
+    worker = EnforcementWorker(batch_size=500)
+    job = worker.downgrade(subscription, Plan.SINGLE, KeepRecentlyUsed(used))
+    job.progress()  # {'state': 'running', 'total': 9999, ...}
+    job.wait()
+"""
+from __future__ import unicode_literals
+from collections import deque
+import logging
+import threading
+
+
+LOG = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+
+class EnforcementJob(object):
+    """Progress of the enforcement of a downgrade."""
+
+    def __init__(self, subscription, plan_type, urls):
+        """Enforcement job.
+
+        :param subscription: Downgraded subscription.
+        :param str plan_type: New plan type.
+        :param list urls: Urls of the websites to disable, see
+            :meth:`Subscription.excess_websites
+            <license.models.subscription.Subscription.excess_websites>`.
+        """
+        self.subscription = subscription
+        self.plan_type = plan_type
+        self.urls = urls
+        self.total = len(urls)
+        self.disabled = 0
+        self.state = PENDING
+        self.error = None
+        self._position = 0
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        if not urls:
+            self._finish(DONE)
+
+    @property
+    def done(self):
+        """Whether the job is over, whatever its outcome."""
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for the job to be over.
+
+        :param float timeout: Seconds to wait, forever by default.
+        :return: Whether the job is over.
+        """
+        self._finished.wait(timeout)
+        return self.done
+
+    def cancel(self):
+        """Stop the job before its next batch.
+
+        Websites already disabled stay disabled.
+
+        :return: self for chain-ability
+        """
+        self._finish(CANCELLED)
+        return self
+
+    def progress(self):
+        """Return a dict with the plan, state, websites to disable, websites
+        disabled and websites left to check."""
+        return {
+            'plan': self.plan_type,
+            'state': self.state,
+            'total': self.total,
+            'disabled': self.disabled,
+            'remaining': 0 if self.done else self.total - self._position,
+        }
+
+    def step(self, batch_size):
+        """Disable the next batch of websites.
+
+        Websites the customer disabled or removed meanwhile, or a later
+        upgrade, end the job early instead of disabling more than needed.
+
+        :param int batch_size: Websites per batch.
+        :return: Whether websites are left to disable.
+        """
+        with self._lock:
+            if self.done:
+                return False
+            self.state = RUNNING
+        subscription = self.subscription
+        batch = self.urls[self._position:self._position + batch_size]
+        self._position += len(batch)
+        self.disabled += len(subscription.enforce_allowance(batch))
+        allowance = subscription.plan.allowance()
+        if (self._position >= self.total or allowance < 0 or
+                subscription.enabled_count() <= allowance):
+            self._finish(DONE)
+            return False
+        return True
+
+    def _finish(self, state, error=None):
+        """End the job with `state`, unless it is over already."""
+        with self._lock:
+            if self.done:
+                return
+            self.state = state
+            self.error = error
+            self._finished.set()
+
+    def __repr__(self):
+        """Repr -> EnforcementJob(subscription, plan, state)."""
+        return "EnforcementJob({subscription}, {plan}, {state})".format(
+            subscription=self.subscription,
+            plan=self.plan_type,
+            state=self.state
+        )
+
+
+class EnforcementWorker(object):
+    """Enforces downgrades on a background thread.
+
+    :meth:`downgrade` changes the plan and selects the websites to disable
+    before returning, so the plan change is committed and the selection is
+    made on the websites the customer had. The websites are then disabled
+    by a daemon thread in batches of :attr:`batch_size`, each batch taking
+    the subscription's lock once, so other requests interleave with the
+    enforcement. Jobs take turns batch by batch, so a large downgrade does
+    not hold back the others.
+
+    A new downgrade of a subscription cancels its pending job. Only thread
+    safe subscriptions are accepted.
+    """
+
+    def __init__(self, batch_size=500, policy=None):
+        """Enforcement worker.
+
+        :param int batch_size: Websites disabled per batch.
+        :param policy: Default
+            :class:`~license.models.selection.SelectionPolicy`, the oldest
+            websites are kept when `None`.
+        """
+        self.batch_size = batch_size
+        self.policy = policy
+        self.batches = 0
+        self.completed = 0
+        self._queue = deque()
+        # subscription -> latest job
+        self._jobs = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def downgrade(self, subscription, new_plan, policy=None):
+        """Change the plan of `subscription` and queue its enforcement.
+
+        :param subscription: Subscription to update.
+        :param str new_plan: New plan type. Upgrades are applied too and
+            return a job that is already done.
+        :param policy: :class:`~license.models.selection.SelectionPolicy`
+            choosing the websites kept, :attr:`policy` by default.
+        :return: :class:`EnforcementJob`
+        :raise: :class:`SubscriptionPlanNotValid` if `new_plan` is not
+            valid.
+        :raise: ValueError if `subscription` is not thread safe.
+        """
+        _check_thread_safe(subscription)
+        subscription.change_plan(new_plan)
+        urls = subscription.excess_websites(policy or self.policy)
+        return self.submit(EnforcementJob(subscription, new_plan, urls))
+
+    def submit(self, job):
+        """Queue `job`, cancelling the pending job of its subscription.
+
+        :param job: :class:`EnforcementJob`
+        :return: `job`
+        :raise: ValueError if the subscription of `job` is not thread safe.
+        """
+        _check_thread_safe(job.subscription)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Enforcement worker is closed.")
+            previous = self._jobs.pop(job.subscription, None)
+            if previous is not None:
+                previous.cancel()
+            if job.done:
+                return job
+            self._jobs[job.subscription] = job
+            self._queue.append(job)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='license-enforcement')
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+        return job
+
+    def job(self, subscription):
+        """Return the pending job of `subscription` or `None`."""
+        with self._condition:
+            return self._jobs.get(subscription)
+
+    def stats(self):
+        """Return a dict with pending jobs, completed jobs and batches
+        run."""
+        with self._condition:
+            return {
+                'pending': len(self._jobs),
+                'completed': self.completed,
+                'batches': self.batches,
+            }
+
+    def close(self, cancel=False):
+        """Stop the thread once the queued jobs are over.
+
+        :param bool cancel: Cancel queued jobs instead of finishing them.
+        """
+        with self._condition:
+            self._closed = True
+            if cancel:
+                for job in self._queue:
+                    job.cancel()
+            thread = self._thread
+            self._condition.notify()
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        """Thread target, runs one batch of the next queued job at a time."""
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    self._thread = None
+                    return
+                job = self._queue.popleft()
+            ran = not job.done
+            more = False
+            if ran:
+                try:
+                    more = job.step(self.batch_size)
+                except Exception as error:
+                    LOG.exception("Enforcement of '%s' failed",
+                                  job.subscription)
+                    job._finish(FAILED, error)
+            with self._condition:
+                self.batches += 1 if ran else 0
+                if more:
+                    self._queue.append(job)
+                    continue
+                self.completed += 1 if ran else 0
+                if self._jobs.get(job.subscription) is job:
+                    del self._jobs[job.subscription]
+
+
+def _check_thread_safe(subscription):
+    """Raise ValueError if `subscription` is not thread safe.
+
+    Batches run on the worker thread while requests keep changing the
+    subscription, which only its lock makes safe.
+    """
+    if not subscription.thread_safe:
+        raise ValueError(
+            "Subscription '{0}' is not thread safe.".format(subscription))
@@ -0,0 +1,92 @@
+"""
+.. module: license.services.entitlements
+    :synopsis: Process level cache of customer entitlements.
+"""
+from __future__ import unicode_literals
+import logging
+from license.cache import LRUCache
+from license.models.urls import canonicalize
+
+
+LOG = logging.getLogger(__name__)
+
+
+class EntitlementCache(object):
+    """Answers "is url licensed for customer" from a bounded LRU.
+
+    Entries hold the customer, its subscription, the subscription
+    :attr:`~license.models.subscription.Subscription.version` and its
+    entitlements. An entry is only used while the customer keeps the same
+    subscription at the same version, so subscribing or any change made
+    through the subscription (adding, disabling or removing websites,
+    updating the plan) invalidates it on the next lookup. Changes made
+    elsewhere, e.g. by another process, need an explicit :meth:`invalidate`.
+    """
+
+    def __init__(self, loader, maxsize=10000):
+        """Entitlement cache.
+
+        :param loader: Callable returning the customer for an email, e.g.
+            :meth:`~license.storage.repository.Repository.get_customer`.
+        :param int maxsize: Maximum number of cached customers.
+        """
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self._cache = LRUCache(maxsize)
+
+    def entitlements(self, email):
+        """Return the licensed urls of customer `email`.
+
+        :param str email: Customer's email.
+        :return: :class:`frozenset` of canonical urls, empty if the customer
+            has no subscription.
+        """
+        urls = self.cached(email)
+        if urls is not None:
+            return urls
+
+        self.misses += 1
+        customer = self.loader(email)
+        subscription = customer.subscription
+        if subscription is None:
+            entry = (customer, None, None, frozenset())
+        else:
+            entry = (customer, subscription, subscription.version,
+                     subscription.entitlements())
+        self._cache.set(email, entry)
+        return entry[3]
+
+    def cached(self, email):
+        """Return the cached entitlements of customer `email`, `None` if
+        they are not cached or out of date."""
+        entry = self._cache.get(email)
+        if entry is not None:
+            customer, subscription, version, urls = entry
+            if customer.subscription is subscription and (
+                    subscription is None or subscription.version == version):
+                self.hits += 1
+                return urls
+        return None
+
+    def is_licensed(self, email, url):
+        """Return whether `url` is licensed for customer `email`.
+
+        :param str email: Customer's email.
+        :param str url: Website's url.
+        """
+        return canonicalize(url) in self.entitlements(email)
+
+    def invalidate(self, email):
+        """Drop the cached entitlements of customer `email`."""
+        self._cache.pop(email)
+
+    def clear(self):
+        """Drop every cached entitlement."""
+        self._cache.clear()
+
+    def stats(self):
+        """Return a dict with size, maxsize, hits, misses and evictions."""
+        stats = self._cache.stats()
+        stats.update(hits=self.hits, misses=self.misses)
+        return stats
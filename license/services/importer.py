@@ -0,0 +1,284 @@
+"""
+.. module: license.services.importer
+    :synopsis: Streaming bulk import of customers and websites.
+"""
+from __future__ import unicode_literals
+import csv
+import json
+import logging
+from itertools import groupby, islice
+from license import passwords
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.models.subscription import Subscription
+from license.exceptions.storage import CustomerNotFound
+
+
+LOG = logging.getLogger(__name__)
+
+
+class BulkImporter(object):
+    """Imports ``(customer, plan, url)`` rows into a repository.
+
+    Rows are dicts with ``email``, ``name``, ``password``, ``plan`` and
+    ``url`` keys and are read one at a time. Consecutive rows of the same
+    customer form a group: the customer is loaded from the repository (or
+    created), subscribed to the group's plan if needed, and its urls are
+    added through :meth:`Subscription.add_websites`, so plan allowances
+    apply. Rows are imported in batches of `batch_size`, groups larger
+    than a batch being imported a chunk at a time, so memory stays bounded
+    by the batch and not by the input; the passwords of the new customers
+    of a batch are hashed in parallel before it is imported. A customer
+    whose rows may go on in the next batch is kept and saved once its group
+    is over. Rows of a customer should be contiguous; a customer appearing
+    again later is loaded back and completed, which also makes an
+    interrupted import safe to re-run. The emails of the imported customers
+    are kept to count each of them once.
+
+    Passwords are plain text and hashed, unless the importer is created
+    with `encoded_passwords` to migrate customers whose passwords were
+    encoded by :mod:`license.passwords` already; only use it with trusted
+    input, as the encoded form sets the cost of every login.
+
+    Rows that cannot be imported are written to the `rejects` stream as CSV
+    with the input line and one of the reasons below.
+    """
+
+    INVALID_ROW = 'invalid_row'
+    MISSING_EMAIL = 'missing_email'
+    INVALID_PLAN = 'invalid_plan'
+    PLAN_MISMATCH = 'plan_mismatch'
+    NO_SUBSCRIPTION = 'no_subscription'
+    LIMIT_REACHED = Subscription.LIMIT_REACHED
+
+    REJECT_FIELDS = ('line', 'email', 'plan', 'url', 'reason')
+
+    def __init__(self, repository, batch_size=1000,
+                 encoded_passwords=False):
+        """Bulk importer.
+
+        :param repository: :class:`~license.storage.repository.Repository`
+            to import into.
+        :param int batch_size: Rows imported per batch.
+        :param bool encoded_passwords: Whether passwords are encoded
+            already instead of plain text.
+        """
+        self.repository = repository
+        self.batch_size = batch_size
+        self.encoded_passwords = encoded_passwords
+        self._rejects = None
+        self._reset()
+
+    def _reset(self):
+        """Reset the counters."""
+        self.rows = 0
+        self.customers = 0
+        self.added = 0
+        self.existing = 0
+        self.rejected = 0
+        self._imported = set()
+        # (email, customer, changed) of the group the next batch may go on.
+        self._open = None
+
+    def stats(self):
+        """Return a dict with rows, customers, added and existing websites
+        and rejected rows of the last import."""
+        return {
+            'rows': self.rows,
+            'customers': self.customers,
+            'added': self.added,
+            'existing': self.existing,
+            'rejected': self.rejected,
+        }
+
+    def import_csv(self, stream, rejects=None):
+        """Import rows from a CSV `stream` with a header row.
+
+        :param stream: Text file with at least ``email`` and ``url``
+            columns.
+        :param rejects: Text file rejected rows are written to.
+        :return: :meth:`stats` of the import.
+        """
+        reader = csv.DictReader(stream)
+
+        def rows():
+            for row in reader:
+                yield reader.line_num, row
+        return self.import_rows(rows(), rejects)
+
+    def import_jsonl(self, stream, rejects=None):
+        """Import rows from a `stream` holding one JSON object per line.
+
+        :param stream: Text file, blank lines are skipped.
+        :param rejects: Text file rejected rows are written to.
+        :return: :meth:`stats` of the import.
+        """
+        def rows():
+            for line, data in enumerate(stream, 1):
+                if not data.strip():
+                    continue
+                try:
+                    row = json.loads(data)
+                except ValueError:
+                    row = None
+                yield line, row if isinstance(row, dict) else None
+        return self.import_rows(rows(), rejects)
+
+    def import_rows(self, rows, rejects=None):
+        """Import `rows`.
+
+        :param rows: Iterable of ``(line, row)``, `row` being a dict or
+            `None` for unreadable input.
+        :param rejects: Text file rejected rows are written to.
+        :return: :meth:`stats` of the import.
+        """
+        self._reset()
+        self._rejects = None
+        if rejects is not None:
+            self._rejects = csv.writer(rejects)
+            self._rejects.writerow(self.REJECT_FIELDS)
+
+        batch = []
+        size = 0
+        for email, group in groupby(rows, self._email):
+            while True:
+                chunk = list(islice(group, self.batch_size - size))
+                if not chunk:
+                    break
+                batch.append((email, chunk))
+                size += len(chunk)
+                if size >= self.batch_size:
+                    self._import_batch(batch)
+                    batch = []
+                    size = 0
+        if batch:
+            self._import_batch(batch)
+        if self._open is not None:
+            _, customer, changed = self._open
+            self._open = None
+            if changed:
+                self.repository.save_customer(customer)
+        LOG.info("Imported %d rows, %d rejected", self.rows, self.rejected)
+        return self.stats()
+
+    @staticmethod
+    def _email(item):
+        """Group key of a ``(line, row)`` item."""
+        row = item[1]
+        return (row.get('email') or '') if row is not None else ''
+
+    def _reject(self, line, row, reason):
+        """Count and write a rejected row."""
+        self.rejected += 1
+        if self._rejects is not None:
+            row = row or {}
+            self._rejects.writerow([
+                line,
+                row.get('email') or '',
+                row.get('plan') or '',
+                row.get('url') or '',
+                reason,
+            ])
+
+    def _import_batch(self, batch):
+        """Import and save a batch of ``(email, rows)`` groups.
+
+        The customer of the last group is kept for the next batch instead
+        of being saved.
+        """
+        customers = {}
+        pending = {}
+        if self._open is not None:
+            email, customer, changed = self._open
+            self._open = None
+            customers[email] = customer
+            if changed:
+                pending[email] = customer
+        new = []
+        for email, group in batch:
+            valid = self._valid(group) if email else []
+            if not valid or email in customers:
+                continue
+            try:
+                customers[email] = self.repository.get_customer(email)
+            except CustomerNotFound:
+                customers[email] = None
+                new.append((email, valid[0][1]))
+
+        encoded = [row.get('password') or '' for _, row in new]
+        if not self.encoded_passwords:
+            encoded = passwords.hasher().encode_many(encoded)
+        for (email, row), password in zip(new, encoded):
+            customers[email] = Customer(row.get('name') or '', email,
+                                        password, encoded=True)
+
+        for email, group in batch:
+            customer = self._import_group(email, group, customers)
+            if customer is not None:
+                pending[email] = customer
+        email = batch[-1][0]
+        if customers.get(email) is not None:
+            self._open = (email, customers[email], email in pending)
+            pending.pop(email, None)
+        if pending:
+            self.repository.save_customers(pending.values())
+
+    @staticmethod
+    def _valid(group):
+        """Return the rows of `group` with a valid plan, if any."""
+        return [(line, row) for line, row in group
+                if not row.get('plan') or row['plan'] in Plan.PLANS]
+
+    def _import_group(self, email, group, customers):
+        """Import the rows of customer `email`.
+
+        :param dict customers: email -> customer of the batch.
+        :return: The customer to save or `None` if every row was rejected.
+        """
+        self.rows += len(group)
+        if not email:
+            for line, row in group:
+                self._reject(line, row, self.INVALID_ROW if row is None
+                             else self.MISSING_EMAIL)
+            return None
+
+        valid = []
+        for line, row in group:
+            if row.get('plan') and row['plan'] not in Plan.PLANS:
+                self._reject(line, row, self.INVALID_PLAN)
+            else:
+                valid.append((line, row))
+        if not valid:
+            return None
+
+        customer = customers[email]
+        if email not in self._imported:
+            self._imported.add(email)
+            self.customers += 1
+        if customer.subscription is None:
+            plans = [row['plan'] for _, row in valid if row.get('plan')]
+            if plans:
+                customer.subscribe(plans[0])
+
+        subscription = customer.subscription
+        urls = []
+        for line, row in valid:
+            if subscription is None:
+                if row.get('url'):
+                    self._reject(line, row, self.NO_SUBSCRIPTION)
+            elif (row.get('plan') and
+                    row['plan'] != subscription.plan.plan_type):
+                self._reject(line, row, self.PLAN_MISMATCH)
+            elif row.get('url'):
+                urls.append((line, row))
+        if urls:
+            report = subscription.add_websites([row['url'] for _, row in urls])
+            for line, row in urls:
+                if report[row['url']] == Subscription.LIMIT_REACHED:
+                    self._reject(line, row, self.LIMIT_REACHED)
+            for result in report.values():
+                if result == Subscription.ADDED:
+                    self.added += 1
+                elif result == Subscription.EXISTS:
+                    self.existing += 1
+        return customer
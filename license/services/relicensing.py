@@ -0,0 +1,214 @@
+"""
+.. module: license.services.relicensing
+    :synopsis: Batch plan migrations across a process pool.
+"""
+from __future__ import unicode_literals
+import logging
+import multiprocessing
+from license.models.plan import PlanCatalog, catalog, use_catalog
+from license.models.subscription import Subscription
+from license.models.urls import canonicalize
+
+
+LOG = logging.getLogger(__name__)
+
+
+def _init_worker(config):
+    """Mirror the parent's plan catalog in a worker process, so migrations
+    to a catalog loaded at runtime behave the same under spawn as under
+    fork."""
+    use_catalog(PlanCatalog(config))
+
+
+def relicense_shard(shard):
+    """Apply plan updates to a shard of customers.
+
+    Runs in worker processes, so it only deals with plain tuples.
+
+    :param list shard: ``(email, plan_type, new_plan, websites)`` tuples,
+        `websites` being ``(url, enabled)`` tuples in insertion order.
+    :return: ``(unchanged, changed, errors)`` where `unchanged` counts
+        customers left as they were, `changed` is a list of
+        ``(email, new_plan, disabled_urls)`` and `errors` a list of
+        ``(email, message)``.
+    """
+    unchanged = 0
+    changed = []
+    errors = []
+    for email, plan_type, new_plan, websites in shard:
+        try:
+            subscription = Subscription(plan_type, None)
+            subscription.restore_websites(websites)
+            enabled = subscription.entitlements()
+            subscription.update_plan(new_plan)
+            dropped = enabled - subscription.entitlements()
+        except Exception as error:
+            errors.append((email, "%s: %s" % (type(error).__name__, error)))
+            continue
+        disabled = [url for url, _ in websites
+                    if canonicalize(url) in dropped]
+        if disabled or new_plan != plan_type:
+            changed.append((email, new_plan, disabled))
+        else:
+            unchanged += 1
+    return unchanged, changed, errors
+
+
+class RelicensingReport(object):
+    """Merged results of a relicensing run."""
+
+    def __init__(self):
+        """Relicensing report."""
+        self.unchanged = 0
+        self.skipped = 0
+        #: email -> (new plan type, list of disabled urls)
+        self.changed = {}
+        #: email -> error message
+        self.errors = {}
+
+    def merge(self, result):
+        """Merge the result of :func:`relicense_shard`.
+
+        :return: self for chain-ability
+        """
+        unchanged, changed, errors = result
+        self.unchanged += unchanged
+        for email, new_plan, disabled in changed:
+            self.changed[email] = (new_plan, disabled)
+        self.errors.update(errors)
+        return self
+
+    def disabled_count(self):
+        """Return the number of websites disabled."""
+        return sum(len(disabled) for _, disabled in self.changed.values())
+
+    def stats(self):
+        """Return a dict with changed, unchanged, skipped and failed
+        customers and disabled websites."""
+        return {
+            'changed': len(self.changed),
+            'unchanged': self.unchanged,
+            'skipped': self.skipped,
+            'errors': len(self.errors),
+            'disabled': self.disabled_count(),
+        }
+
+
+class RelicensingEngine(object):
+    """Applies :meth:`Subscription.update_plan` to many customers.
+
+    Customers are sent to a :class:`multiprocessing.Pool` in shards of
+    compact tuples, each worker rebuilds the subscriptions of its shard,
+    updates their plan (disabling websites over the new allowance) and
+    returns only what changed. Shard results are merged into a
+    :class:`RelicensingReport`, which is applied back to the customers with
+    :meth:`apply`.
+    """
+
+    def __init__(self, processes=None, shard_size=1000):
+        """Relicensing engine.
+
+        :param int processes: Worker processes, the number of CPUs by
+            default. With 1, shards are processed in this process.
+        :param int shard_size: Customers per shard.
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.shard_size = shard_size
+
+    def shards(self, customers, plans):
+        """Yield shards of customers to migrate.
+
+        :param customers: Iterable of customers.
+        :param plans: New plan type for every customer, or dict of current
+            plan type -> new plan type; other customers are skipped.
+        """
+        shard = []
+        for customer in customers:
+            subscription = customer.subscription
+            if subscription is None:
+                continue
+            plan_type = subscription.plan.plan_type
+            if isinstance(plans, dict):
+                if plan_type not in plans:
+                    continue
+                new_plan = plans[plan_type]
+            else:
+                new_plan = plans
+            shard.append((
+                customer.email,
+                plan_type,
+                new_plan,
+                [(website.url, website.enabled)
+                 for website in subscription.websites()],
+            ))
+            if len(shard) >= self.shard_size:
+                yield shard
+                shard = []
+        if shard:
+            yield shard
+
+    def run(self, customers, plans):
+        """Compute the plan migration of `customers`.
+
+        Customers are not modified, see :meth:`apply`.
+
+        :param customers: Sequence of customers.
+        :param plans: New plan type for every customer, or dict of current
+            plan type -> new plan type.
+        :return: :class:`RelicensingReport`
+        """
+        report = RelicensingReport()
+        shards = self.shards(customers, plans)
+        if self.processes == 1:
+            for shard in shards:
+                report.merge(relicense_shard(shard))
+        else:
+            pool = multiprocessing.Pool(
+                self.processes,
+                initializer=_init_worker,
+                initargs=(catalog().config,),
+            )
+            try:
+                for result in pool.imap_unordered(relicense_shard, shards):
+                    report.merge(result)
+            finally:
+                pool.close()
+                pool.join()
+        report.skipped = len(customers) - (
+            report.unchanged + len(report.changed) + len(report.errors))
+        if report.errors:
+            LOG.info("Relicensing failed for %d customer(s)",
+                     len(report.errors))
+        return report
+
+    @staticmethod
+    def apply(customers, report):
+        """Apply `report` to `customers`.
+
+        Websites disabled by the workers are disabled first, so the plan
+        update that follows has nothing left to trim.
+
+        :param customers: Customers `report` was computed for.
+        :param report: :class:`RelicensingReport`
+        :return: List of customers that changed.
+        """
+        updated = []
+        for customer in customers:
+            change = report.changed.get(customer.email)
+            if change is None:
+                continue
+            new_plan, disabled = change
+            customer.subscription.disable_websites(disabled)
+            customer.subscription.update_plan(new_plan)
+            updated.append(customer)
+        return updated
+
+    def relicense(self, customers, plans):
+        """Compute and apply the plan migration of `customers`.
+
+        :return: :class:`RelicensingReport`
+        """
+        customers = list(customers)
+        report = self.run(customers, plans)
+        self.apply(customers, report)
+        return report
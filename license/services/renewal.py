@@ -0,0 +1,135 @@
+"""
+.. module: license.services.renewal
+    :synopsis: Subscription renewal scheduler.
+"""
+from __future__ import unicode_literals
+from datetime import datetime
+import heapq
+import itertools
+import logging
+
+
+LOG = logging.getLogger(__name__)
+
+# Marks heap entries of customers that were rescheduled or unscheduled.
+_REMOVED = object()
+
+
+class RenewalScheduler(object):
+    """Time-ordered index of customers by `subscription_renewal`.
+
+    Customers are kept in a heap so finding the ``k`` customers due before a
+    given time costs ``O(k log n)`` instead of walking every customer.
+    Rescheduling marks the previous heap entry as removed instead of
+    searching for it; removed entries are dropped when they reach the top
+    of the heap or once they outnumber the scheduled customers.
+    """
+
+    def __init__(self, customers=None):
+        """Renewal scheduler.
+
+        :param customers: Customers to schedule.
+        """
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        for customer in customers or []:
+            self.schedule(customer)
+
+    def __len__(self):
+        """Number of scheduled customers."""
+        return len(self._entries)
+
+    def __contains__(self, customer):
+        """Return whether `customer` is scheduled."""
+        return customer in self._entries
+
+    def schedule(self, customer):
+        """Schedule or reschedule `customer` at its renewal date.
+
+        Customers without a renewal date are unscheduled.
+
+        :param customer: :class:`~license.models.customer.Customer`.
+        :return: self for chain-ability
+        """
+        self.unschedule(customer)
+        renewal = customer.subscription_renewal
+        if renewal is None:
+            return self
+
+        entry = [renewal, next(self._counter), customer]
+        self._entries[customer] = entry
+        heapq.heappush(self._heap, entry)
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [item for item in self._heap
+                          if item[-1] is not _REMOVED]
+            heapq.heapify(self._heap)
+        return self
+
+    def unschedule(self, customer):
+        """Remove `customer` from the scheduler.
+
+        :param customer: :class:`~license.models.customer.Customer`.
+        :return: self for chain-ability
+        """
+        entry = self._entries.pop(customer, None)
+        if entry is not None:
+            entry[-1] = _REMOVED
+        return self
+
+    def next_renewal(self):
+        """Return the earliest scheduled renewal date or `None`."""
+        self._discard_removed()
+        if not self._heap:
+            return None
+        return self._heap[0][0]
+
+    def peek_due(self, until=None):
+        """Return customers due before `until`, without unscheduling them.
+
+        Entries due before `until` form a subtree at the root of the heap,
+        so only those ``k`` entries are visited.
+
+        :param datetime until: Upper bound, `datetime.utcnow()` by default.
+        :return: List of customers ordered by renewal date.
+        """
+        until = until or datetime.utcnow()
+        heap = self._heap
+        due = []
+        pending = [0] if heap else []
+        while pending:
+            index = pending.pop()
+            entry = heap[index]
+            if entry[0] > until:
+                continue
+            if entry[-1] is not _REMOVED:
+                due.append(entry)
+            pending.extend(
+                child for child in (2 * index + 1, 2 * index + 2)
+                if child < len(heap)
+            )
+        due.sort()
+        return [entry[-1] for entry in due]
+
+    def due(self, until=None):
+        """Unschedule and yield customers due before `until`.
+
+        Customers are yielded in renewal order as they are popped, so the
+        billing job can stream them. Rescheduling a yielded customer to a
+        date after `until` is safe while iterating.
+
+        :param datetime until: Upper bound, `datetime.utcnow()` by default.
+        """
+        until = until or datetime.utcnow()
+        while self._heap and self._heap[0][0] <= until:
+            entry = heapq.heappop(self._heap)
+            customer = entry[-1]
+            if customer is _REMOVED:
+                continue
+            del self._entries[customer]
+            yield customer
+
+    def _discard_removed(self):
+        heap = self._heap
+        while heap and heap[0][-1] is _REMOVED:
+            heapq.heappop(heap)
@@ -0,0 +1,423 @@
+"""
+.. module: license.storage.eventlog
+    :synopsis: Append-only log of subscription changes.
+
+A log directory holds at most one current snapshot, ``snapshot-<seq>``,
+covering every event up to sequence number ``seq``, and log segments,
+``events-<seq>.log``, holding the events after it as JSON lines. Snapshots
+are written while customers keep changing, so ``applied-<seq>.json`` maps
+the customers whose snapshot already holds later events to the sequence
+number of the last one. Recovery loads the latest snapshot and replays the
+events after it, except those already applied, so its cost depends on the
+changes since the last checkpoint, not on the data size.
+"""
+from __future__ import unicode_literals
+from datetime import datetime
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+from license.models import signals
+from license.models.customer import Customer
+from license.storage.snapshot import (
+    SnapshotReader,
+    fsync_directory,
+    write_snapshot,
+)
+from license.exceptions.subscription import (
+    SubscriptionExistent,
+    SubscriptionWebsiteLimitReached,
+    SubscriptionPlanNotValid,
+)
+
+
+LOG = logging.getLogger(__name__)
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+SNAPSHOT = 'snapshot-%020d'
+SEGMENT = 'events-%020d.log'
+APPLIED = 'applied-%020d.json'
+_FILE = re.compile(r'^(snapshot|events|applied)-(\d{20})(?:\.log|\.json)?$')
+
+
+class EventLog(object):
+    """Append-only, fsync-batched log of model mutations.
+
+    Creating the log recovers the customers it holds into :attr:`customers`.
+    Once :meth:`attach` is called every mutation announced through
+    :mod:`license.models.signals` is appended, and customers subscribing
+    are added to :attr:`customers`. Appends are flushed to the OS
+    immediately but only fsynced every `sync_every` events or
+    `sync_interval` seconds, so a crash can lose at most that window.
+    Every `checkpoint_every` events the log starts a new segment and a
+    background thread compacts the customers into a new snapshot, so
+    mutations never wait for a snapshot to be written.
+
+    Customers that never subscribe produce no events; they are only
+    persisted by a :meth:`compact` that includes them.
+    """
+
+    def __init__(self, directory, sync_every=100, sync_interval=1.0,
+                 checkpoint_every=100000):
+        """Event log.
+
+        :param str directory: Directory holding the snapshot and segments.
+        :param int sync_every: Events between fsyncs.
+        :param float sync_interval: Seconds between fsyncs.
+        :param int checkpoint_every: Events between automatic compactions,
+            `None` to only compact explicitly.
+        """
+        self.directory = directory
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.checkpoint_every = checkpoint_every
+        #: email -> customer of every recovered or subscribed customer.
+        self.customers = {}
+        self.checkpoint = 0
+        self.seq = 0
+        self.replayed = 0
+        # email -> sequence number of the customer's last event.
+        self._seqs = {}
+        self._unsynced = 0
+        self._synced_at = time.time()
+        self._lock = threading.RLock()
+        self._file = None
+        # Checkpoint waiting for the compaction thread, if any.
+        self._pending = None
+        self._compactor = None
+        self._compaction_lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._recover()
+
+    def _files(self, kind):
+        """Return sorted ``(seq, path)`` of the snapshots or segments."""
+        files = []
+        for name in os.listdir(self.directory):
+            match = _FILE.match(name)
+            if match and match.group(1) == kind:
+                files.append((int(match.group(2)),
+                              os.path.join(self.directory, name)))
+        return sorted(files)
+
+    def _recover(self):
+        """Load the latest snapshot, replay the segments and remove what
+        they supersede."""
+        snapshots = self._files('snapshot')
+        if snapshots:
+            self.checkpoint, path = snapshots[-1]
+            reader = SnapshotReader(path)
+            try:
+                for customer in reader.iter_customers():
+                    self.customers[customer.email] = customer
+            finally:
+                reader.close()
+            self._seqs = self._read_applied(self.checkpoint)
+        self.seq = self.checkpoint
+
+        for _, path in self._files('events'):
+            self._replay_segment(path)
+        LOG.info("Recovered %d customer(s), replayed %d event(s)",
+                 len(self.customers), self.replayed)
+
+        # Appends go to the last segment, which may start after the
+        # snapshot if a compaction did not complete.
+        segments = self._files('events')
+        snapshot = self.checkpoint
+        if segments:
+            self.checkpoint = max(self.checkpoint, segments[-1][0])
+        self._file = io.open(
+            os.path.join(self.directory, SEGMENT % (self.checkpoint,)), 'ab')
+        self._remove_superseded(snapshot)
+
+    def _replay_segment(self, path):
+        """Replay the events of segment `path` after the checkpoint.
+
+        A torn last line, left by a crash in the middle of an append, is
+        truncated.
+        """
+        good = 0
+        with io.open(path, 'rb') as segment:
+            for line in segment:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    event = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                good += len(line)
+                seq = event['seq']
+                if seq <= self.seq:
+                    continue
+                self.seq = seq
+                # Already in the snapshot of the customer.
+                if seq <= self._seqs.get(event['email'], 0):
+                    continue
+                self.apply(self.customers, event)
+                self._seqs[event['email']] = seq
+                self.replayed += 1
+        if good < os.path.getsize(path):
+            LOG.warning("Truncating torn event log '%s' at %d", path, good)
+            with io.open(path, 'r+b') as segment:
+                segment.truncate(good)
+
+    def _read_applied(self, checkpoint):
+        """Return email -> last event already in snapshot `checkpoint`."""
+        path = os.path.join(self.directory, APPLIED % checkpoint)
+        if not os.path.exists(path):
+            return {}
+        with io.open(path, 'rb') as applied:
+            return json.loads(applied.read().decode('utf-8'))
+
+    def _write_applied(self, checkpoint, applied):
+        """Write and fsync the events of `applied` already in snapshot
+        `checkpoint`."""
+        path = os.path.join(self.directory, APPLIED % checkpoint)
+        with io.open(path, 'wb') as output:
+            output.write(json.dumps(applied, sort_keys=True).encode('utf-8'))
+            output.flush()
+            os.fsync(output.fileno())
+
+    def _remove_superseded(self, checkpoint):
+        """Remove snapshots and segments older than snapshot
+        `checkpoint`."""
+        for kind in ('snapshot', 'events', 'applied'):
+            for seq, path in self._files(kind):
+                if seq < checkpoint:
+                    os.remove(path)
+
+    @staticmethod
+    def apply(customers, event):
+        """Apply a logged `event` to `customers`.
+
+        Events are not idempotent, each must be applied once, in order.
+        Events that cannot apply, such as a second subscription, are skipped
+        with a warning.
+
+        :param dict customers: email -> customer.
+        :param dict event: Logged event.
+        """
+        kind, email = event['event'], event['email']
+        customer = customers.get(email)
+        try:
+            if kind == signals.SUBSCRIBE:
+                if customer is None:
+                    customer = Customer(event['name'], email,
+                                        event['password'], encoded=True)
+                    customers[email] = customer
+                customer.subscribe(event['value'])
+                if event.get('renewal'):
+                    customer.subscription_renewal = datetime.strptime(
+                        event['renewal'], DATETIME_FORMAT)
+            elif customer is None or customer.subscription is None:
+                LOG.warning("Skipping %s event of unknown customer '%s'",
+                            kind, email)
+            else:
+                getattr(customer.subscription, kind)(event['value'])
+        except (SubscriptionExistent, SubscriptionWebsiteLimitReached,
+                SubscriptionPlanNotValid):
+            LOG.warning("Skipping %s event of customer '%s' that does not "
+                        "apply", kind, email)
+
+    def attach(self):
+        """Start logging mutations.
+
+        :return: self for chain-ability
+        """
+        signals.connect(self._receive)
+        return self
+
+    def detach(self):
+        """Stop logging mutations.
+
+        :return: self for chain-ability
+        """
+        signals.disconnect(self._receive)
+        return self
+
+    def _receive(self, event, instance, value):
+        """Signal receiver."""
+        if event == signals.SUBSCRIBE:
+            customer = instance
+        else:
+            customer = instance.user
+        email = getattr(customer, 'email', None)
+        if email is None:
+            return
+        record = {'event': event, 'email': email, 'value': value}
+        if event == signals.SUBSCRIBE:
+            renewal = customer.subscription_renewal
+            record.update(
+                name=customer.name,
+                password=customer.password,
+                renewal=renewal.strftime(DATETIME_FORMAT) if renewal else None,
+            )
+        with self._lock:
+            # Compactions must not see the customer before its event.
+            if event == signals.SUBSCRIBE:
+                self.customers[email] = customer
+            self.record(record)
+
+    def record(self, record):
+        """Append `record` with the next sequence number.
+
+        :param dict record: Event with ``event``, ``email`` and ``value``.
+        :return: The event's sequence number.
+        """
+        with self._lock:
+            self.seq += 1
+            record['seq'] = self.seq
+            self._seqs[record['email']] = self.seq
+            line = json.dumps(record, sort_keys=True) + '\n'
+            self._file.write(line.encode('utf-8'))
+            self._file.flush()
+            self._unsynced += 1
+            if (self._unsynced >= self.sync_every or
+                    time.time() - self._synced_at >= self.sync_interval):
+                self.sync()
+            if (self.checkpoint_every and
+                    self.seq - self.checkpoint >= self.checkpoint_every):
+                # Records are appended while the mutated subscription is
+                # locked, snapshotting the others here could deadlock.
+                self._pending = self._rotate()
+                if self._compactor is None:
+                    self._compactor = threading.Thread(
+                        target=self._compact_pending,
+                        name='license-eventlog-compaction')
+                    self._compactor.daemon = True
+                    self._compactor.start()
+            return record['seq']
+
+    def sync(self):
+        """Fsync the current segment."""
+        with self._lock:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._synced_at = time.time()
+
+    def compact(self, customers=None):
+        """Write a snapshot of every customer and start a new segment.
+
+        Subscriptions are read through :meth:`Subscription.snapshot
+        <license.models.subscription.Subscription.snapshot>`, so this must
+        not be called while holding the lock of a subscription.
+
+        :param customers: Customers to snapshot, :attr:`customers` by
+            default.
+        :return: self for chain-ability
+        """
+        with self._lock:
+            checkpoint = self._rotate()
+            if customers is None:
+                customers = list(self.customers.values())
+            else:
+                customers = list(customers)
+                self.customers = dict(
+                    (customer.email, customer) for customer in customers)
+        self._write_checkpoint(checkpoint, customers)
+        return self
+
+    def _rotate(self):
+        """Fsync the current segment and start a new one at the current
+        sequence number, which is returned. Called with the lock held."""
+        self.sync()
+        self.checkpoint = self.seq
+        self._file.close()
+        self._file = io.open(os.path.join(
+            self.directory, SEGMENT % (self.checkpoint,)), 'ab')
+        fsync_directory(self.directory)
+        return self.checkpoint
+
+    def _write_checkpoint(self, checkpoint, customers):
+        """Write the snapshot of `customers` for `checkpoint` and remove
+        what it supersedes.
+
+        Subscriptions are snapshotted one at a time after the segment was
+        rotated, so the snapshot may already hold changes logged after
+        `checkpoint`. The last event of each such customer is written
+        first, so recovery does not apply those changes twice.
+        """
+        with self._compaction_lock:
+            snapshots = self._files('snapshot')
+            if snapshots and snapshots[-1][0] >= checkpoint:
+                return
+            states = [_CustomerState(customer, self._seqs)
+                      for customer in customers]
+            self._write_applied(checkpoint, dict(
+                (state.email, state.seq) for state in states
+                if state.seq > checkpoint))
+            write_snapshot(
+                states, os.path.join(self.directory, SNAPSHOT % checkpoint))
+            with self._lock:
+                self._remove_superseded(checkpoint)
+        LOG.info("Compacted %d customer(s) at event %d",
+                 len(states), checkpoint)
+
+    def _compact_pending(self):
+        """Compaction thread target, writes the latest pending checkpoint
+        until there is none."""
+        while True:
+            with self._lock:
+                checkpoint, self._pending = self._pending, None
+                if checkpoint is None:
+                    self._compactor = None
+                    return
+                customers = list(self.customers.values())
+            try:
+                self._write_checkpoint(checkpoint, customers)
+            except Exception:
+                LOG.exception("Compaction at event %d failed", checkpoint)
+
+    def close(self):
+        """Detach, wait for the compaction thread, fsync and close the
+        log."""
+        self.detach()
+        with self._lock:
+            compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            if self._file is not None and not self._file.closed:
+                self.sync()
+                self._file.close()
+
+
+class _CustomerState(object):
+    """Customer as written to a snapshot, with a point-in-time view of
+    its subscription and the sequence number of the last event it holds."""
+
+    __slots__ = (
+        'name',
+        'email',
+        'password',
+        'subscription_renewal',
+        'subscription',
+        'seq',
+    )
+
+    def __init__(self, customer, seqs):
+        """Customer state.
+
+        Mutations are recorded before the subscription's lock is released,
+        so a snapshot taken while the customer's last event did not change
+        holds exactly the events up to it.
+
+        :param customer: :class:`~license.models.customer.Customer`.
+        :param dict seqs: email -> sequence number of the customer's last
+            event, updated by the log.
+        """
+        self.name = customer.name
+        self.email = customer.email
+        self.password = customer.password
+        self.subscription_renewal = customer.subscription_renewal
+        while True:
+            seq = seqs.get(customer.email, 0)
+            subscription = customer.subscription
+            self.subscription = (None if subscription is None
+                                 else subscription.snapshot())
+            if seqs.get(customer.email, 0) == seq:
+                break
+        self.seq = seq
@@ -0,0 +1,205 @@
+"""
+.. module: license.storage.quota
+    :synopsis: Website allowance quotas shared between processes.
+
+Worker processes each hold their own subscriptions, so their allowance
+checks cannot see websites added by other workers. A quota keeps the number
+of enabled websites of every subscription in one place and reserves slots
+atomically; once set as :attr:`Subscription.QUOTA
+<license.models.subscription.Subscription.QUOTA>` every allowance check
+costs one reservation instead of reloading the subscription.
+
+Slots are counted, not websites: two workers adding the same url to their
+copies of a subscription reserve two slots, until either copy is reloaded
+and saved. Route the changes of a customer to a single worker where that
+matters.
+"""
+from __future__ import unicode_literals
+import logging
+import os
+import sqlite3
+import threading
+
+
+LOG = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota (
+    key TEXT PRIMARY KEY,
+    used INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+SELECT_USED = "SELECT used FROM quota WHERE key = ?"
+# Upserts need SQLite 3.24 or newer.
+SET_USED = (
+    "INSERT INTO quota (key, used) VALUES (?, ?) "
+    "ON CONFLICT (key) DO UPDATE SET used = excluded.used"
+)
+RELEASE = "UPDATE quota SET used = MAX(used - ?, 0) WHERE key = ?"
+
+
+def _granted(used, count, allowance):
+    """Return how many of `count` slots can be reserved.
+
+    :param int used: Slots in use.
+    :param int count: Slots wanted.
+    :param int allowance: Total slots, negative for unlimited.
+    """
+    if allowance < 0:
+        return count
+    return max(0, min(count, allowance - used))
+
+
+class Quota(object):
+    """Quota interface.
+
+    Counts enabled websites per key, the email of the subscription's
+    customer.
+    """
+
+    def reserve(self, key, count, allowance, floor=0):
+        """Atomically reserve up to `count` slots within `allowance`.
+
+        :param str key: Quota key.
+        :param int count: Slots wanted.
+        :param int allowance: Total slots, negative for unlimited; usage is
+            still counted.
+        :param int floor: Slots known to be in use, such as the enabled
+            websites of the calling subscription. Usage is raised to it
+            first, which seeds keys of subscriptions loaded from storage.
+        :return: Number of slots reserved, from 0 to `count`.
+        """
+        raise NotImplementedError()
+
+    def release(self, key, count=1):
+        """Release `count` slots of `key`.
+
+        :return: self for chain-ability
+        """
+        raise NotImplementedError()
+
+    def usage(self, key):
+        """Return the slots in use for `key`."""
+        raise NotImplementedError()
+
+    def reset(self, key, used):
+        """Set the slots in use for `key`, e.g. when seeding the quota from
+        stored subscriptions.
+
+        :return: self for chain-ability
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Release any resource held by the quota."""
+        pass
+
+
+class LocalQuota(Quota):
+    """Quota of a single process, shared by its threads."""
+
+    def __init__(self):
+        """Local quota."""
+        self._used = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key, count, allowance, floor=0):
+        """Atomically reserve up to `count` slots within `allowance`."""
+        with self._lock:
+            used = max(self._used.get(key, 0), floor)
+            reserved = _granted(used, count, allowance)
+            self._used[key] = used + reserved
+            return reserved
+
+    def release(self, key, count=1):
+        """Release `count` slots of `key`."""
+        with self._lock:
+            self._used[key] = max(self._used.get(key, 0) - count, 0)
+        return self
+
+    def usage(self, key):
+        """Return the slots in use for `key`."""
+        return self._used.get(key, 0)
+
+    def reset(self, key, used):
+        """Set the slots in use for `key`."""
+        with self._lock:
+            self._used[key] = used
+        return self
+
+
+class SQLiteQuota(Quota):
+    """Quota kept in a SQLite database shared by every process.
+
+    A reservation is a single ``BEGIN IMMEDIATE`` transaction, so
+    concurrent reservations from other processes wait for it instead of
+    overbooking. Each process opens its own connection on first use, which
+    keeps the quota usable after a fork.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        """SQLite quota.
+
+        :param str path: Database file.
+        :param float timeout: Seconds to wait for other processes' locks.
+        """
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        """Return the connection of the current process."""
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None,
+                check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode = WAL')
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._connection
+
+    def reserve(self, key, count, allowance, floor=0):
+        """Atomically reserve up to `count` slots within `allowance`."""
+        with self._lock:
+            connection = self._connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute(SELECT_USED, (key,)).fetchone()
+                stored = row[0] if row else 0
+                used = max(stored, floor)
+                reserved = _granted(used, count, allowance)
+                if used + reserved != stored:
+                    connection.execute(SET_USED, (key, used + reserved))
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+            return reserved
+
+    def release(self, key, count=1):
+        """Release `count` slots of `key`."""
+        with self._lock:
+            self._connect().execute(RELEASE, (count, key))
+        return self
+
+    def usage(self, key):
+        """Return the slots in use for `key`."""
+        with self._lock:
+            row = self._connect().execute(SELECT_USED, (key,)).fetchone()
+        return row[0] if row else 0
+
+    def reset(self, key, used):
+        """Set the slots in use for `key`."""
+        with self._lock:
+            self._connect().execute(SET_USED, (key, used))
+        return self
+
+    def close(self):
+        """Close the connection of the current process."""
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+            self._pid = None
@@ -0,0 +1,117 @@
+"""
+.. module: license.storage.repository
+    :synopsis: Repository interface for the license models.
+"""
+from __future__ import unicode_literals
+import logging
+from license.exceptions.storage import CustomerNotFound
+
+
+LOG = logging.getLogger(__name__)
+
+
+class Repository(object):
+    """Repository interface.
+
+    A repository persists customers together with their subscription and
+    websites. Customers are identified by email.
+    """
+
+    def save_customer(self, customer):
+        """Save a customer, its subscription and websites.
+
+        :param customer: :class:`~license.models.customer.Customer` to save.
+        :return: self for chain-ability
+        """
+        return self.save_customers([customer])
+
+    def save_customers(self, customers):
+        """Save several customers in one batch.
+
+        :param customers: Iterable of customers.
+        :return: self for chain-ability
+        """
+        raise NotImplementedError()
+
+    def get_customer(self, email, load_subscription=True):
+        """Return the customer with `email`.
+
+        :param str email: Customer's email.
+        :param bool load_subscription: Whether to load the subscription
+            and websites too, see :meth:`load_subscription`.
+        :raise: :class:`CustomerNotFound` if there is no such customer.
+        """
+        raise NotImplementedError()
+
+    def load_subscription(self, customer):
+        """Load the subscription and websites of `customer`.
+
+        :param customer: Customer returned by this repository.
+        :return: The customer.
+        """
+        raise NotImplementedError()
+
+    def iter_customers(self, load_subscriptions=True):
+        """Iterate over every customer.
+
+        :param bool load_subscriptions: Whether to load subscriptions.
+        """
+        raise NotImplementedError()
+
+    def delete_customer(self, email):
+        """Delete the customer with `email`.
+
+        :param str email: Customer's email.
+        :return: self for chain-ability
+        """
+        raise NotImplementedError()
+
+    def __len__(self):
+        """Number of customers."""
+        raise NotImplementedError()
+
+    def close(self):
+        """Release any resource held by the repository."""
+        pass
+
+
+class MemoryRepository(Repository):
+    """Repository keeping customers in memory.
+
+    Customers are stored as they are, so they are not isolated from later
+    changes. Useful for tests and single process tools.
+    """
+
+    def __init__(self):
+        """In-memory repository."""
+        self._customers = {}
+
+    def save_customers(self, customers):
+        """Save several customers in one batch."""
+        for customer in customers:
+            self._customers[customer.email] = customer
+        return self
+
+    def get_customer(self, email, load_subscription=True):
+        """Return the customer with `email`."""
+        try:
+            return self._customers[email]
+        except KeyError:
+            raise CustomerNotFound("Customer '%s' does not exist." % (email,))
+
+    def load_subscription(self, customer):
+        """Subscriptions are always loaded."""
+        return customer
+
+    def iter_customers(self, load_subscriptions=True):
+        """Iterate over every customer."""
+        return iter(list(self._customers.values()))
+
+    def delete_customer(self, email):
+        """Delete the customer with `email`."""
+        self._customers.pop(email, None)
+        return self
+
+    def __len__(self):
+        """Number of customers."""
+        return len(self._customers)
@@ -0,0 +1,327 @@
+"""
+.. module: license.storage.snapshot
+    :synopsis: Compact binary snapshots of customers.
+
+A snapshot is a single little-endian file::
+
+    header     magic, version, counts and section offsets
+    customers  fixed size records, see CUSTOMER
+    websites   one string index per website, grouped by customer
+    enabled    packed enabled bits, one per website
+    offsets    string start offsets, one more than strings
+    strings    UTF-8 string heap, plan types first
+
+Customers point at their first website and website count, strings are
+referenced by index, plans by their position in the leading plan strings
+and renewals are microseconds since the epoch.
+"""
+from __future__ import unicode_literals
+from datetime import datetime, timedelta
+import logging
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.models.subscription import Subscription
+from license.storage.repository import Repository
+from license.exceptions.storage import CustomerNotFound, SnapshotFormatError
+
+
+LOG = logging.getLogger(__name__)
+
+MAGIC = b'LICSNAP\x00'
+VERSION = 1
+
+#: magic, version, plan count, customer count, website count, string count
+#: and offsets of the customers, websites, enabled, offsets and strings
+#: sections.
+HEADER = struct.Struct(str('<8sHHIIIQQQQQ'))
+#: name, email, password, plan code, renewal, first website, websites.
+CUSTOMER = struct.Struct(str('<IIIbqII'))
+WEBSITE = struct.Struct(str('<I'))
+OFFSET = struct.Struct(str('<Q'))
+
+NO_PLAN = -1
+NO_RENEWAL = -2 ** 63
+EPOCH = datetime(1970, 1, 1)
+
+# os.rename does not replace an existing file on Windows.
+_replace = getattr(os, 'replace', os.rename)
+
+
+def _timestamp(value):
+    """Return `value` as microseconds since the epoch."""
+    if value is None:
+        return NO_RENEWAL
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+
+
+def _datetime(value):
+    """Inverse of :func:`_timestamp`."""
+    if value == NO_RENEWAL:
+        return None
+    return EPOCH + timedelta(microseconds=value)
+
+
+def fsync_directory(directory):
+    """Fsync `directory`, so renames in it survive a power loss.
+
+    Directories cannot be opened on Windows, where this does nothing.
+    """
+    try:
+        descriptor = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+class _StringHeap(object):
+    """String table spooled to a temporary file while writing."""
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.offsets = array(str('Q'), [0])
+
+    def add(self, value):
+        """Append `value` and return its index."""
+        data = value.encode('utf-8')
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+        return len(self.offsets) - 2
+
+
+def write_snapshot(customers, path, plans=None):
+    """Write `customers` to a snapshot at `path` in one pass.
+
+    Sections are spooled to temporary files and concatenated once the
+    counts are known, then the snapshot is fsynced and moved to `path` so
+    readers never see a partial file, even after a power loss.
+
+    :param customers: Iterable of customers.
+    :param str path: Snapshot file.
+    :param list plans: Plan types, :attr:`Plan.PLANS` by default.
+    :return: Number of customers written.
+    """
+    plans = list(plans or Plan.PLANS)
+    codes = {plan_type: code for code, plan_type in enumerate(plans)}
+    strings = _StringHeap()
+    for plan_type in plans:
+        strings.add(plan_type)
+
+    records = tempfile.TemporaryFile()
+    websites = tempfile.TemporaryFile()
+    enabled = bytearray()
+    customer_count = 0
+    website_count = 0
+    try:
+        for customer in customers:
+            subscription = customer.subscription
+            first = website_count
+            plan = NO_PLAN
+            if subscription is not None:
+                plan = codes[subscription.plan.plan_type]
+                for website in subscription.websites():
+                    websites.write(WEBSITE.pack(strings.add(website.url)))
+                    if website_count % 8 == 0:
+                        enabled.append(0)
+                    if website.enabled:
+                        enabled[-1] |= 1 << (website_count % 8)
+                    website_count += 1
+            records.write(CUSTOMER.pack(
+                strings.add(customer.name),
+                strings.add(customer.email),
+                strings.add(customer.password),
+                plan,
+                _timestamp(customer.subscription_renewal),
+                first,
+                website_count - first,
+            ))
+            customer_count += 1
+
+        offsets = [HEADER.size]
+        for size in (customer_count * CUSTOMER.size,
+                     website_count * WEBSITE.size,
+                     len(enabled),
+                     len(strings.offsets) * OFFSET.size):
+            offsets.append(offsets[-1] + size)
+        header = HEADER.pack(MAGIC, VERSION, len(plans), customer_count,
+                             website_count, len(strings.offsets) - 1,
+                             *offsets)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as snapshot:
+                snapshot.write(header)
+                for section in (records, websites):
+                    section.seek(0)
+                    shutil.copyfileobj(section, snapshot)
+                snapshot.write(enabled)
+                if sys.byteorder != 'little':
+                    strings.offsets.byteswap()
+                strings.offsets.tofile(snapshot)
+                strings.file.seek(0)
+                shutil.copyfileobj(strings.file, snapshot)
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            _replace(temporary, path)
+            fsync_directory(directory)
+        except Exception:
+            os.remove(temporary)
+            raise
+    finally:
+        records.close()
+        websites.close()
+        strings.file.close()
+    LOG.info("Wrote %d customer(s) and %d website(s) to '%s'",
+             customer_count, website_count, path)
+    return customer_count
+
+
+class SnapshotReader(Repository):
+    """Read-only repository over a memory-mapped snapshot.
+
+    Opening a snapshot only maps the file and reads its header; pages are
+    faulted in as customers are built. Lookups by email build an email
+    index on first use.
+    """
+
+    def __init__(self, path):
+        """Snapshot reader.
+
+        :param str path: Snapshot written by :func:`write_snapshot`.
+        :raise: :class:`SnapshotFormatError` if `path` is not a supported
+            snapshot.
+        """
+        self.path = path
+        self._emails = None
+        with open(path, 'rb') as snapshot:
+            try:
+                self._map = mmap.mmap(snapshot.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotFormatError("'%s' is empty." % (path,))
+        if len(self._map) < HEADER.size:
+            self._map.close()
+            raise SnapshotFormatError("'%s' is not a snapshot." % (path,))
+        (magic, version, plan_count, self._customers, self._websites,
+         self._strings, self._customer_offset, self._website_offset,
+         self._enabled_offset, self._string_offsets,
+         self._heap_offset) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise SnapshotFormatError("'%s' is not a snapshot." % (path,))
+        if version != VERSION:
+            self._map.close()
+            raise SnapshotFormatError(
+                "'%s' has unsupported snapshot version %d." % (path, version)
+            )
+        self.plans = [self._string(code) for code in range(plan_count)]
+
+    def __len__(self):
+        """Number of customers."""
+        return self._customers
+
+    def _string(self, index):
+        """Return string `index` of the heap."""
+        start, = OFFSET.unpack_from(
+            self._map, self._string_offsets + index * OFFSET.size)
+        end, = OFFSET.unpack_from(
+            self._map, self._string_offsets + (index + 1) * OFFSET.size)
+        return self._map[self._heap_offset + start:
+                         self._heap_offset + end].decode('utf-8')
+
+    def _record(self, index):
+        """Return the raw record of customer `index`."""
+        return CUSTOMER.unpack_from(
+            self._map, self._customer_offset + index * CUSTOMER.size)
+
+    def _website_rows(self, first, count):
+        """Yield ``(url, enabled)`` of `count` websites from `first`."""
+        for position in range(first, first + count):
+            url, = WEBSITE.unpack_from(
+                self._map, self._website_offset + position * WEBSITE.size)
+            flags = self._map[self._enabled_offset + position // 8:
+                              self._enabled_offset + position // 8 + 1]
+            yield self._string(url), bool(
+                bytearray(flags)[0] >> (position % 8) & 1)
+
+    def customer(self, index, load_subscription=True):
+        """Return customer `index`, in the order they were written.
+
+        :param int index: Position of the customer.
+        :param bool load_subscription: Whether to load the subscription.
+        """
+        record = self._record(index)
+        name, email, password, _, renewal = record[:5]
+        customer = Customer(self._string(name), self._string(email),
+                            self._string(password), encoded=True)
+        customer.subscription_renewal = _datetime(renewal)
+        if load_subscription:
+            self._build_subscription(customer, record)
+        return customer
+
+    def _build_subscription(self, customer, record):
+        """Set the subscription of `customer` from its `record`."""
+        plan, _, first, count = record[3:]
+        if plan == NO_PLAN:
+            customer.subscription = None
+            return
+        subscription = Subscription(self.plans[plan], customer)
+        subscription.restore_websites(self._website_rows(first, count))
+        customer.subscription = subscription
+
+    def _index(self, email):
+        """Return the position of customer `email`."""
+        if self._emails is None:
+            self._emails = {
+                self._string(self._record(index)[1]): index
+                for index in range(self._customers)
+            }
+        try:
+            return self._emails[email]
+        except KeyError:
+            raise CustomerNotFound("Customer '%s' does not exist." % (email,))
+
+    def get_customer(self, email, load_subscription=True):
+        """Return the customer with `email`.
+
+        :param str email: Customer's email.
+        :param bool load_subscription: Whether to load the subscription
+            and websites too, see :meth:`load_subscription`.
+        :raise: :class:`CustomerNotFound` if there is no such customer.
+        """
+        return self.customer(self._index(email), load_subscription)
+
+    def load_subscription(self, customer):
+        """Load the subscription and websites of `customer`.
+
+        :param customer: Customer returned by this repository.
+        :return: The customer.
+        """
+        self._build_subscription(
+            customer, self._record(self._index(customer.email)))
+        return customer
+
+    def iter_customers(self, load_subscriptions=True):
+        """Iterate over every customer in the order they were written.
+
+        :param bool load_subscriptions: Whether to load subscriptions.
+        """
+        for index in range(self._customers):
+            yield self.customer(index, load_subscriptions)
+
+    def close(self):
+        """Unmap the snapshot."""
+        self._map.close()
@@ -0,0 +1,334 @@
+"""
+.. module: license.storage.sqlite
+    :synopsis: SQLite repository.
+"""
+from __future__ import unicode_literals
+from datetime import datetime
+from itertools import groupby
+import logging
+import sqlite3
+import threading
+from license.models.customer import Customer
+from license.models.subscription import Subscription
+from license.storage.repository import Repository
+from license.exceptions.storage import CustomerNotFound
+
+
+LOG = logging.getLogger(__name__)
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS customer (
+    id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    password TEXT NOT NULL,
+    plan_type TEXT,
+    subscription_renewal TEXT
+);
+CREATE TABLE IF NOT EXISTS website (
+    customer_id INTEGER NOT NULL REFERENCES customer (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    enabled INTEGER NOT NULL,
+    PRIMARY KEY (customer_id, position)
+);
+"""
+
+# Statements are constant so sqlite3's statement cache prepares each of them
+# once per connection.
+UPDATE_CUSTOMER = (
+    "UPDATE customer SET name = ?, password = ?, plan_type = ?, "
+    "subscription_renewal = ? WHERE email = ?"
+)
+# Customers whose subscription was not loaded keep their stored plan.
+UPDATE_CUSTOMER_DETAILS = (
+    "UPDATE customer SET name = ?, password = ?, "
+    "subscription_renewal = ? WHERE email = ?"
+)
+INSERT_CUSTOMER = (
+    "INSERT OR IGNORE INTO customer "
+    "(name, password, plan_type, subscription_renewal, email) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+DELETE_WEBSITES = (
+    "DELETE FROM website WHERE customer_id = "
+    "(SELECT id FROM customer WHERE email = ?)"
+)
+INSERT_WEBSITE = (
+    "INSERT INTO website (customer_id, position, url, enabled) "
+    "SELECT id, ?, ?, ? FROM customer WHERE email = ?"
+)
+SELECT_CUSTOMER = (
+    "SELECT name, email, password, plan_type, subscription_renewal "
+    "FROM customer WHERE email = ?"
+)
+SELECT_WEBSITES = (
+    "SELECT w.url, w.enabled FROM website w "
+    "JOIN customer c ON c.id = w.customer_id "
+    "WHERE c.email = ? ORDER BY w.position"
+)
+SELECT_CUSTOMERS = (
+    "SELECT name, email, password, plan_type, subscription_renewal "
+    "FROM customer ORDER BY id"
+)
+SELECT_CUSTOMERS_WEBSITES = (
+    "SELECT c.name, c.email, c.password, c.plan_type, "
+    "c.subscription_renewal, w.url, w.enabled "
+    "FROM customer c LEFT JOIN website w ON w.customer_id = c.id "
+    "ORDER BY c.id, w.position"
+)
+DELETE_CUSTOMER = "DELETE FROM customer WHERE email = ?"
+COUNT_CUSTOMERS = "SELECT COUNT(*) FROM customer"
+
+
+class _StoredCustomer(Customer):
+    """Customer read from a repository.
+
+    Tells customers whose stored subscription was not loaded from
+    unsubscribed ones: both have no subscription, but saving the former
+    must keep the stored plan and websites, and subscribing them must not
+    replace it.
+    """
+
+    __slots__ = ('repository', 'subscription_loaded')
+
+    def __init__(self, repository, name, email, password, loaded):
+        """Stored customer.
+
+        :param repository: :class:`SQLiteRepository` the customer was read
+            from.
+        :param bool loaded: Whether the subscription is loaded, or there is
+            none stored.
+        """
+        super(_StoredCustomer, self).__init__(name, email, password,
+                                              encoded=True)
+        self.repository = repository
+        self.subscription_loaded = loaded
+
+    def subscribe(self, plan):
+        """Subscribe client to a plan, once the stored subscription is
+        loaded.
+
+        :raise: :class:`SubscriptionExistent` if a subscription is stored.
+        """
+        if not self.subscription_loaded:
+            self.repository.load_subscription(self)
+        return super(_StoredCustomer, self).subscribe(plan)
+
+
+def _loaded(customer):
+    """Return whether the subscription of `customer` was loaded."""
+    return getattr(customer, 'subscription_loaded', True)
+
+
+class SQLiteRepository(Repository):
+    """Repository backed by a SQLite database.
+
+    Writes for a batch of customers run in a single transaction with one
+    ``executemany`` per statement. Reads only hydrate what is asked for:
+    :meth:`get_customer` loads a single customer and :meth:`iter_customers`
+    streams rows in batches of :attr:`fetch_size`.
+
+    The connection may be shared between threads, calls are serialized
+    with a lock.
+    """
+
+    fetch_size = 1000
+
+    def __init__(self, path=':memory:'):
+        """SQLite repository.
+
+        :param str path: Database file, in memory by default.
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA foreign_keys = ON')
+        self._connection.executescript(SCHEMA)
+
+    def save_customers(self, customers):
+        """Save several customers in one batch.
+
+        Websites of saved customers are replaced by their current websites.
+        Customers read without their subscription keep their stored plan
+        and websites; those missing here, such as customers copied from
+        another repository, have their subscription loaded from the
+        repository they were read from and are inserted.
+
+        :param customers: Iterable of customers.
+        :return: self for chain-ability
+        """
+        customers = list(customers)
+        loaded = [customer for customer in customers if _loaded(customer)]
+        with self._lock, self._connection:
+            for customer in customers:
+                if _loaded(customer):
+                    continue
+                cursor = self._connection.execute(
+                    UPDATE_CUSTOMER_DETAILS, self._details_row(customer))
+                if not cursor.rowcount:
+                    loaded.append(
+                        customer.repository.load_subscription(customer))
+            rows = [self._customer_row(customer) for customer in loaded]
+            emails = [(customer.email,) for customer in loaded]
+            self._connection.executemany(UPDATE_CUSTOMER, rows)
+            self._connection.executemany(INSERT_CUSTOMER, rows)
+            self._connection.executemany(DELETE_WEBSITES, emails)
+            self._connection.executemany(
+                INSERT_WEBSITE,
+                self._website_rows(loaded)
+            )
+        LOG.debug("Saved %d customer(s) to '%s'", len(customers), self.path)
+        return self
+
+    def get_customer(self, email, load_subscription=True):
+        """Return the customer with `email`.
+
+        :param str email: Customer's email.
+        :param bool load_subscription: Whether to load the subscription
+            and websites too, see :meth:`load_subscription`.
+        :raise: :class:`CustomerNotFound` if there is no such customer.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                SELECT_CUSTOMER,
+                (email,)
+            ).fetchone()
+        if row is None:
+            raise CustomerNotFound("Customer '%s' does not exist." % (email,))
+
+        customer = self._build_customer(row)
+        if load_subscription:
+            self._build_subscription(customer, row[3], self._websites(email))
+        return customer
+
+    def load_subscription(self, customer):
+        """Load the subscription and websites of `customer`.
+
+        :param customer: Customer returned by this repository.
+        :return: The customer.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                SELECT_CUSTOMER,
+                (customer.email,)
+            ).fetchone()
+        if row is None:
+            raise CustomerNotFound(
+                "Customer '%s' does not exist." % (customer.email,)
+            )
+        self._build_subscription(
+            customer,
+            row[3],
+            self._websites(customer.email)
+        )
+        return customer
+
+    def iter_customers(self, load_subscriptions=True):
+        """Iterate over every customer, streaming rows from the database.
+
+        :param bool load_subscriptions: Whether to load subscriptions.
+        """
+        if not load_subscriptions:
+            for row in self._fetch(SELECT_CUSTOMERS):
+                yield self._build_customer(row)
+            return
+
+        rows = self._fetch(SELECT_CUSTOMERS_WEBSITES)
+        for key, group in groupby(rows, key=lambda row: row[:5]):
+            customer = self._build_customer(key)
+            websites = ((row[5], row[6]) for row in group
+                        if row[5] is not None)
+            self._build_subscription(customer, key[3], websites)
+            yield customer
+
+    def delete_customer(self, email):
+        """Delete the customer with `email` and its websites."""
+        with self._lock, self._connection:
+            self._connection.execute(DELETE_CUSTOMER, (email,))
+        return self
+
+    def __len__(self):
+        """Number of customers."""
+        with self._lock:
+            return self._connection.execute(COUNT_CUSTOMERS).fetchone()[0]
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def _fetch(self, statement, parameters=()):
+        """Yield rows of `statement` in batches of :attr:`fetch_size`."""
+        with self._lock:
+            cursor = self._connection.execute(statement, parameters)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(self.fetch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+    def _websites(self, email):
+        with self._lock:
+            return self._connection.execute(
+                SELECT_WEBSITES,
+                (email,)
+            ).fetchall()
+
+    @staticmethod
+    def _customer_row(customer):
+        subscription = customer.subscription
+        renewal = customer.subscription_renewal
+        return (
+            customer.name,
+            customer.password,
+            subscription.plan.plan_type if subscription else None,
+            renewal.strftime(DATETIME_FORMAT) if renewal else None,
+            customer.email,
+        )
+
+    @staticmethod
+    def _details_row(customer):
+        renewal = customer.subscription_renewal
+        return (
+            customer.name,
+            customer.password,
+            renewal.strftime(DATETIME_FORMAT) if renewal else None,
+            customer.email,
+        )
+
+    @staticmethod
+    def _website_rows(customers):
+        for customer in customers:
+            if customer.subscription is None:
+                continue
+            websites = customer.subscription.websites()
+            for position, website in enumerate(websites):
+                yield (position, website.url, int(website.enabled),
+                       customer.email)
+
+    def _build_customer(self, row):
+        name, email, password, plan_type, renewal = row[:5]
+        customer = _StoredCustomer(self, name, email, password,
+                                   plan_type is None)
+        if renewal:
+            customer.subscription_renewal = datetime.strptime(
+                renewal,
+                DATETIME_FORMAT
+            )
+        return customer
+
+    @staticmethod
+    def _build_subscription(customer, plan_type, websites):
+        if isinstance(customer, _StoredCustomer):
+            customer.subscription_loaded = True
+        if plan_type is None:
+            customer.subscription = None
+            return
+        subscription = Subscription(plan_type, customer)
+        subscription.restore_websites(websites)
+        customer.subscription = subscription
@@ -0,0 +1,10 @@
+"""
+.. module: license.tests
+    :synopsis: License tests.
+"""
+from __future__ import unicode_literals
+from license import passwords
+
+# Most tests build customers with plain text passwords; hash them cheaply.
+passwords.use_hasher(passwords.PasswordHasher(n=2 ** 4, r=1,
+                                              iterations=1))
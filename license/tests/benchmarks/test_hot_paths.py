@@ -0,0 +1,47 @@
+"""
+.. module: license.tests.benchmarks.test_hot_paths
+    :synopsis: Hot paths benchmark smoke tests.
+"""
+
+from __future__ import unicode_literals
+import json
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+from license import benchmarks
+from license.benchmarks import hot_paths
+
+
+class TestHotPaths(unittest.TestCase):
+    """Tests for hot paths benchmark."""
+
+    def test_run(self):
+        """Test every operation is measured at every size."""
+        results = hot_paths.run(sizes=(1, 20), number=5, repeat=1)
+        sized = [result for result in results if result['size']]
+        self.assertEqual(len(results) - len(sized), 2)
+        self.assertEqual(len(sized), 2 * len(hot_paths.cases(1, 5)))
+        for result in results:
+            self.assertGreater(result['seconds_per_op'], 0)
+
+    def test_main(self):
+        """Test results are written as JSON to a closed file."""
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'results.json')
+        try:
+            with patch.object(benchmarks, 'write_json',
+                              wraps=benchmarks.write_json) as write_json:
+                hot_paths.main(['--sizes', '2', '--number', '2',
+                                '--repeat', '1', '--output', path])
+            self.assertTrue(write_json.call_args[0][1].closed)
+            with open(path) as results:
+                document = json.load(results)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(document['benchmark'], 'hot_paths')
+        self.assertTrue(document['results'])
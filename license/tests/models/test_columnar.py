@@ -0,0 +1,150 @@
+"""
+.. module: license.tests.models.test_columnar
+    :synopsis: Columnar website index tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+from license.models.columnar import ColumnarWebsiteIndex, WebsiteView
+from license.models.website import Website
+
+
+class TestColumnarWebsiteIndex(unittest.TestCase):
+    """Tests for columnar website index."""
+
+    def setUp(self):
+        """Set up fixtures."""
+        self.customer = Mock()
+        self.index = ColumnarWebsiteIndex([
+            Website('url1', self.customer),
+            Website('url2', self.customer, enabled=False),
+            Website('url3', self.customer),
+        ], self.customer)
+
+    def urls(self, websites):
+        """Return the urls of `websites`."""
+        return [website.url for website in websites]
+
+    def test__init(self):
+        """Test index __init__."""
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.enabled_count, 2)
+        self.assertEqual(self.urls(self.index), ['url1', 'url2', 'url3'])
+        self.assertIn('url2', self.index)
+        self.assertNotIn('url4', self.index)
+
+    def test_views(self):
+        """Test websites are views over the index."""
+        website = self.index.get('url1')
+        self.assertIsInstance(website, WebsiteView)
+        self.assertIsInstance(website, Website)
+        self.assertIs(website.customer, self.customer)
+        self.assertEqual(str(website), 'url1 (True)')
+        website.enabled = False
+        self.assertEqual(self.index.enabled_count, 1)
+        self.assertFalse(self.index.get('url1').enabled)
+        self.assertIsNone(self.index.get('url4'))
+
+    def test_append(self):
+        """Test append keeps order and ignores duplicates."""
+        self.assertTrue(self.index.append(Website('url4', self.customer)))
+        self.assertFalse(self.index.append(Website('url1', self.customer)))
+        self.assertEqual(self.index.enabled_count, 3)
+        self.assertEqual(self.urls(self.index.enabled()),
+                         ['url1', 'url3', 'url4'])
+
+    def test_remove(self):
+        """Test remove by url."""
+        website = self.index.remove('url1')
+        self.assertEqual((website.url, website.enabled), ('url1', True))
+        self.assertIsNone(self.index.remove('url1'))
+        self.assertEqual(self.index.enabled_count, 1)
+        self.assertEqual(self.urls(self.index), ['url2', 'url3'])
+
+    def test_remove_compacts(self):
+        """Test removing most websites compacts the index."""
+        self.index.remove('url1')
+        self.index.remove('url2')
+        self.assertEqual(self.index._urls, ['url3'])
+        self.assertEqual(self.index._positions, {'url3': 0})
+        self.assertTrue(self.index.get('url3').enabled)
+
+    def test_copy(self):
+        """Test copies are independent of the original."""
+        copy = self.index.copy()
+        copy.get('url1').enabled = False
+        copy.remove('url3')
+        copy.append(Website('url4', self.customer))
+        self.assertEqual(self.urls(self.index.enabled()), ['url1', 'url3'])
+        self.assertEqual(self.urls(copy.enabled()), ['url4'])
+        self.assertEqual((self.index.enabled_count, copy.enabled_count),
+                         (2, 1))
+
+    def test_copy_on_write(self):
+        """Test copies only copy the columns they change."""
+        copy = self.index.copy()
+        self.assertIs(copy._positions, self.index._positions)
+        copy.disable('url1')
+        self.assertIs(copy._positions, self.index._positions)
+        self.assertIsNot(copy._flags, self.index._flags)
+        self.index.append(Website('url4', self.customer))
+        self.assertIsNot(copy._positions, self.index._positions)
+        self.assertEqual(self.urls(copy), ['url1', 'url2', 'url3'])
+        self.assertEqual(self.urls(self.index.enabled()),
+                         ['url1', 'url3', 'url4'])
+
+    def test_canonical_urls(self):
+        """Test urls are looked up by their canonical form."""
+        self.index.append(Website('https://www.Example.com/', self.customer))
+        self.assertFalse(self.index.append(
+            Website('example.com', self.customer)))
+        website = self.index.get('http://EXAMPLE.com')
+        self.assertEqual(website.url, 'https://www.Example.com/')
+        self.assertEqual(sorted(self.index.enabled_keys()),
+                         ['example.com', 'url1', 'url3'])
+        website.enabled = False
+        self.assertFalse(self.index.is_enabled('example.com'))
+        for url in ('url1', 'url2', 'url3'):
+            self.index.remove(url)
+        self.assertEqual(self.index._positions, {'example.com': 0})
+        self.assertEqual(self.index.pop().url, 'https://www.Example.com/')
+
+    def test_pop(self):
+        """Test pop removes the last website added."""
+        self.index.remove('url3')
+        self.assertEqual(self.index.pop().url, 'url2')
+        self.assertEqual(self.index.pop().url, 'url1')
+        self.assertIsNone(self.index.pop())
+        self.assertEqual(self.index.enabled_count, 0)
+        self.assertEqual(len(self.index), 0)
+
+    def test_disable(self):
+        """Test disable."""
+        self.assertTrue(self.index.disable('url1'))
+        self.assertFalse(self.index.disable('url1'))
+        self.assertFalse(self.index.disable('not indexed'))
+        self.assertEqual(self.index.enabled_count, 1)
+        self.assertEqual(self.urls(self.index.enabled()), ['url3'])
+
+    def test_enabled(self):
+        """Test enabled websites sequence."""
+        enabled = self.index.enabled()
+        self.assertEqual(len(enabled), 2)
+        self.assertEqual(enabled[-1].url, 'url3')
+        self.assertEqual(self.urls(enabled[:1]), ['url1'])
+
+    def test_trim_enabled(self):
+        """Test trim enabled websites."""
+        for url in ('url4', 'url5'):
+            self.index.append(Website(url, self.customer))
+        disabled = self.index.trim_enabled(2)
+        self.assertEqual(self.urls(disabled), ['url4', 'url5'])
+        self.assertEqual(self.index.enabled_count, 2)
+        self.assertEqual(self.urls(self.index.enabled()), ['url1', 'url3'])
+        self.assertEqual(self.index.trim_enabled(-1), [])
+        self.assertEqual(self.index.trim_enabled(2), [])
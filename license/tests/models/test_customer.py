@@ -5,6 +5,7 @@
 
 from __future__ import unicode_literals
 import unittest
+from license import passwords
 from license.models.customer import Customer
 
 
@@ -20,10 +21,36 @@ class TestCustomerModel(unittest.TestCase):
         )
         self.assertEqual(customer.name, 'name')
         self.assertEqual(customer.email, 'email@email.com')
-        self.assertEqual(customer.password, 'password')
+        self.assertNotEqual(customer.password, 'password')
+        self.assertTrue(customer.check_password('password'))
+        self.assertEqual(
+            Customer('name', 'email', customer.password, encoded=True)
+            .password, customer.password)
+        # Plain text shaped like an encoded password is hashed too.
+        customer = Customer('name', 'email', 'pbkdf2_sha256$1$c2FsdA$abc')
+        self.assertTrue(customer.check_password('pbkdf2_sha256$1$c2FsdA$abc'))
         self.assertIsNone(customer.subscription)
         self.assertIsNone(customer.subscription_renewal)
 
+    def test_check_password(self):
+        """Test passwords are checked and rehashed on parameter changes."""
+        customer = Customer('name', 'email@email.com', 'password')
+        self.assertFalse(customer.check_password('wrong'))
+        customer.set_password('new')
+        self.assertTrue(customer.check_password('new'))
+        encoded = customer.password
+        previous = passwords.use_hasher(passwords.PasswordHasher(
+            n=2 ** 5, r=1, iterations=2))
+        try:
+            self.assertFalse(customer.check_password('password'))
+            self.assertEqual(customer.password, encoded)
+            self.assertTrue(customer.check_password('new'))
+            self.assertNotEqual(customer.password, encoded)
+            self.assertFalse(
+                passwords.hasher().needs_rehash(customer.password))
+        finally:
+            passwords.use_hasher(previous)
+
     def test__str(self):
         """Test customer __str__."""
         customer = Customer(
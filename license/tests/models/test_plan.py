@@ -4,12 +4,31 @@
 """
 
 from __future__ import unicode_literals
+import io
+import json
+import os
+import pickle
+import shutil
+import tempfile
 import unittest
-from license.models.plan import Plan
+from license.models.plan import (
+    Plan,
+    PlanCatalog,
+    PLAN_RANKS,
+    PLAN_TRANSITIONS,
+    UPGRADE,
+    DOWNGRADE,
+    UNCHANGED,
+    catalog,
+    plan_transition,
+    use_catalog,
+)
+from license.models.subscription import Subscription
 from license.exceptions.plan import (
     PlanTypeError,
     PlanUpgradeError,
     PlanDowngradeError,
+    PlanCatalogError,
 )
 
 
@@ -33,7 +52,7 @@ class TestPlanModel(unittest.TestCase):
         """Test plan upgrade."""
         plan = Plan(Plan.PLANS[0])
         for plan_type in Plan.PLANS[1:]:
-            plan.upgrade(plan_type)
+            plan = plan.upgrade(plan_type)
             self.assertEqual(plan.plan_type, plan_type)
 
     def test_downgrade(self):
@@ -42,7 +61,7 @@ class TestPlanModel(unittest.TestCase):
         plans.reverse()
         plan = Plan(plans[0])
         for plan_type in plans[1:]:
-            plan.downgrade(plan_type)
+            plan = plan.downgrade(plan_type)
             self.assertEqual(plan.plan_type, plan_type)
 
     def test_upgrade_error(self):
@@ -72,3 +91,105 @@ class TestPlanModel(unittest.TestCase):
         plan = Plan(Plan.PLANS[-1])
         with self.assertRaises(PlanDowngradeError):
             plan.downgrade('not valid')
+
+    def test_plan_type_interned(self):
+        """Test plans share the canonical plan type strings."""
+        plan_type = ''.join(['Si', 'ngle'])
+        self.assertIs(Plan(plan_type).plan_type, Plan.SINGLE)
+        plan = Plan(Plan.SINGLE).upgrade(''.join(['Pl', 'us']))
+        self.assertIs(plan.plan_type, Plan.PLUS)
+        self.assertFalse(hasattr(plan, '__dict__'))
+
+    def test_plan_transition(self):
+        """Test plan transition table."""
+        self.assertEqual(plan_transition(Plan.SINGLE, Plan.PLUS), UPGRADE)
+        self.assertEqual(plan_transition(Plan.INFINITE, Plan.PLUS), DOWNGRADE)
+        self.assertEqual(plan_transition(Plan.PLUS, Plan.PLUS), UNCHANGED)
+        self.assertIsNone(plan_transition(Plan.PLUS, 'not valid'))
+        self.assertIsNone(plan_transition('not valid', Plan.PLUS))
+        self.assertEqual(len(PLAN_TRANSITIONS), len(Plan.PLANS) ** 2)
+
+    def test_flyweight(self):
+        """Test plans are shared and immutable."""
+        self.assertIs(Plan(Plan.PLUS), Plan(Plan.PLUS))
+        self.assertIs(Subscription(Plan.PLUS, None).plan, Plan(Plan.PLUS))
+        self.assertIs(Plan(Plan.SINGLE).upgrade(Plan.PLUS), Plan(Plan.PLUS))
+        with self.assertRaises(AttributeError):
+            Plan(Plan.PLUS).plan_type = Plan.SINGLE
+        self.assertIs(pickle.loads(pickle.dumps(Plan(Plan.PLUS))),
+                      Plan(Plan.PLUS))
+
+
+class TestPlanCatalog(unittest.TestCase):
+    """Test plan catalog."""
+
+    CONFIG = {
+        'currency': 'USD',
+        'plans': [
+            {'name': 'Single', 'allowance': 1,
+             'prices': {'USD': 49.0, 'EUR': 45.0}},
+            {'name': 'Plus', 'allowance': 3, 'prices': {'USD': 99.0}},
+            {'name': 'Team', 'allowance': 10, 'prices': {'USD': 149.0}},
+            {'name': 'Infinite', 'allowance': -1, 'prices': {'USD': 249.0}},
+        ],
+    }
+
+    def setUp(self):
+        """Restore the current catalog after each test."""
+        self.addCleanup(use_catalog, catalog())
+
+    def test_use_catalog(self):
+        """Test new tiers and regional prices without code changes."""
+        use_catalog(PlanCatalog(self.CONFIG))
+        team = Plan('Team')
+        self.assertEqual((team.rank, team.allowance(), team.price()),
+                         (2, 10, 149.0))
+        self.assertEqual(Plan(Plan.SINGLE).price('EUR'), 45.0)
+        self.assertEqual(Plan(Plan.SINGLE).prices(),
+                         {'USD': 49.0, 'EUR': 45.0})
+        self.assertEqual(Plan.PLANS,
+                         [Plan.SINGLE, Plan.PLUS, 'Team', Plan.INFINITE])
+        self.assertEqual(Plan.ALLOWANCE['Team'], 10)
+        self.assertEqual(Plan.PRICES['Team'], 149.0)
+        self.assertEqual(catalog().ranks['Team'], 2)
+        # Tables are replaced, not changed in place.
+        self.assertNotIn('Team', PLAN_RANKS)
+        self.assertEqual(plan_transition(Plan.INFINITE, 'Team'), DOWNGRADE)
+        subscription = Subscription(Plan.INFINITE, None)
+        subscription.add_websites(['url{0}'.format(i) for i in range(20)])
+        subscription.update_plan('Team')
+        self.assertEqual(subscription.enabled_count(), 10)
+
+    def test_load(self):
+        """Test loading a catalog from a JSON file."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'plans.json')
+        with io.open(path, 'w', encoding='utf-8') as config:
+            config.write(json.dumps(self.CONFIG))
+        loaded = PlanCatalog.load(path)
+        self.assertEqual(loaded.plan_types(),
+                         [Plan.SINGLE, Plan.PLUS, 'Team', Plan.INFINITE])
+        self.assertIn('Team', loaded)
+        self.assertEqual(len(loaded), 4)
+        with self.assertRaises(PlanTypeError):
+            loaded['Gold']
+        with io.open(path, 'w', encoding='utf-8') as config:
+            config.write('{')
+        with self.assertRaises(PlanCatalogError):
+            PlanCatalog.load(path)
+
+    def test_invalid(self):
+        """Test invalid configurations."""
+        plan = {'name': 'Single', 'allowance': 1, 'prices': {'USD': 1.0}}
+        for config in (
+                {},
+                {'currency': 'USD', 'plans': []},
+                {'currency': 'USD', 'plans': [plan, plan]},
+                {'currency': 'EUR', 'plans': [plan]},
+                {'currency': 'USD', 'plans': [dict(plan, allowance=0)]},
+                {'currency': 'USD', 'plans': [dict(plan, allowance=-5)]},
+                {'currency': 'USD', 'plans': [dict(plan, allowance=True)]},
+                {'currency': 'USD', 'plans': [{'name': 'Single'}]}):
+            with self.assertRaises(PlanCatalogError):
+                PlanCatalog(config)
@@ -0,0 +1,51 @@
+"""
+.. module: license.tests.models.test_selection
+    :synopsis: Selection policies tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+from license.models.selection import (
+    KeepOldest,
+    KeepPinned,
+    KeepRecentlyUsed,
+)
+
+
+URLS = ['url1', 'url2', 'url3', 'url4', 'url5']
+
+
+class TestSelectionPolicies(unittest.TestCase):
+    """Tests for selection policies."""
+
+    def test_keep_oldest(self):
+        """Test the first websites are kept."""
+        policy = KeepOldest()
+        self.assertEqual(policy.select(URLS, 2), ['url3', 'url4', 'url5'])
+        self.assertEqual(policy.select(URLS, 5), [])
+        self.assertEqual(policy.select(URLS, -1), [])
+
+    def test_keep_recently_used(self):
+        """Test the most recently used websites are kept."""
+        policy = KeepRecentlyUsed({'url2': 10, 'url4': 30, 'url5': 10})
+        self.assertEqual(policy.select(URLS, 1),
+                         ['url1', 'url2', 'url3', 'url5'])
+        # Ties and websites never used are kept oldest first.
+        self.assertEqual(policy.select(URLS, 2), ['url1', 'url3', 'url5'])
+        self.assertEqual(policy.select(URLS, 4), ['url3'])
+
+    def test_keep_recently_used_canonical(self):
+        """Test usage is looked up by canonical url."""
+        policy = KeepRecentlyUsed({'example.com': 1})
+        self.assertEqual(
+            policy.select(['url1', 'https://www.Example.com/'], 1),
+            ['url1'])
+
+    def test_keep_pinned(self):
+        """Test pinned websites are kept first."""
+        policy = KeepPinned(['url2', 'http://url4/'])
+        self.assertEqual(policy.select(URLS, 3), ['url3', 'url5'])
+        self.assertEqual(policy.select(URLS, 1),
+                         ['url1', 'url3', 'url4', 'url5'])
+        then = KeepPinned(['url2'], KeepRecentlyUsed({'url5': 1}))
+        self.assertEqual(then.select(URLS, 2), ['url1', 'url3', 'url4'])
@@ -0,0 +1,59 @@
+"""
+.. module: license.tests.models.test_signals
+    :synopsis: Model mutation signals tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+from license.models import signals
+from license.models.customer import Customer
+from license.models.plan import Plan
+
+
+class TestSignals(unittest.TestCase):
+    """Tests for model mutation signals."""
+
+    def setUp(self):
+        """Connect a receiver recording events."""
+        self.events = []
+        signals.connect(self.receive)
+        self.addCleanup(signals.disconnect, self.receive)
+
+    def receive(self, event, instance, value):
+        """Record an event."""
+        self.events.append((event, value))
+
+    def test_mutations(self):
+        """Test every effective mutation sends one event."""
+        customer = Customer('name', 'email', 'password', Plan.PLUS)
+        subscription = customer.subscription
+        subscription.add_website('url1')
+        subscription.add_website('url1')
+        subscription.add_websites(['url1', 'url2', 'url3', 'url4'])
+        subscription.disable_website('url1')
+        subscription.disable_websites(['url1', 'url2', 'missing'])
+        subscription.remove_website('url3')
+        subscription.remove_websites(['url2', 'missing'])
+        subscription.remove_website()
+        subscription.update_plan(Plan.INFINITE)
+        with self.assertRaises(Exception):
+            subscription.update_plan('not valid')
+        self.assertEqual(self.events, [
+            (signals.SUBSCRIBE, Plan.PLUS),
+            (signals.ADD_WEBSITE, 'url1'),
+            (signals.ADD_WEBSITE, 'url2'),
+            (signals.ADD_WEBSITE, 'url3'),
+            (signals.DISABLE_WEBSITE, 'url1'),
+            (signals.DISABLE_WEBSITE, 'url2'),
+            (signals.REMOVE_WEBSITE, 'url3'),
+            (signals.REMOVE_WEBSITE, 'url2'),
+            (signals.REMOVE_WEBSITE, 'url1'),
+            (signals.UPDATE_PLAN, Plan.INFINITE),
+        ])
+
+    def test_disconnect(self):
+        """Test disconnected receivers are not called."""
+        signals.disconnect(self.receive)
+        signals.disconnect(self.receive)
+        Customer('name', 'email', 'password', Plan.PLUS)
+        self.assertEqual(self.events, [])
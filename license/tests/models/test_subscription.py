@@ -4,20 +4,22 @@
 """
 
 from __future__ import unicode_literals
+import sys
+import threading
 import unittest
 try:
     from unittest.mock import patch, Mock
 except ImportError:
     from mock import patch, Mock
+from license.models.plan import Plan
+from license.models.selection import KeepPinned
 from license.models.subscription import Subscription
+from license.models.website_index import WebsiteIndex
+from license.models.columnar import ColumnarWebsiteIndex
 from license.exceptions.subscription import (
     SubscriptionWebsiteLimitReached,
     SubscriptionPlanNotValid
 )
-from license.exceptions.plan import (
-    PlanUpgradeError,
-    PlanDowngradeError
-)
 
 
 class TestSubscriptionModel(unittest.TestCase):
@@ -39,23 +41,203 @@ class TestSubscriptionModel(unittest.TestCase):
         self.assertEqual(len(self.subscription.enabled_websites()), 1)
         self.assertEqual(self.subscription.enabled_websites()[-1].url, 'url')
 
-    @patch(
-        'license.models.subscription.Subscription.enabled_websites',
-        return_value=[Mock()]
-    )
-    def test_add_website_error(self, enabled_websites_mock):
+    def test_add_website_error(self):
         """Test add website error."""
+        self.subscription._websites = WebsiteIndex(
+            [Mock(url='url1', enabled=True)]
+        )
         self.subscription.plan.allowance.return_value = 1
         with self.assertRaises(SubscriptionWebsiteLimitReached):
             self.subscription.add_website('url')
             self.assertEqual(len(self.subscription.enabled_websites()), 1)
 
+    def test_add_websites(self):
+        """Test add several websites."""
+        self.subscription._websites = WebsiteIndex(
+            [Mock(url='url1', enabled=True)]
+        )
+        self.subscription.plan.allowance.return_value = 3
+        report = self.subscription.add_websites(
+            ['url1', 'url2', 'url2', 'url3', 'url4']
+        )
+        self.assertEqual(list(report.items()), [
+            ('url1', Subscription.EXISTS),
+            ('url2', Subscription.ADDED),
+            ('url3', Subscription.ADDED),
+            ('url4', Subscription.LIMIT_REACHED),
+        ])
+        self.assertEqual(self.subscription.plan.allowance.call_count, 1)
+        self.assertEqual(len(self.subscription.enabled_websites()), 3)
+
+    def test_add_websites_canonical(self):
+        """Test spellings of the same url use a single slot."""
+        self.subscription.plan.allowance.return_value = 3
+        report = self.subscription.add_websites(
+            ['http://Example.com/', 'https://example.com', 'example.com',
+             'other.com']
+        )
+        self.assertEqual(list(report.values()), [
+            Subscription.ADDED,
+            Subscription.EXISTS,
+            Subscription.EXISTS,
+            Subscription.ADDED,
+        ])
+        self.subscription.add_website('www.other.com')
+        self.assertEqual(self.subscription.enabled_count(), 2)
+        self.assertTrue(self.subscription.is_licensed('https://example.com'))
+        self.assertEqual(self.subscription.entitlements(),
+                         frozenset(['example.com', 'other.com']))
+        self.subscription.disable_website('EXAMPLE.COM')
+        self.assertFalse(self.subscription.is_licensed('http://Example.com/'))
+
+    def test_add_websites_unlimited(self):
+        """Test add several websites with an unlimited allowance."""
+        self.subscription.plan.allowance.return_value = -1
+        urls = ['url{0}'.format(i) for i in range(10)]
+        report = self.subscription.add_websites(urls)
+        self.assertEqual(set(report.values()), {Subscription.ADDED})
+        self.assertEqual(len(self.subscription.enabled_websites()), 10)
+
+    @patch.object(Subscription, 'COLUMNAR_THRESHOLD', 2)
+    def test_columnar_backend(self):
+        """Test large subscriptions switch to a columnar index."""
+        self.subscription.plan.allowance.return_value = -1
+        self.subscription.add_website('url1')
+        self.subscription.add_website('url2')
+        self.assertIsInstance(self.subscription._websites, WebsiteIndex)
+        self.subscription.add_websites(['url3', 'url4'])
+        self.assertIsInstance(
+            self.subscription._websites,
+            ColumnarWebsiteIndex
+        )
+        self.subscription.disable_website('url2')
+        self.assertEqual(
+            [website.url for website in self.subscription.enabled_websites()],
+            ['url1', 'url3', 'url4']
+        )
+
+    def test_disable_websites(self):
+        """Test disable several websites."""
+        websites = [Mock(url='url1', enabled=True),
+                    Mock(url='url2', enabled=False)]
+        self.subscription._websites = WebsiteIndex(websites)
+        report = self.subscription.disable_websites(['url1', 'url2', 'url3'])
+        self.assertEqual(list(report.items()), [
+            ('url1', Subscription.DISABLED),
+            ('url2', Subscription.UNCHANGED),
+            ('url3', Subscription.NOT_FOUND),
+        ])
+        self.assertEqual(self.subscription.enabled_websites(), [])
+
+    def test_remove_websites(self):
+        """Test remove several websites."""
+        websites = [Mock(url='url1', enabled=True),
+                    Mock(url='url2', enabled=True)]
+        self.subscription._websites = WebsiteIndex(websites)
+        report = self.subscription.remove_websites(['url2', 'url3'])
+        self.assertEqual(list(report.items()), [
+            ('url2', Subscription.REMOVED),
+            ('url3', Subscription.NOT_FOUND),
+        ])
+        self.assertEqual(self.subscription.enabled_websites(), websites[:1])
+
+    def test_is_licensed(self):
+        """Test licensed urls and cached entitlements."""
+        self.subscription.plan.allowance.return_value = -1
+        self.subscription.add_websites(['url1', 'url2'])
+        self.subscription.disable_website('url2')
+        self.assertTrue(self.subscription.is_licensed('url1'))
+        self.assertFalse(self.subscription.is_licensed('url2'))
+        self.assertFalse(self.subscription.is_licensed('url3'))
+        entitlements = self.subscription.entitlements()
+        self.assertEqual(entitlements, frozenset(['url1']))
+        self.assertIs(self.subscription.entitlements(), entitlements)
+        version = self.subscription.version
+        self.subscription.add_website('url3')
+        self.assertEqual(self.subscription.version, version + 1)
+        self.assertEqual(self.subscription.entitlements(),
+                         frozenset(['url1', 'url3']))
+
+    @patch.object(Subscription, 'COLUMNAR_THRESHOLD', 2)
+    def test_columnar_views(self):
+        """Test disabling a website view changes the subscription."""
+        subscription = Subscription(Plan.INFINITE, None)
+        subscription.add_websites(['url1', 'url2', 'url3'])
+        self.assertEqual(subscription.entitlements(),
+                         frozenset(['url1', 'url2', 'url3']))
+        version = subscription.version
+        website = next(subscription.websites())
+        website.enabled = False
+        self.assertFalse(subscription.is_licensed('url1'))
+        self.assertEqual(subscription.version, version + 1)
+        self.assertEqual(subscription.entitlements(),
+                         frozenset(['url2', 'url3']))
+        with self.assertRaises(ValueError):
+            website.enabled = True
+        website = subscription.enabled_websites()[0]
+        website.enabled = True
+        self.assertEqual(subscription.enabled_count(), 2)
+
+    def test_snapshot(self):
+        """Test snapshots do not see later changes."""
+        self.subscription.plan.allowance.return_value = -1
+        self.subscription.add_websites(['url1', 'url2', 'url3'])
+        snapshot = self.subscription.snapshot()
+        index = self.subscription._websites
+        self.assertIs(snapshot.plan, self.subscription.plan)
+        self.assertEqual(snapshot.version, self.subscription.version)
+        self.subscription.disable_website('url1')
+        self.subscription.remove_website('url2')
+        self.subscription.add_website('url4')
+        self.assertIsNot(self.subscription._websites, index)
+        self.assertEqual([w.url for w in snapshot.websites()],
+                         ['url1', 'url2', 'url3'])
+        self.assertEqual(snapshot.enabled_count(), 3)
+        self.assertTrue(snapshot.is_licensed('url1'))
+        self.assertEqual(snapshot.entitlements(),
+                         frozenset(['url1', 'url2', 'url3']))
+        self.assertEqual(self.subscription.entitlements(),
+                         frozenset(['url3', 'url4']))
+        with self.assertRaises(AttributeError):
+            snapshot.plan = None
+
+        index = self.subscription._websites
+        self.subscription.add_website('url5')
+        self.assertIs(self.subscription._websites, index)
+
+    @patch.object(Subscription, 'COLUMNAR_THRESHOLD', 2)
+    def test_snapshot_columnar(self):
+        """Test snapshots of columnar subscriptions."""
+        subscription = Subscription(Plan.INFINITE, None)
+        subscription.add_websites(['url1', 'url2', 'url3'])
+        self.assertIsInstance(subscription._websites, ColumnarWebsiteIndex)
+        snapshot = subscription.snapshot()
+        subscription.update_plan(Plan.SINGLE)
+        subscription.remove_websites(['url3'])
+        self.assertEqual([w.url for w in snapshot.enabled_websites()],
+                         ['url1', 'url2', 'url3'])
+        self.assertEqual([w.url for w in subscription.enabled_websites()],
+                         ['url1'])
+
+    @patch.object(Subscription, 'COLUMNAR_THRESHOLD', 2)
+    def test_snapshot_columnar_views(self):
+        """Test writes through website views do not change snapshots."""
+        subscription = Subscription(Plan.INFINITE, None)
+        subscription.add_websites(['url1', 'url2', 'url3'])
+        snapshot = subscription.snapshot()
+        next(subscription.websites()).enabled = False
+        next(snapshot.websites()).enabled = False
+        self.assertTrue(snapshot.is_licensed('url1'))
+        self.assertEqual(snapshot.enabled_count(), 3)
+        self.assertFalse(subscription.is_licensed('url1'))
+        self.assertEqual(subscription.enabled_count(), 2)
+
     def test_remove_website(self):
         """Test remove website."""
         websites = [Mock(url='url1', enabled=True),
                     Mock(url='url2', enabled=True),
                     Mock(url='url3', enabled=True)]
-        self.subscription._websites = websites
+        self.subscription._websites = WebsiteIndex(websites)
         self.subscription.remove_website('url2')
         self.assertEqual(len(self.subscription.enabled_websites()), 2)
         self.assertEqual(self.subscription.enabled_websites()[0].url, 'url1')
@@ -69,7 +251,7 @@ class TestSubscriptionModel(unittest.TestCase):
         websites = [Mock(url='url1', enabled=True),
                     Mock(url='url2', enabled=True),
                     Mock(url='url3', enabled=True)]
-        self.subscription._websites = websites
+        self.subscription._websites = WebsiteIndex(websites)
         self.subscription.disable_website('url1')
         enabled = self.subscription.enabled_websites()
         self.assertFalse([website for website in enabled
@@ -77,27 +259,133 @@ class TestSubscriptionModel(unittest.TestCase):
 
     def test_update_plan_upgrade(self):
         """Test update plan."""
-        self.subscription.plan.downgrade.side_effect = PlanDowngradeError()
-        self.subscription.update_plan('new_plan')
-        self.assertTrue(self.subscription.plan.upgrade.called)
-        self.assertFalse(self.subscription.plan.allowance.called)
+        plan = self.subscription.plan
+        plan.plan_type = Plan.SINGLE
+        self.subscription.update_plan(Plan.PLUS)
+        plan.upgrade.assert_called_once_with(Plan.PLUS)
+        self.assertIs(self.subscription.plan, plan.upgrade.return_value)
+        self.assertFalse(plan.downgrade.called)
+        self.assertFalse(plan.upgrade.return_value.allowance.called)
 
     def test_update_plan_downgrade(self):
         """Test update plan."""
         websites = [Mock(url='url1', enabled=True),
                     Mock(url='url2', enabled=True),
                     Mock(url='url3', enabled=True)]
-        self.subscription._websites = websites
-        self.subscription.plan.upgrade.side_effect = PlanUpgradeError()
-        self.subscription.plan.allowance.return_value = 1
-        self.subscription.update_plan('new_plan')
-        self.assertTrue(self.subscription.plan.downgrade.called)
-        self.assertTrue(self.subscription.plan.allowance.called)
+        self.subscription._websites = WebsiteIndex(websites)
+        plan = self.subscription.plan
+        plan.plan_type = Plan.INFINITE
+        plan.downgrade.return_value.allowance.return_value = 1
+        self.subscription.update_plan(Plan.SINGLE)
+        plan.downgrade.assert_called_once_with(Plan.SINGLE)
+        self.assertIs(self.subscription.plan, plan.downgrade.return_value)
+        self.assertFalse(plan.upgrade.called)
+        self.assertTrue(plan.downgrade.return_value.allowance.called)
         self.assertEqual(len(self.subscription.enabled_websites()), 1)
 
     def test_update_plan_error(self):
         """Test update plan error."""
-        self.subscription.plan.downgrade.side_effect = PlanDowngradeError()
-        self.subscription.plan.upgrade.side_effect = PlanUpgradeError()
+        self.subscription.plan.plan_type = Plan.SINGLE
         with self.assertRaises(SubscriptionPlanNotValid):
             self.subscription.update_plan('new_plan')
+        self.assertFalse(self.subscription.plan.upgrade.called)
+        self.assertFalse(self.subscription.plan.downgrade.called)
+
+    def test_update_plan_policy(self):
+        """Test downgrades keep the websites chosen by a policy."""
+        subscription = Subscription(Plan.INFINITE, None)
+        subscription.add_websites(['url1', 'url2', 'url3'])
+        subscription.update_plan(Plan.SINGLE, KeepPinned(['url2']))
+        self.assertEqual([w.url for w in subscription.enabled_websites()],
+                         ['url2'])
+        self.assertEqual(subscription.plan.plan_type, Plan.SINGLE)
+
+    def test_change_plan(self):
+        """Test downgrades enforced later, in batches."""
+        subscription = Subscription(Plan.INFINITE, None)
+        subscription.add_websites(['url1', 'url2', 'url3', 'url4'])
+        subscription.change_plan(Plan.SINGLE)
+        self.assertEqual(subscription.plan.plan_type, Plan.SINGLE)
+        self.assertEqual(subscription.enabled_count(), 4)
+        with self.assertRaises(SubscriptionWebsiteLimitReached):
+            subscription.add_website('url5')
+        urls = subscription.excess_websites()
+        self.assertEqual(urls, ['url2', 'url3', 'url4'])
+        self.assertEqual(subscription.enforce_allowance(urls[:1]), ['url2'])
+        subscription.remove_website('url3')
+        self.assertEqual(subscription.enforce_allowance(urls[1:]), ['url4'])
+        subscription.update_plan(Plan.PLUS).add_websites(['url5', 'url6'])
+        urls = subscription.change_plan(Plan.SINGLE).excess_websites()
+        self.assertEqual(urls, ['url5', 'url6'])
+        subscription.disable_websites(['url1', 'url5'])
+        # Only what is still over the allowance is disabled.
+        self.assertEqual(subscription.enforce_allowance(urls), [])
+        self.assertEqual([w.url for w in subscription.enabled_websites()],
+                         ['url6'])
+        with self.assertRaises(SubscriptionPlanNotValid):
+            subscription.change_plan('new_plan')
+
+
+class TestSubscriptionThreadSafety(unittest.TestCase):
+    """Stress a thread safe subscription from many threads."""
+
+    THREADS = 16
+    URLS = 200
+
+    def setUp(self):
+        """Switch threads as often as possible."""
+        if hasattr(sys, 'setswitchinterval'):
+            self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+            sys.setswitchinterval(1e-6)
+
+    def hammer(self, target):
+        """Run `target(thread_index)` on :attr:`THREADS` threads."""
+        threads = [threading.Thread(target=target, args=(index,))
+                   for index in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_allowance_invariant(self):
+        """Test concurrent adds never exceed the allowance."""
+        subscription = Subscription(Plan.PLUS, Mock(), thread_safe=True)
+        self.assertTrue(subscription.thread_safe)
+
+        def add(index):
+            for number in range(self.URLS):
+                try:
+                    subscription.add_website('url{0}-{1}'.format(index,
+                                                                 number))
+                except SubscriptionWebsiteLimitReached:
+                    pass
+
+        self.hammer(add)
+        self.assertEqual(subscription.enabled_count(),
+                         Plan.ALLOWANCE[Plan.PLUS])
+        self.assertEqual(len(list(subscription.websites())),
+                         Plan.ALLOWANCE[Plan.PLUS])
+
+    def test_enabled_count_consistent(self):
+        """Test concurrent mutations keep the enabled count consistent."""
+        subscription = Subscription(Plan.INFINITE, Mock(), thread_safe=True)
+
+        def mutate(index):
+            for number in range(self.URLS):
+                url = 'url{0}'.format(number % 50)
+                subscription.add_website(url)
+                if number % 3 == index % 3:
+                    subscription.disable_website(url)
+                if number % 7 == 0:
+                    subscription.remove_website(url)
+                subscription.enabled_websites()
+
+        self.hammer(mutate)
+        self.assertEqual(subscription.enabled_count(),
+                         len(subscription.enabled_websites()))
+
+    def test_thread_safe_default(self):
+        """Test subscriptions are not thread safe by default."""
+        self.assertFalse(Subscription(Plan.PLUS, Mock()).thread_safe)
+        with patch.object(Subscription, 'THREAD_SAFE', True):
+            self.assertTrue(Subscription(Plan.PLUS, Mock()).thread_safe)
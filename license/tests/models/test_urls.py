@@ -0,0 +1,64 @@
+"""
+.. module: license.tests.models.test_urls
+    :synopsis: Url canonicalization tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+
+from license.models import urls
+from license.models.urls import canonicalize
+
+
+class TestCanonicalize(unittest.TestCase):
+    """Tests for url canonicalization."""
+
+    def test_spellings(self):
+        """Test spellings of the same site share a canonical url."""
+        for url in ('http://Example.com/', 'https://example.com',
+                    'example.com', 'www.example.com.', ' HTTP://WWW.'
+                    'EXAMPLE.COM:80/#top', 'https://user@example.com:443'):
+            self.assertEqual(canonicalize(url), 'example.com', url)
+
+    def test_path_and_query(self):
+        """Test paths and queries are kept, fragments dropped."""
+        self.assertEqual(canonicalize('https://Example.com/Shop/?page=2#a'),
+                         'example.com/Shop?page=2')
+        self.assertNotEqual(canonicalize('example.com/a'),
+                            canonicalize('example.com/b'))
+
+    def test_ports(self):
+        """Test non default ports are kept."""
+        self.assertEqual(canonicalize('http://example.com:8080/'),
+                         'example.com:8080')
+        self.assertEqual(canonicalize('https://example.com:80'),
+                         'example.com:80')
+        self.assertEqual(canonicalize('http://[::1]:8080/'), '[::1]:8080')
+
+    def test_idna(self):
+        """Test international hosts are IDNA encoded."""
+        self.assertEqual(canonicalize('https://www.Bücher.de/'),
+                         'xn--bcher-kva.de')
+        self.assertEqual(canonicalize('xn--bcher-kva.de'),
+                         'xn--bcher-kva.de')
+
+    def test_idempotent(self):
+        """Test canonical urls are their own canonical form."""
+        for url in ('https://www.Example.com/Shop/?page=2',
+                    'http://example.com:8080', 'url1'):
+            canonical = canonicalize(url)
+            self.assertEqual(canonicalize(canonical), canonical)
+
+    def test_memo(self):
+        """Test canonical forms are memoized and the memo is bounded."""
+        size = urls.MEMO_SIZE
+        urls.MEMO_SIZE = 2
+        try:
+            urls._memo.clear()
+            canonicalize('a.com')
+            self.assertEqual(urls._memo, {'a.com': 'a.com'})
+            canonicalize('b.com')
+            canonicalize('c.com')
+            self.assertEqual(urls._memo, {'c.com': 'c.com'})
+        finally:
+            urls.MEMO_SIZE = size
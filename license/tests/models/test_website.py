@@ -28,3 +28,8 @@ class TestWebsiteModel(unittest.TestCase):
         customer_mock = Mock()
         website = Website('url', customer_mock)
         self.assertEqual(str(website), 'url (True)')
+
+    def test_slots(self):
+        """Test website has no instance __dict__."""
+        website = Website('url', Mock())
+        self.assertFalse(hasattr(website, '__dict__'))
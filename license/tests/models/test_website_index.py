@@ -0,0 +1,108 @@
+"""
+.. module: license.tests.models.test_website_index
+    :synopsis: Website index tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+from license.models.website_index import WebsiteIndex
+
+
+class TestWebsiteIndex(unittest.TestCase):
+    """Tests for website index."""
+
+    def setUp(self):
+        """Set up fixtures."""
+        self.websites = [Mock(url='url1', enabled=True),
+                         Mock(url='url2', enabled=False),
+                         Mock(url='url3', enabled=True)]
+        self.index = WebsiteIndex(self.websites)
+
+    def test__init(self):
+        """Test index __init__."""
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.enabled_count, 2)
+        self.assertEqual(list(self.index), self.websites)
+        self.assertIn('url2', self.index)
+        self.assertNotIn('url4', self.index)
+
+    def test_append(self):
+        """Test append keeps order and ignores duplicates."""
+        self.assertTrue(self.index.append(Mock(url='url4', enabled=True)))
+        self.assertFalse(self.index.append(Mock(url='url1', enabled=True)))
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.enabled_count, 3)
+        self.assertEqual(list(self.index)[-1].url, 'url4')
+
+    def test_canonical_urls(self):
+        """Test urls are looked up by their canonical form."""
+        index = WebsiteIndex([Mock(url='https://www.Example.com/',
+                                   enabled=True)])
+        self.assertFalse(index.append(Mock(url='example.com', enabled=True)))
+        self.assertIn('http://example.com', index)
+        self.assertEqual(index.enabled_urls(), ['https://www.Example.com/'])
+        self.assertEqual(index.enabled_keys(), ['example.com'])
+        self.assertTrue(index.disable('EXAMPLE.com'))
+        self.assertFalse(index.is_enabled('https://www.Example.com/'))
+        self.assertEqual(index.remove('example.com.').url,
+                         'https://www.Example.com/')
+        self.assertEqual(len(index), 0)
+
+    def test_copy(self):
+        """Test copies share websites until they change them."""
+        copy = self.index.copy()
+        self.assertEqual(list(copy), self.websites)
+        copy.append(Mock(url='url4', enabled=True))
+        copy.remove('url3')
+        self.assertTrue(copy.disable('url1'))
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.enabled_count, 2)
+        self.assertTrue(self.websites[0].enabled)
+        self.assertFalse(copy.get('url1').enabled)
+        self.assertEqual([w.url for w in copy.trim_enabled(0)], ['url4'])
+        self.assertEqual(copy.enabled_count, 0)
+        self.assertEqual(self.index.enabled(),
+                         [self.websites[0], self.websites[2]])
+
+    def test_remove(self):
+        """Test remove by url."""
+        self.assertIs(self.index.remove('url1'), self.websites[0])
+        self.assertIsNone(self.index.remove('url1'))
+        self.assertEqual(self.index.enabled_count, 1)
+        self.assertEqual([w.url for w in self.index], ['url2', 'url3'])
+
+    def test_pop(self):
+        """Test pop removes the last website added."""
+        self.assertIs(self.index.pop(), self.websites[-1])
+        self.assertEqual(self.index.enabled_count, 1)
+        self.index.pop()
+        self.index.pop()
+        self.assertIsNone(self.index.pop())
+        self.assertEqual(self.index.enabled_count, 0)
+
+    def test_disable(self):
+        """Test disable."""
+        self.assertTrue(self.index.disable('url1'))
+        self.assertFalse(self.index.disable('url1'))
+        self.assertFalse(self.index.disable('url2'))
+        self.assertFalse(self.index.disable('not indexed'))
+        self.assertEqual(self.index.enabled_count, 1)
+        self.assertEqual(self.index.enabled(), [self.websites[-1]])
+
+    def test_trim_enabled(self):
+        """Test trim enabled websites."""
+        self.index.append(Mock(url='url4', enabled=True))
+        disabled = self.index.trim_enabled(1)
+        self.assertEqual([w.url for w in disabled], ['url3', 'url4'])
+        self.assertEqual(self.index.enabled_count, 1)
+        self.assertEqual(self.index.enabled(), [self.websites[0]])
+
+    def test_trim_enabled_unlimited(self):
+        """Test trim with an unlimited allowance."""
+        self.assertEqual(self.index.trim_enabled(-1), [])
+        self.assertEqual(self.index.enabled_count, 2)
@@ -0,0 +1,119 @@
+"""
+.. module: license.tests.services.test_aio
+    :synopsis: Asyncio license service tests.
+"""
+
+from __future__ import unicode_literals
+import sys
+import threading
+import unittest
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.models.subscription import Subscription
+from license.storage.repository import MemoryRepository
+from license.storage.sqlite import SQLiteRepository
+from license.exceptions.storage import CustomerNotFound
+if sys.version_info >= (3, 5):
+    import asyncio
+    from license.services.aio import LicenseService
+
+
+class _SlowRepository(MemoryRepository):
+    """Memory repository counting lookups and blocking until released."""
+
+    def __init__(self):
+        super(_SlowRepository, self).__init__()
+        self.lookups = 0
+        self.release = threading.Event()
+
+    def get_customer(self, email, load_subscription=True):
+        self.lookups += 1
+        self.release.wait(1)
+        return super(_SlowRepository, self).get_customer(email)
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'Requires Python 3.5+')
+class TestLicenseService(unittest.TestCase):
+    """Tests for asyncio license service."""
+
+    def setUp(self):
+        """Set up a service over a memory repository."""
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.repository = _SlowRepository()
+        self.repository.release.set()
+        self.repository.save_customer(
+            Customer('name', 'email', 'password', Plan.PLUS))
+        self.service = LicenseService(self.repository, max_concurrency=4)
+
+    def run_all(self, *coroutines):
+        """Run `coroutines` concurrently and return their results."""
+        return self.loop.run_until_complete(asyncio.gather(*coroutines))
+
+    def test_operations(self):
+        """Test mutations are saved and license checks see them."""
+        self.repository.save_customer(Customer('other', 'other', 'password'))
+        subscription, = self.run_all(
+            self.service.subscribe('other', Plan.SINGLE))
+        self.assertIsInstance(subscription, Subscription)
+        self.run_all(self.service.add_website('other', 'url1'))
+        self.assertEqual(self.run_all(
+            self.service.is_licensed('other', 'url1'),
+            self.service.is_licensed('other', 'url2')), [True, False])
+        self.run_all(self.service.disable_website('other', 'url1'))
+        self.assertEqual(
+            self.run_all(self.service.is_licensed('other', 'url1')),
+            [False])
+        self.run_all(self.service.update_plan('other', Plan.INFINITE))
+        customer, = self.run_all(self.service.get_customer('other'))
+        self.assertEqual(customer.subscription.plan.plan_type, Plan.INFINITE)
+
+    def test_coalesce(self):
+        """Test identical concurrent lookups share one repository call."""
+        self.repository.release.clear()
+        self.loop.call_later(0.05, self.repository.release.set)
+        results = self.run_all(*[
+            self.service.is_licensed('email', 'url') for _ in range(1000)])
+        self.assertEqual(results, [False] * 1000)
+        self.assertEqual(self.repository.lookups, 1)
+        self.assertEqual(self.service.stats(),
+                         {'calls': 1, 'coalesced': 999, 'inflight': 0})
+
+    def test_cached_checks(self):
+        """Test license checks are answered from the entitlement cache."""
+        self.assertEqual(self.run_all(
+            self.service.is_licensed('email', 'url1'),
+            self.service.is_licensed('email', 'url2')), [False, False])
+        self.assertEqual(self.repository.lookups, 1)
+        self.assertEqual(
+            self.run_all(self.service.is_licensed('email', 'url1')),
+            [False])
+        self.assertEqual(self.repository.lookups, 1)
+        self.assertEqual(self.service.entitlements.stats()['hits'], 1)
+
+    def test_concurrent_mutations(self):
+        """Test concurrent mutations of a customer are all applied."""
+        repository = SQLiteRepository()
+        self.addCleanup(repository.close)
+        repository.save_customer(
+            Customer('name', 'email', 'password', Plan.PLUS))
+        service = LicenseService(repository, max_concurrency=4)
+        urls = ['url{0}'.format(i) for i in range(3)]
+        self.assertEqual(self.run_all(service.is_licensed('email', 'url0')),
+                         [False])
+        self.run_all(*[service.add_website('email', url) for url in urls] +
+                     [service.is_licensed('email', url) for url in urls])
+        customer = repository.get_customer('email')
+        self.assertEqual(customer.subscription.enabled_count(), 3)
+        self.assertEqual(
+            self.run_all(*[service.is_licensed('email', url)
+                           for url in urls]), [True] * 3)
+
+    def test_not_found(self):
+        """Test errors reach every coalesced caller."""
+        coroutines = [self.service.is_licensed('missing', 'url')
+                      for _ in range(3)]
+        with self.assertRaises(CustomerNotFound):
+            self.run_all(*coroutines)
@@ -0,0 +1,86 @@
+"""
+.. module: license.tests.services.test_analytics
+    :synopsis: Analytics tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+from datetime import datetime, timedelta
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.services.analytics import CustomerSnapshot, NO_PLAN
+
+
+class TestCustomerSnapshot(unittest.TestCase):
+    """Tests for customer snapshot."""
+
+    def setUp(self):
+        """Set up a small customer base."""
+        self.now = datetime(2020, 1, 1)
+        customers = [Customer('name', 'email', 'password')]
+        for index, (plan, urls) in enumerate([
+                (Plan.SINGLE, 1),
+                (Plan.SINGLE, 0),
+                (Plan.PLUS, 2),
+                (Plan.INFINITE, 10)]):
+            customer = Customer('name', 'email', 'password', plan)
+            customer.subscription.add_websites(
+                ['url{0}'.format(i) for i in range(urls)]
+            )
+            customer.subscription_renewal = self.now + timedelta(days=index)
+            customers.append(customer)
+        # Downgrades disable websites, restoring them can leave a customer
+        # over its allowance.
+        customers[1].subscription.restore_websites([('extra', True)])
+        self.snapshot = CustomerSnapshot.from_customers(customers)
+
+    def test_from_customers(self):
+        """Test snapshot columns."""
+        self.assertEqual(len(self.snapshot), 5)
+        self.assertEqual(list(self.snapshot.plan_codes),
+                         [NO_PLAN, 0, 0, 1, 2])
+        self.assertEqual(list(self.snapshot.enabled), [0, 2, 0, 2, 10])
+
+    def test_plan_mix(self):
+        """Test plan mix."""
+        self.assertEqual(dict(self.snapshot.plan_mix()), {
+            Plan.SINGLE: 2,
+            Plan.PLUS: 1,
+            Plan.INFINITE: 1,
+        })
+
+    def test_revenue(self):
+        """Test revenue."""
+        arr = (2 * Plan.PRICES[Plan.SINGLE] + Plan.PRICES[Plan.PLUS] +
+               Plan.PRICES[Plan.INFINITE])
+        revenue = self.snapshot.revenue()
+        self.assertAlmostEqual(revenue['arr'], arr)
+        self.assertAlmostEqual(revenue['mrr'], arr / 12.0)
+
+    def test_utilisation_histogram(self):
+        """Test utilisation histogram."""
+        self.assertEqual(
+            self.snapshot.utilisation_histogram(bins=(0.5, 1.0)),
+            [1, 1, 1]
+        )
+
+    def test_over_allowance(self):
+        """Test over allowance counts."""
+        self.assertEqual(dict(self.snapshot.over_allowance()), {
+            Plan.SINGLE: 1,
+            Plan.PLUS: 0,
+            Plan.INFINITE: 0,
+        })
+
+    def test_renewals_between(self):
+        """Test renewals between dates."""
+        self.assertEqual(
+            self.snapshot.renewals_between(self.now, self.now +
+                                           timedelta(days=2)),
+            2
+        )
+        self.assertEqual(
+            self.snapshot.renewals_between(self.now - timedelta(days=1),
+                                           self.now),
+            0
+        )
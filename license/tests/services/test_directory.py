@@ -0,0 +1,116 @@
+"""
+.. module: license.tests.services.test_directory
+    :synopsis: Customer directory tests.
+"""
+
+from __future__ import unicode_literals
+from datetime import datetime, timedelta
+import unittest
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.services.directory import CustomerDirectory
+
+
+class TestCustomerDirectory(unittest.TestCase):
+    """Tests for customer directory."""
+
+    def setUp(self):
+        """Set up a directory of ten customers."""
+        self.now = datetime(2020, 1, 1)
+        self.customers = []
+        for i in range(10):
+            customer = Customer('name', 'email{0}'.format(i), 'password',
+                                Plan.SINGLE if i % 2 else Plan.PLUS)
+            customer.subscription_renewal = self.now + timedelta(days=9 - i)
+            self.customers.append(customer)
+        self.customers.append(Customer('name', 'unsubscribed', 'password'))
+        self.directory = CustomerDirectory(reversed(self.customers))
+
+    def tearDown(self):
+        """Detach the directory."""
+        self.directory.detach()
+
+    def emails(self, customers):
+        """Return the emails of `customers`."""
+        return [customer.email for customer in customers]
+
+    def test_get(self):
+        """Test lookups by email."""
+        self.assertEqual(len(self.directory), 11)
+        self.assertIn('email3', self.directory)
+        self.assertIs(self.directory.get('email3'), self.customers[3])
+        self.assertIsNone(self.directory.get('missing'))
+        self.assertEqual(self.directory.count(Plan.SINGLE), 5)
+        self.assertEqual(
+            self.directory.count(CustomerDirectory.UNSUBSCRIBED), 1)
+
+    def test_pages(self):
+        """Test cursor pagination in email order."""
+        page, cursor = self.directory.page(limit=4)
+        self.assertEqual(self.emails(page),
+                         ['email0', 'email1', 'email2', 'email3'])
+        self.assertEqual(cursor, 'email3')
+        self.directory.remove('email4')
+        self.directory.add(Customer('name', 'email35', 'password'))
+        page, cursor = self.directory.page(cursor, limit=4)
+        self.assertEqual(self.emails(page),
+                         ['email35', 'email5', 'email6', 'email7'])
+        self.assertEqual(
+            [len(page) for page in self.directory.pages(limit=4)],
+            [4, 4, 3])
+        self.assertEqual(self.emails(self.directory)[-2:],
+                         ['email9', 'unsubscribed'])
+
+    def test_plan_pages(self):
+        """Test listing the customers of a plan."""
+        self.assertEqual(
+            self.emails(self.directory.iter_customers(
+                plan_type=Plan.SINGLE, page_size=2)),
+            ['email1', 'email3', 'email5', 'email7', 'email9'])
+        self.assertEqual(
+            self.emails(self.directory.iter_customers(
+                cursor='email4', plan_type=Plan.PLUS)),
+            ['email6', 'email8'])
+        self.assertEqual(
+            list(self.directory.iter_customers(plan_type=Plan.INFINITE)), [])
+
+    def test_signals(self):
+        """Test plan updates and subscriptions are reindexed."""
+        self.directory.attach()
+        self.customers[1].subscription.update_plan(Plan.INFINITE)
+        self.customers[0].subscription.change_plan(Plan.SINGLE)
+        self.customers[-1].subscribe(Plan.SINGLE)
+        Customer('name', 'other', 'password', Plan.SINGLE)
+        self.assertEqual(
+            self.emails(self.directory.iter_customers(
+                plan_type=Plan.INFINITE)), ['email1'])
+        self.assertEqual(
+            self.emails(self.directory.iter_customers(
+                plan_type=Plan.SINGLE)),
+            ['email0', 'email3', 'email5', 'email7', 'email9',
+             'unsubscribed'])
+        self.assertEqual(
+            self.directory.count(CustomerDirectory.UNSUBSCRIBED), 0)
+
+    def test_renewing(self):
+        """Test customers are listed by renewal date."""
+        renewing = self.directory.renewing(
+            self.now + timedelta(days=3), page_size=2)
+        self.assertEqual(self.emails(renewing),
+                         ['email9', 'email8', 'email7', 'email6'])
+        customer = self.customers[9]
+        customer.subscription_renewal = self.now + timedelta(days=5)
+        self.directory.reindex(customer)
+        renewing = self.directory.renewing(
+            self.now + timedelta(days=5), since=self.now + timedelta(days=4))
+        self.assertEqual(self.emails(renewing), ['email5', 'email4', 'email9'])
+
+    def test_remove_compacts(self):
+        """Test stale index entries are dropped."""
+        for i in range(200):
+            self.directory.add(Customer('name', 'bulk{0}'.format(i), 'pw'))
+        for i in range(200):
+            self.directory.remove('bulk{0}'.format(i))
+        self.assertEqual(len(self.directory), 11)
+        self.assertLess(len(self.directory._emails._keys), 100)
+        self.assertEqual(len(list(self.directory)), 11)
@@ -0,0 +1,117 @@
+"""
+.. module: license.tests.services.test_enforcement
+    :synopsis: Deferred downgrade enforcement tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+from license.models.plan import Plan
+from license.models.selection import KeepRecentlyUsed
+from license.models.subscription import Subscription
+from license.services.enforcement import (
+    CANCELLED,
+    DONE,
+    FAILED,
+    PENDING,
+    EnforcementJob,
+    EnforcementWorker,
+)
+from license.exceptions.subscription import SubscriptionPlanNotValid
+
+
+class TestEnforcement(unittest.TestCase):
+    """Tests for enforcement jobs and worker."""
+
+    def setUp(self):
+        """Set up a subscription with ten websites and a worker."""
+        self.subscription = Subscription(Plan.INFINITE, None,
+                                         thread_safe=True)
+        self.urls = ['url{0}'.format(i) for i in range(10)]
+        self.subscription.add_websites(self.urls)
+        self.worker = EnforcementWorker(batch_size=3)
+        self.addCleanup(self.worker.close)
+
+    def enabled(self):
+        """Return the urls of enabled websites."""
+        return [website.url
+                for website in self.subscription.enabled_websites()]
+
+    def test_step(self):
+        """Test jobs disable websites one batch at a time."""
+        job = EnforcementJob(self.subscription, Plan.PLUS,
+                             self.subscription.change_plan(Plan.PLUS)
+                             .excess_websites())
+        self.assertEqual(job.progress(), {
+            'plan': Plan.PLUS, 'state': PENDING, 'total': 7, 'disabled': 0,
+            'remaining': 7})
+        self.assertTrue(job.step(3))
+        self.assertEqual(job.progress()['disabled'], 3)
+        self.assertEqual(job.progress()['remaining'], 4)
+        self.subscription.remove_websites(['url7', 'url8', 'url9'])
+        self.assertFalse(job.step(3))
+        self.assertEqual(job.progress(), {
+            'plan': Plan.PLUS, 'state': DONE, 'total': 7, 'disabled': 4,
+            'remaining': 0})
+        self.assertEqual(self.enabled(), ['url0', 'url1', 'url2'])
+        self.assertTrue(EnforcementJob(self.subscription, Plan.PLUS,
+                                       []).done)
+
+    def test_downgrade(self):
+        """Test downgrades are committed at once and enforced later."""
+        policy = KeepRecentlyUsed({'url9': 2, 'url5': 1})
+        job = self.worker.downgrade(self.subscription, Plan.PLUS, policy)
+        self.assertEqual(self.subscription.plan.plan_type, Plan.PLUS)
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.state, DONE)
+        self.assertEqual(job.disabled, 7)
+        self.assertEqual(self.enabled(), ['url0', 'url5', 'url9'])
+        self.assertIsNone(self.worker.job(self.subscription))
+        self.assertEqual(self.worker.stats(),
+                         {'pending': 0, 'completed': 1, 'batches': 3})
+
+        upgrade = self.worker.downgrade(self.subscription, Plan.INFINITE)
+        self.assertTrue(upgrade.done)
+        with self.assertRaises(SubscriptionPlanNotValid):
+            self.worker.downgrade(self.subscription, 'new_plan')
+
+    def test_cancel(self):
+        """Test a new downgrade cancels the pending one."""
+        # Hold the subscription so the worker cannot make progress.
+        with self.subscription._lock:
+            first = self.worker.downgrade(self.subscription, Plan.PLUS)
+            second = self.worker.downgrade(self.subscription, Plan.SINGLE)
+            self.assertEqual(first.state, CANCELLED)
+            self.assertIs(self.worker.job(self.subscription), second)
+        self.assertTrue(second.wait(10))
+        self.assertEqual(second.state, DONE)
+        self.assertEqual(self.enabled(), ['url0'])
+        self.assertIs(self.worker.submit(first.cancel()), first)
+        self.worker.close()
+        with self.assertRaises(RuntimeError):
+            self.worker.submit(first)
+
+    def test_not_thread_safe(self):
+        """Test subscriptions without a lock are rejected."""
+        subscription = Subscription(Plan.INFINITE, None, thread_safe=False)
+        subscription.add_websites(self.urls)
+        with self.assertRaises(ValueError):
+            self.worker.downgrade(subscription, Plan.PLUS)
+        self.assertEqual(subscription.plan.plan_type, Plan.INFINITE)
+        with self.assertRaises(ValueError):
+            self.worker.submit(EnforcementJob(subscription, Plan.PLUS,
+                                              ['url9']))
+        self.assertIsNone(self.worker.job(subscription))
+
+    def test_failure(self):
+        """Test failing jobs are reported."""
+        subscription = Mock()
+        subscription.enforce_allowance.side_effect = ValueError('failure')
+        job = self.worker.submit(EnforcementJob(subscription, Plan.SINGLE,
+                                                ['url1']))
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.state, FAILED)
+        self.assertIsInstance(job.error, ValueError)
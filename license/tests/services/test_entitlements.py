@@ -0,0 +1,71 @@
+"""
+.. module: license.tests.services.test_entitlements
+    :synopsis: Entitlement cache tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.storage.repository import MemoryRepository
+from license.services.entitlements import EntitlementCache
+
+
+class TestEntitlementCache(unittest.TestCase):
+    """Tests for entitlement cache."""
+
+    def setUp(self):
+        """Set up a repository with two customers."""
+        self.repository = MemoryRepository()
+        self.customer = Customer('name', 'email1', 'password', Plan.PLUS)
+        self.customer.subscription.add_websites(['url1', 'url2'])
+        self.other = Customer('other', 'email2', 'password')
+        self.repository.save_customers([self.customer, self.other])
+        self.cache = EntitlementCache(self.repository.get_customer,
+                                      maxsize=1)
+
+    def test_is_licensed(self):
+        """Test licensed urls and cache hits."""
+        self.assertTrue(self.cache.is_licensed('email1', 'url1'))
+        self.assertTrue(self.cache.is_licensed('email1', 'url2'))
+        self.assertFalse(self.cache.is_licensed('email1', 'url3'))
+        self.assertEqual(self.cache.stats()['hits'], 2)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_invalidated_on_change(self):
+        """Test subscription changes invalidate the cached entitlements."""
+        subscription = self.customer.subscription
+        self.assertTrue(self.cache.is_licensed('email1', 'url1'))
+        subscription.disable_website('url1')
+        self.assertFalse(self.cache.is_licensed('email1', 'url1'))
+        subscription.add_website('url3')
+        self.assertTrue(self.cache.is_licensed('email1', 'url3'))
+        subscription.remove_website('url3')
+        self.assertFalse(self.cache.is_licensed('email1', 'url3'))
+        subscription.update_plan(Plan.SINGLE)
+        self.assertFalse(self.cache.is_licensed('email1', 'url1'))
+        self.assertEqual(self.cache.stats()['misses'], 5)
+
+    def test_unchanged_operations_keep_cache(self):
+        """Test operations that change nothing keep the entry."""
+        self.cache.is_licensed('email1', 'url1')
+        self.customer.subscription.add_website('url1')
+        self.customer.subscription.disable_website('not found')
+        self.cache.is_licensed('email1', 'url1')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_subscribe(self):
+        """Test subscribing invalidates the cached entitlements."""
+        self.assertFalse(self.cache.is_licensed('email2', 'url1'))
+        self.other.subscribe(Plan.SINGLE)
+        self.other.subscription.add_website('url1')
+        self.assertTrue(self.cache.is_licensed('email2', 'url1'))
+
+    def test_eviction_and_invalidate(self):
+        """Test size bound and explicit invalidation."""
+        self.cache.is_licensed('email1', 'url1')
+        self.cache.is_licensed('email2', 'url1')
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual(self.cache.stats()['size'], 1)
+        self.cache.invalidate('email2')
+        self.assertEqual(self.cache.stats()['size'], 0)
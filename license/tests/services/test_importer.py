@@ -0,0 +1,147 @@
+"""
+.. module: license.tests.services.test_importer
+    :synopsis: Bulk importer tests.
+"""
+
+from __future__ import unicode_literals
+import csv
+import io
+import json
+import unittest
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.storage.sqlite import SQLiteRepository
+from license.services.importer import BulkImporter
+
+
+CSV = """email,name,password,plan,url
+a@example.com,A,secret,Single,https://a1
+a@example.com,A,secret,Single,https://a2
+b@example.com,B,secret,Plus,https://b1
+b@example.com,B,secret,Plus,https://b2
+b@example.com,B,secret,Infinite,https://b3
+,C,secret,Plus,https://c1
+d@example.com,D,secret,Gold,https://d1
+e@example.com,E,secret,,https://e1
+"""
+
+
+class TestBulkImporter(unittest.TestCase):
+    """Tests for bulk importer."""
+
+    def setUp(self):
+        """Set up an importer over a SQLite repository."""
+        self.repository = SQLiteRepository()
+        self.addCleanup(self.repository.close)
+        self.importer = BulkImporter(self.repository, batch_size=2)
+
+    def rejects(self, stream):
+        """Return rejected rows as ``(line, reason)``."""
+        rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+        return [(int(row['line']), row['reason']) for row in rows]
+
+    def test_import_csv(self):
+        """Test rows are grouped, limited and rejected."""
+        rejects = io.StringIO()
+        stats = self.importer.import_csv(io.StringIO(CSV), rejects)
+        self.assertEqual(stats, {'rows': 8, 'customers': 3, 'added': 3,
+                                 'existing': 0, 'rejected': 5})
+        self.assertEqual(self.rejects(rejects), [
+            (3, BulkImporter.LIMIT_REACHED),
+            (6, BulkImporter.PLAN_MISMATCH),
+            (7, BulkImporter.MISSING_EMAIL),
+            (8, BulkImporter.INVALID_PLAN),
+            (9, BulkImporter.NO_SUBSCRIPTION),
+        ])
+        customer = self.repository.get_customer('b@example.com')
+        self.assertEqual(customer.subscription.plan.plan_type, Plan.PLUS)
+        self.assertEqual(
+            [website.url for website in customer.subscription.websites()],
+            ['https://b1', 'https://b2'])
+        self.assertTrue(customer.check_password('secret'))
+        customer = self.repository.get_customer('e@example.com')
+        self.assertIsNone(customer.subscription)
+
+    def test_import_existing(self):
+        """Test existing customers are completed and re-runs are safe."""
+        customer = Customer('A', 'a@example.com', 'secret', Plan.SINGLE)
+        customer.subscription.add_website('https://a1')
+        self.repository.save_customer(customer)
+        stats = self.importer.import_csv(io.StringIO(CSV))
+        self.assertEqual(stats['existing'], 1)
+        self.assertEqual(stats['added'], 2)
+        stats = self.importer.import_csv(io.StringIO(CSV))
+        self.assertEqual(stats['added'], 0)
+        self.assertEqual(stats['existing'], 3)
+        self.assertEqual(len(self.repository), 3)
+
+    def test_import_large_group(self):
+        """Test groups larger than a batch are imported a chunk at a time
+        and saved once over."""
+        rows = [(line, {'email': 'a@example.com', 'plan': Plan.INFINITE,
+                        'url': 'https://a{0}'.format(line)})
+                for line in range(1, 6)]
+        rows.append((6, {'email': 'b@example.com', 'plan': Plan.SINGLE,
+                         'url': 'https://b1'}))
+        rows.append((7, {'email': 'a@example.com', 'url': 'https://a7'}))
+        sizes = []
+        import_batch = self.importer._import_batch
+
+        def record(batch):
+            sizes.append(sum(len(group) for _, group in batch))
+            import_batch(batch)
+
+        with patch.object(self.importer, '_import_batch',
+                          side_effect=record), \
+                patch.object(self.repository, 'save_customers',
+                             wraps=self.repository.save_customers) as save:
+            stats = self.importer.import_rows(rows)
+        self.assertEqual(sizes, [2, 2, 2, 1])
+        self.assertEqual(stats, {'rows': 7, 'customers': 2, 'added': 7,
+                                 'existing': 0, 'rejected': 0})
+        saved = [sorted(customer.email for customer in call[0][0])
+                 for call in save.call_args_list]
+        self.assertEqual(saved, [['a@example.com'], ['b@example.com'],
+                                 ['a@example.com']])
+        customer = self.repository.get_customer('a@example.com')
+        self.assertEqual(customer.subscription.enabled_count(), 6)
+
+    def test_import_encoded_passwords(self):
+        """Test passwords are hashed unless declared encoded."""
+        encoded = Customer('A', 'a@example.com', 'secret').password
+        rows = [(1, {'email': 'a@example.com', 'password': encoded,
+                     'plan': Plan.SINGLE, 'url': 'https://a1'})]
+        self.importer.import_rows(rows)
+        customer = self.repository.get_customer('a@example.com')
+        self.assertNotEqual(customer.password, encoded)
+        self.assertTrue(customer.check_password(encoded))
+        self.repository.delete_customer('a@example.com')
+        BulkImporter(self.repository, encoded_passwords=True).import_rows(
+            rows)
+        customer = self.repository.get_customer('a@example.com')
+        self.assertEqual(customer.password, encoded)
+        self.assertTrue(customer.check_password('secret'))
+
+    def test_import_jsonl(self):
+        """Test JSON lines, blank and unreadable lines."""
+        lines = [
+            json.dumps({'email': 'a@example.com', 'plan': Plan.SINGLE,
+                        'url': 'https://a1'}),
+            '',
+            'not json',
+            json.dumps(['a list']),
+            json.dumps({'email': 'a@example.com', 'url': 'https://a2'}),
+        ]
+        rejects = io.StringIO()
+        stats = self.importer.import_jsonl(
+            io.StringIO('\n'.join(lines)), rejects)
+        self.assertEqual(stats['added'], 1)
+        self.assertEqual(self.rejects(rejects), [
+            (3, BulkImporter.INVALID_ROW),
+            (4, BulkImporter.INVALID_ROW),
+            (5, BulkImporter.LIMIT_REACHED),
+        ])
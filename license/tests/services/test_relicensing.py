@@ -0,0 +1,70 @@
+"""
+.. module: license.tests.services.test_relicensing
+    :synopsis: Relicensing engine tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.services.relicensing import RelicensingEngine
+
+
+class TestRelicensingEngine(unittest.TestCase):
+    """Tests for relicensing engine."""
+
+    def setUp(self):
+        """Set up customers on every plan."""
+        self.customers = []
+        for index, plan in enumerate(
+                [Plan.INFINITE, Plan.PLUS, Plan.SINGLE, Plan.INFINITE]):
+            customer = Customer('name', 'email{0}'.format(index), 'password',
+                                plan)
+            customer.subscription.add_websites(
+                ['url{0}'.format(i) for i in range(Plan.ALLOWANCE[plan])])
+            self.customers.append(customer)
+        # Infinite customers start without websites.
+        self.customers[0].subscription.add_websites(['url1', 'url2', 'url3'])
+        self.customers[0].subscription.disable_website('url1')
+        self.customers.append(Customer('name', 'nosubscription', 'password'))
+
+    def check_downgrade(self, engine):
+        """Downgrade everyone to Single with `engine`."""
+        report = engine.relicense(self.customers, Plan.SINGLE)
+        self.assertEqual(report.stats(), {
+            'changed': 3, 'unchanged': 1, 'skipped': 1, 'errors': 0,
+            'disabled': 3,
+        })
+        self.assertEqual(report.changed['email0'],
+                         (Plan.SINGLE, ['url3']))
+        for customer in self.customers[:3]:
+            self.assertEqual(customer.subscription.plan.plan_type,
+                             Plan.SINGLE)
+        self.assertEqual(
+            [website.url for website in
+             self.customers[0].subscription.enabled_websites()],
+            ['url2'])
+        self.assertEqual(
+            self.customers[1].subscription.enabled_count(), 1)
+
+    def test_relicense_inline(self):
+        """Test a downgrade processed in this process."""
+        self.check_downgrade(RelicensingEngine(processes=1, shard_size=2))
+
+    def test_relicense_pool(self):
+        """Test a downgrade processed by a process pool."""
+        self.check_downgrade(RelicensingEngine(processes=2, shard_size=1))
+
+    def test_plan_mapping_and_errors(self):
+        """Test mapped plans and invalid plans."""
+        engine = RelicensingEngine(processes=1)
+        report = engine.relicense(
+            self.customers, {Plan.PLUS: Plan.INFINITE, Plan.SINGLE: 'Gold'})
+        self.assertEqual(list(report.changed), ['email1'])
+        self.assertEqual(list(report.errors), ['email2'])
+        self.assertIn('SubscriptionPlanNotValid', report.errors['email2'])
+        self.assertEqual(report.skipped, 3)
+        self.assertEqual(self.customers[1].subscription.plan.plan_type,
+                         Plan.INFINITE)
+        self.assertEqual(self.customers[2].subscription.plan.plan_type,
+                         Plan.SINGLE)
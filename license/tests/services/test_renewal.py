@@ -0,0 +1,73 @@
+"""
+.. module: license.tests.services.test_renewal
+    :synopsis: Renewal scheduler tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+from datetime import datetime, timedelta
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.services.renewal import RenewalScheduler
+
+
+class TestRenewalScheduler(unittest.TestCase):
+    """Tests for renewal scheduler."""
+
+    def setUp(self):
+        """Set up customers renewing one day apart."""
+        self.now = datetime(2020, 1, 1)
+        self.customers = []
+        for day in (3, 1, 2, 5, 4):
+            customer = Customer('name', 'email{0}'.format(day), 'password',
+                                Plan.SINGLE)
+            customer.subscription_renewal = self.now + timedelta(days=day)
+            self.customers.append(customer)
+        self.scheduler = RenewalScheduler(self.customers)
+
+    def emails(self, customers):
+        """Return emails of `customers`."""
+        return [customer.email for customer in customers]
+
+    def test_schedule(self):
+        """Test schedule customers."""
+        self.assertEqual(len(self.scheduler), 5)
+        self.assertEqual(self.scheduler.next_renewal(),
+                         self.now + timedelta(days=1))
+        unsubscribed = Customer('name', 'email', 'password')
+        self.scheduler.schedule(unsubscribed)
+        self.assertNotIn(unsubscribed, self.scheduler)
+
+    def test_peek_due(self):
+        """Test peek due customers."""
+        until = self.now + timedelta(days=3, hours=12)
+        due = self.scheduler.peek_due(until)
+        self.assertEqual(self.emails(due), ['email1', 'email2', 'email3'])
+        self.assertEqual(len(self.scheduler), 5)
+        self.assertEqual(self.scheduler.peek_due(self.now), [])
+
+    def test_due(self):
+        """Test due customers are streamed and unscheduled."""
+        until = self.now + timedelta(days=2)
+        self.assertEqual(self.emails(self.scheduler.due(until)),
+                         ['email1', 'email2'])
+        self.assertEqual(len(self.scheduler), 3)
+        self.assertEqual(list(self.scheduler.due(until)), [])
+
+    def test_reschedule(self):
+        """Test rescheduling moves a customer."""
+        customer = self.customers[1]
+        customer.subscription_renewal = self.now + timedelta(days=10)
+        self.scheduler.schedule(customer)
+        self.assertEqual(len(self.scheduler), 5)
+        self.assertEqual(self.scheduler.next_renewal(),
+                         self.now + timedelta(days=2))
+        due = self.scheduler.due(self.now + timedelta(days=30))
+        self.assertEqual(self.emails(due)[-1], 'email1')
+
+    def test_unschedule(self):
+        """Test unschedule a customer."""
+        self.scheduler.unschedule(self.customers[1])
+        self.assertNotIn(self.customers[1], self.scheduler)
+        due = self.scheduler.peek_due(self.now + timedelta(days=2))
+        self.assertEqual(self.emails(due), ['email2'])
@@ -0,0 +1,221 @@
+"""
+.. module: license.tests.storage.test_eventlog
+    :synopsis: Event log tests.
+"""
+
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.models.selection import KeepPinned
+from license.models.subscription import Subscription
+from license.storage.eventlog import EventLog
+
+
+class TestEventLog(unittest.TestCase):
+    """Tests for event log."""
+
+    def setUp(self):
+        """Set up a log directory."""
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def open(self, **kwargs):
+        """Return an attached event log over the directory."""
+        log = EventLog(self.directory, **kwargs)
+        self.addCleanup(log.close)
+        return log.attach()
+
+    def state(self, customers):
+        """Return comparable state of `customers`."""
+        return sorted(
+            (customer.email, customer.name, customer.password,
+             customer.subscription_renewal,
+             customer.subscription.plan.plan_type,
+             [(website.url, website.enabled)
+              for website in customer.subscription.websites()])
+            for customer in customers)
+
+    def mutate(self):
+        """Apply mutations and return the customers."""
+        single = Customer('single', 'single@example.com', 'password',
+                          Plan.SINGLE)
+        single.subscription.add_website('url1')
+        infinite = Customer('infinite', 'infinite@example.com', 'password',
+                            Plan.INFINITE)
+        infinite.subscription.add_websites(['url1', 'url2', 'url3'])
+        infinite.subscription.disable_websites(['url2'])
+        infinite.subscription.remove_website('url1')
+        infinite.subscription.update_plan(Plan.SINGLE)
+        single.subscription.update_plan(Plan.PLUS)
+        single.subscription.add_website('url2')
+        return [single, infinite]
+
+    def files(self):
+        """Return the files in the log directory."""
+        return sorted(os.listdir(self.directory))
+
+    def test_replay(self):
+        """Test customers are recovered from the log alone."""
+        log = self.open(checkpoint_every=None)
+        customers = self.mutate()
+        log.close()
+        self.assertEqual(self.files(), ['events-{0:020d}.log'.format(0)])
+        recovered = self.open()
+        self.assertEqual(recovered.replayed, 11)
+        self.assertEqual(self.state(recovered.customers.values()),
+                         self.state(customers))
+
+    def test_replay_deferred_downgrade(self):
+        """Test downgrades keeping chosen websites replay the same."""
+        log = self.open(checkpoint_every=None)
+        customer = Customer('name', 'email@example.com', 'password',
+                            Plan.INFINITE)
+        subscription = customer.subscription
+        subscription.add_websites(['url1', 'url2', 'url3', 'url4'])
+        subscription.update_plan(Plan.PLUS, KeepPinned(['url4']))
+        subscription.change_plan(Plan.SINGLE)
+        subscription.enforce_allowance(['url2', 'url4'])
+        log.close()
+        recovered = self.open()
+        self.assertEqual(self.state(recovered.customers.values()),
+                         self.state([customer]))
+        self.assertEqual(
+            [w.url for w in subscription.enabled_websites()], ['url1'])
+
+    def test_compaction(self):
+        """Test recovery from a snapshot and the events after it."""
+        log = self.open(checkpoint_every=4, sync_every=1)
+        customers = self.mutate()
+        log.close()
+        self.assertEqual(self.files(), [
+            'applied-{0:020d}.json'.format(8),
+            'events-{0:020d}.log'.format(8),
+            'snapshot-{0:020d}'.format(8),
+        ])
+        recovered = self.open()
+        self.assertEqual(recovered.checkpoint, 8)
+        self.assertLessEqual(recovered.replayed, 3)
+        self.assertEqual(self.state(recovered.customers.values()),
+                         self.state(customers))
+        recovered.customers['single@example.com'].subscription.add_website(
+            'url3')
+        self.assertEqual(recovered.seq, 12)
+
+    @patch.object(Subscription, 'THREAD_SAFE', True)
+    def test_compaction_concurrent(self):
+        """Test checkpoints do not block threads mutating customers."""
+        log = self.open(checkpoint_every=50, sync_every=1000)
+        customers = [Customer('name', 'email{0}'.format(i), 'password',
+                              Plan.INFINITE) for i in range(2)]
+
+        def add(customer):
+            for i in range(300):
+                customer.subscription.add_website('url{0}'.format(i))
+                if i % 3 == 0:
+                    customer.subscription.remove_website(
+                        'url{0}'.format(i // 2))
+
+        threads = [threading.Thread(target=add, args=(customer,))
+                   for customer in customers]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+            self.assertFalse(thread.is_alive())
+        log.close()
+        recovered = self.open()
+        self.assertGreater(recovered.checkpoint, 0)
+        self.assertEqual(self.state(recovered.customers.values()),
+                         self.state(customers))
+
+    def test_torn_write(self):
+        """Test a partially written event is discarded."""
+        log = self.open(checkpoint_every=None)
+        customers = self.mutate()
+        log.close()
+        path = os.path.join(self.directory, self.files()[0])
+        with open(path, 'ab') as segment:
+            segment.write(b'{"email": "single@example.com", "eve')
+        recovered = self.open()
+        self.assertEqual(self.state(recovered.customers.values()),
+                         self.state(customers))
+        customer = recovered.customers['single@example.com']
+        customer.subscription.add_website('url3')
+        recovered.close()
+        self.assertIn('url3', self.open().customers[
+            'single@example.com'].subscription.entitlements())
+
+    def test_replay_after_crashed_compaction(self):
+        """Test events covered by a snapshot are not applied twice."""
+        log = self.open(checkpoint_every=None)
+        customers = self.mutate()
+        segment = os.path.join(self.directory, self.files()[0])
+        with open(segment, 'rb') as events:
+            kept = events.read()
+        log.compact()
+        log.close()
+        # Crash before the old segment was removed.
+        with open(segment, 'wb') as events:
+            events.write(kept)
+        recovered = self.open()
+        self.assertEqual(recovered.replayed, 0)
+        self.assertEqual(self.state(recovered.customers.values()),
+                         self.state(customers))
+
+    def test_snapshot_after_checkpoint(self):
+        """Test events already in a snapshot are not applied twice."""
+        log = self.open(checkpoint_every=None)
+        customer = Customer('plus', 'plus@example.com', 'password',
+                            Plan.PLUS)
+        customer.subscription.add_websites(['a', 'b', 'c'])
+        with log._lock:
+            checkpoint = log._rotate()
+        customer.subscription.update_plan(Plan.SINGLE)
+        customer.subscription.update_plan(Plan.PLUS)
+        customer.subscription.add_website('d')
+        # Snapshot taken after the changes logged past the checkpoint.
+        log._write_checkpoint(checkpoint, [customer])
+        log.close()
+        recovered = self.open()
+        self.assertEqual(self.state(recovered.customers.values()),
+                         self.state([customer]))
+        self.assertEqual(recovered.replayed, 0)
+        recovered.customers['plus@example.com'].subscription.remove_website(
+            'a')
+        recovered.close()
+        self.assertEqual(
+            self.open().customers['plus@example.com'].subscription
+            .entitlements(), frozenset(['d']))
+
+    def test_replay_before_snapshot(self):
+        """Test a crash before the snapshot of a new segment is written."""
+        log = self.open(checkpoint_every=None)
+        customers = self.mutate()
+        segment = os.path.join(self.directory, self.files()[0])
+        with open(segment, 'rb') as events:
+            kept = events.read()
+        log.compact()
+        customers[0].subscription.add_website('url3')
+        log.close()
+        # Crash after the rotation, before the snapshot was written.
+        os.remove(os.path.join(self.directory, self.files()[-1]))
+        with open(segment, 'wb') as events:
+            events.write(kept)
+        recovered = self.open()
+        self.assertEqual(self.state(recovered.customers.values()),
+                         self.state(customers))
+        recovered.customers['single@example.com'].subscription.remove_website(
+            'url3')
+        recovered.close()
+        self.assertNotIn('url3', self.open().customers[
+            'single@example.com'].subscription.entitlements())
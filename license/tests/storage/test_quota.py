@@ -0,0 +1,125 @@
+"""
+.. module: license.tests.storage.test_quota
+    :synopsis: Quota tests.
+"""
+
+from __future__ import unicode_literals
+import functools
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.models.subscription import Subscription
+from license.storage.quota import LocalQuota, SQLiteQuota
+from license.exceptions.subscription import SubscriptionWebsiteLimitReached
+
+
+def _reserve(path, attempts):
+    """Reserve one slot `attempts` times, return the slots granted."""
+    quota = SQLiteQuota(path)
+    try:
+        return sum(quota.reserve('email', 1, 50) for _ in range(attempts))
+    finally:
+        quota.close()
+
+
+class QuotaTestMixin(object):
+    """Tests shared by every quota."""
+
+    def test_reserve(self):
+        """Test reservations stop at the allowance."""
+        self.assertEqual(self.quota.reserve('email', 2, 3), 2)
+        self.assertEqual(self.quota.reserve('email', 2, 3), 1)
+        self.assertEqual(self.quota.reserve('email', 1, 3), 0)
+        self.assertEqual(self.quota.usage('email'), 3)
+        self.assertEqual(self.quota.usage('other'), 0)
+        self.assertEqual(self.quota.reserve('email', 5, -1), 5)
+        self.assertEqual(self.quota.usage('email'), 8)
+
+    def test_release(self):
+        """Test released slots can be reserved again."""
+        self.quota.reserve('email', 3, 3)
+        self.quota.release('email', 2)
+        self.assertEqual(self.quota.usage('email'), 1)
+        self.assertEqual(self.quota.reserve('email', 3, 3), 2)
+        self.quota.release('email', 10).release('missing')
+        self.assertEqual(self.quota.usage('email'), 0)
+        self.assertEqual(self.quota.reset('email', 2).usage('email'), 2)
+
+    def test_floor(self):
+        """Test usage is raised to the slots known to be in use."""
+        self.assertEqual(self.quota.reserve('email', 1, 3, floor=3), 0)
+        self.assertEqual(self.quota.usage('email'), 3)
+        self.quota.release('email', 2)
+        self.assertEqual(self.quota.reserve('email', 2, 3, floor=2), 1)
+        self.assertEqual(self.quota.usage('email'), 3)
+
+    def test_restored_subscription(self):
+        """Test subscriptions loaded from storage cannot exceed their
+        allowance."""
+        customer = Customer('name', 'email', 'password', Plan.PLUS)
+        customer.subscription.restore_websites(
+            [('url1', True), ('url2', True), ('url3', True)])
+        with self.assertRaises(SubscriptionWebsiteLimitReached):
+            customer.subscription.add_website('url4')
+        report = customer.subscription.add_websites(['url4', 'url5'])
+        self.assertEqual(set(report.values()), {Subscription.LIMIT_REACHED})
+        self.assertEqual(customer.subscription.enabled_count(), 3)
+        self.assertEqual(self.quota.usage('email'), 3)
+
+    def test_subscriptions(self):
+        """Test allowance is enforced across subscriptions of a customer."""
+        first = Customer('name', 'email', 'password', Plan.PLUS)
+        second = Customer('name', 'email', 'password', Plan.PLUS)
+        first.subscription.add_website('url1')
+        first.subscription.add_website('http://url1/')
+        report = second.subscription.add_websites(['url2', 'url3', 'url4'])
+        self.assertEqual(list(report.values()), [
+            Subscription.ADDED, Subscription.ADDED,
+            Subscription.LIMIT_REACHED])
+        with self.assertRaises(SubscriptionWebsiteLimitReached):
+            first.subscription.add_website('url5')
+        first.subscription.disable_website('url1')
+        first.subscription.add_website('url5')
+        second.subscription.remove_websites(['url2', 'url4'])
+        second.subscription.update_plan(Plan.SINGLE)
+        self.assertEqual(self.quota.usage('email'), 2)
+
+
+class TestLocalQuota(QuotaTestMixin, unittest.TestCase):
+    """Tests for local quota."""
+
+    def setUp(self):
+        """Set up a quota used by subscriptions."""
+        self.quota = LocalQuota()
+        Subscription.QUOTA = self.quota
+        self.addCleanup(setattr, Subscription, 'QUOTA', None)
+
+
+class TestSQLiteQuota(QuotaTestMixin, unittest.TestCase):
+    """Tests for SQLite quota."""
+
+    def setUp(self):
+        """Set up a quota used by subscriptions."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'quota.db')
+        self.quota = SQLiteQuota(self.path)
+        self.addCleanup(self.quota.close)
+        Subscription.QUOTA = self.quota
+        self.addCleanup(setattr, Subscription, 'QUOTA', None)
+
+    def test_processes(self):
+        """Test concurrent processes never overbook."""
+        pool = multiprocessing.Pool(4)
+        try:
+            granted = pool.map(functools.partial(_reserve, self.path),
+                               [20] * 4)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(sum(granted), 50)
+        self.assertEqual(self.quota.usage('email'), 50)
@@ -0,0 +1,113 @@
+"""
+.. module: license.tests.storage.test_snapshot
+    :synopsis: Binary snapshot tests.
+"""
+
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.storage.snapshot import SnapshotReader, write_snapshot
+from license.exceptions.storage import CustomerNotFound, SnapshotFormatError
+
+
+class TestSnapshot(unittest.TestCase):
+    """Tests for binary snapshots."""
+
+    def setUp(self):
+        """Set up customers and a snapshot path."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'customers.snapshot')
+        self.customers = [
+            Customer('name', 'single@example.com', 'password', Plan.SINGLE),
+            Customer('näme', 'none@example.com', 'pässword'),
+            Customer('name', 'infinite@example.com', 'password',
+                     Plan.INFINITE),
+        ]
+        self.customers[0].subscription.add_website('https://single')
+        self.customers[0].subscription_renewal = datetime(
+            2030, 1, 2, 3, 4, 5, 678901)
+        infinite = self.customers[2].subscription
+        infinite.add_websites(
+            ['https://{0}.example.com'.format(i) for i in range(20)])
+        infinite.disable_websites(['https://3.example.com',
+                                   'https://8.example.com'])
+
+    def open(self):
+        """Return a reader over the snapshot."""
+        reader = SnapshotReader(self.path)
+        self.addCleanup(reader.close)
+        return reader
+
+    def assertCustomerEqual(self, loaded, customer):
+        """Assert `loaded` has the state of `customer`."""
+        self.assertEqual(
+            (loaded.name, loaded.email, loaded.password,
+             loaded.subscription_renewal),
+            (customer.name, customer.email, customer.password,
+             customer.subscription_renewal))
+        if customer.subscription is None:
+            self.assertIsNone(loaded.subscription)
+            return
+        self.assertEqual(loaded.subscription.plan.plan_type,
+                         customer.subscription.plan.plan_type)
+        self.assertEqual(
+            [(website.url, website.enabled, website.customer)
+             for website in loaded.subscription.websites()],
+            [(website.url, website.enabled, loaded)
+             for website in customer.subscription.websites()])
+
+    def test_round_trip(self):
+        """Test every customer is read back as written."""
+        self.assertEqual(write_snapshot(self.customers, self.path), 3)
+        reader = self.open()
+        self.assertEqual(len(reader), 3)
+        for loaded, customer in zip(reader.iter_customers(), self.customers):
+            self.assertCustomerEqual(loaded, customer)
+
+    def test_durable(self):
+        """Test the snapshot and its directory are fsynced."""
+        with patch('license.storage.snapshot.os.fsync') as fsync:
+            write_snapshot(self.customers, self.path)
+        self.assertEqual(fsync.call_count, 2)
+        self.assertEqual(len(self.open()), 3)
+
+    def test_get_customer(self):
+        """Test lookups by email and lazy subscriptions."""
+        write_snapshot(iter(self.customers), self.path)
+        reader = self.open()
+        customer = reader.get_customer('infinite@example.com',
+                                       load_subscription=False)
+        self.assertIsNone(customer.subscription)
+        reader.load_subscription(customer)
+        self.assertCustomerEqual(customer, self.customers[2])
+        with self.assertRaises(CustomerNotFound):
+            reader.get_customer('missing@example.com')
+
+    def test_empty(self):
+        """Test a snapshot without customers."""
+        write_snapshot([], self.path)
+        self.assertEqual(list(self.open().iter_customers()), [])
+
+    def test_format_errors(self):
+        """Test files that are not supported snapshots."""
+        for data in (b'', b'not a snapshot', b'\x00' * 100):
+            with open(self.path, 'wb') as snapshot:
+                snapshot.write(data)
+            with self.assertRaises(SnapshotFormatError):
+                SnapshotReader(self.path)
+        write_snapshot(self.customers, self.path)
+        with open(self.path, 'r+b') as snapshot:
+            snapshot.seek(8)
+            snapshot.write(b'\xff\xff')
+        with self.assertRaises(SnapshotFormatError):
+            SnapshotReader(self.path)
@@ -0,0 +1,163 @@
+"""
+.. module: license.tests.storage.test_sqlite
+    :synopsis: SQLite repository tests.
+"""
+
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import unittest
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.storage.sqlite import SQLiteRepository
+from license.exceptions.storage import CustomerNotFound
+from license.exceptions.subscription import SubscriptionExistent
+
+
+class TestSQLiteRepository(unittest.TestCase):
+    """Tests for SQLite repository."""
+
+    def setUp(self):
+        """Set up a repository with two customers."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'license.db')
+        self.repository = SQLiteRepository(self.path)
+        self.customer = Customer('name', 'email1', 'password', Plan.PLUS)
+        self.customer.subscription.add_websites(['url1', 'url2', 'url3'])
+        self.customer.subscription.disable_website('url2')
+        self.other = Customer('other', 'email2', 'password')
+        self.repository.save_customers([self.customer, self.other])
+
+    def tearDown(self):
+        """Remove the database."""
+        self.repository.close()
+        shutil.rmtree(self.directory)
+
+    def assertSameCustomer(self, loaded, customer):
+        """Assert `loaded` has the same state as `customer`."""
+        self.assertEqual(
+            (loaded.name, loaded.email, loaded.password,
+             loaded.subscription_renewal),
+            (customer.name, customer.email, customer.password,
+             customer.subscription_renewal)
+        )
+        if customer.subscription is None:
+            self.assertIsNone(loaded.subscription)
+            return
+        self.assertEqual(
+            loaded.subscription.plan.plan_type,
+            customer.subscription.plan.plan_type
+        )
+        self.assertEqual(
+            [(w.url, w.enabled) for w in loaded.subscription.websites()],
+            [(w.url, w.enabled) for w in customer.subscription.websites()]
+        )
+        self.assertIs(loaded.subscription.user, loaded)
+
+    def test_get_customer(self):
+        """Test get a customer."""
+        repository = SQLiteRepository(self.path)
+        self.assertSameCustomer(
+            repository.get_customer('email1'),
+            self.customer
+        )
+        self.assertSameCustomer(repository.get_customer('email2'), self.other)
+        repository.close()
+
+    def test_get_customer_not_found(self):
+        """Test get a customer that does not exist."""
+        with self.assertRaises(CustomerNotFound):
+            self.repository.get_customer('not found')
+
+    def test_load_subscription(self):
+        """Test subscriptions are loaded on demand."""
+        customer = self.repository.get_customer(
+            'email1',
+            load_subscription=False
+        )
+        self.assertIsNone(customer.subscription)
+        self.repository.load_subscription(customer)
+        self.assertSameCustomer(customer, self.customer)
+
+    def test_save_customer_not_loaded(self):
+        """Test saving a customer read without its subscription keeps it."""
+        customer = self.repository.get_customer(
+            'email1',
+            load_subscription=False
+        )
+        customer.set_password('new password')
+        self.repository.save_customer(customer)
+        loaded = self.repository.get_customer('email1')
+        self.assertTrue(loaded.check_password('new password'))
+        loaded.password = self.customer.password
+        self.assertSameCustomer(loaded, self.customer)
+        customer = next(
+            self.repository.iter_customers(load_subscriptions=False))
+        self.repository.load_subscription(customer)
+        customer.subscription.update_plan(Plan.SINGLE)
+        self.repository.save_customer(customer)
+        customer = self.repository.get_customer('email1')
+        self.assertEqual(customer.subscription.plan.plan_type, Plan.SINGLE)
+
+    def test_subscribe_not_loaded(self):
+        """Test customers read without their subscription cannot replace
+        it."""
+        customer = self.repository.get_customer(
+            'email1',
+            load_subscription=False
+        )
+        with self.assertRaises(SubscriptionExistent):
+            customer.subscribe(Plan.SINGLE)
+        self.repository.save_customer(customer)
+        self.assertSameCustomer(self.repository.get_customer('email1'),
+                                self.customer)
+        other = self.repository.get_customer(
+            'email2',
+            load_subscription=False
+        )
+        self.repository.save_customer(other.subscribe(Plan.SINGLE))
+        customer = self.repository.get_customer('email2')
+        self.assertEqual(customer.subscription.plan.plan_type, Plan.SINGLE)
+
+    def test_copy_not_loaded(self):
+        """Test customers read without their subscription are copied to
+        another repository."""
+        copy = SQLiteRepository()
+        self.addCleanup(copy.close)
+        copy.save_customers(
+            self.repository.iter_customers(load_subscriptions=False))
+        self.assertEqual(len(copy), 2)
+        self.assertSameCustomer(copy.get_customer('email1'), self.customer)
+        self.assertSameCustomer(copy.get_customer('email2'), self.other)
+
+    def test_save_customer_updates(self):
+        """Test saving a customer again replaces its state."""
+        self.customer.subscription.remove_website('url1')
+        self.customer.subscription.update_plan(Plan.SINGLE)
+        self.repository.save_customer(self.customer)
+        self.assertEqual(len(self.repository), 2)
+        self.assertSameCustomer(
+            self.repository.get_customer('email1'),
+            self.customer
+        )
+
+    def test_iter_customers(self):
+        """Test iterate over customers."""
+        self.repository.fetch_size = 1
+        customers = list(self.repository.iter_customers())
+        self.assertEqual(len(customers), 2)
+        self.assertSameCustomer(customers[0], self.customer)
+        self.assertSameCustomer(customers[1], self.other)
+        customers = list(
+            self.repository.iter_customers(load_subscriptions=False)
+        )
+        self.assertEqual([c.email for c in customers], ['email1', 'email2'])
+        self.assertIsNone(customers[0].subscription)
+
+    def test_delete_customer(self):
+        """Test delete a customer."""
+        self.repository.delete_customer('email1')
+        self.assertEqual(len(self.repository), 1)
+        with self.assertRaises(CustomerNotFound):
+            self.repository.get_customer('email1')
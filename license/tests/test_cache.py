@@ -0,0 +1,48 @@
+"""
+.. module: license.tests.test_cache
+    :synopsis: LRU cache tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+from license.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    """Tests for LRU cache."""
+
+    def test_get_set(self):
+        """Test get and set count hits and misses."""
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('b', 0), 0)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_eviction(self):
+        """Test the least recently used entry is evicted."""
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_pop_clear(self):
+        """Test pop and clear."""
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.pop('a'))
+        cache.set('b', 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_maxsize(self):
+        """Test maxsize must be positive."""
+        with self.assertRaises(ValueError):
+            LRUCache(0)
@@ -0,0 +1,102 @@
+"""
+.. module: license.tests.test_instrumentation
+    :synopsis: Instrumentation tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+from license import instrumentation
+from license.models.customer import Customer
+from license.models.plan import Plan
+from license.models.subscription import Subscription
+from license.exceptions.plan import PlanUpgradeError
+from license.exceptions.subscription import SubscriptionWebsiteLimitReached
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Tests for instrumentation."""
+
+    def setUp(self):
+        """Enable instrumentation into fresh metrics."""
+        self.original = Subscription.__dict__['add_website']
+        self.metrics = instrumentation.Metrics()
+        instrumentation.enable(self.metrics)
+        self.addCleanup(instrumentation.disable)
+
+    def test_disable(self):
+        """Test disabling restores the original methods."""
+        self.assertTrue(instrumentation.is_enabled())
+        self.assertIsNot(Subscription.__dict__['add_website'], self.original)
+        instrumentation.enable(self.metrics)
+        instrumentation.disable()
+        self.assertFalse(instrumentation.is_enabled())
+        self.assertIs(Subscription.__dict__['add_website'], self.original)
+        Customer('name', 'email', 'password', Plan.SINGLE)
+        self.assertEqual(self.metrics.latency, {})
+
+    def test_metrics(self):
+        """Test latencies, rejections and sizes are recorded."""
+        customer = Customer('name', 'email', 'password', Plan.SINGLE)
+        customer.subscription.add_website('url1')
+        with self.assertRaises(SubscriptionWebsiteLimitReached):
+            customer.subscription.add_website('url2')
+        with self.assertRaises(PlanUpgradeError):
+            Plan(Plan.INFINITE).upgrade(Plan.SINGLE)
+        self.assertEqual(
+            self.metrics.latency['Subscription.add_website'].count, 2)
+        self.assertEqual(self.metrics.latency['Customer.subscribe'].count, 1)
+        self.assertEqual(self.metrics.rejections, {
+            ('Subscription.add_website', 'SubscriptionWebsiteLimitReached'):
+                1,
+            ('Plan.upgrade', 'PlanUpgradeError'): 1,
+        })
+        self.assertEqual(self.metrics.sizes.count, 2)
+        self.assertEqual(self.metrics.sizes.sum, 2)
+
+    def test_deferred_downgrade(self):
+        """Test plan changes and their enforcement are recorded."""
+        customer = Customer('name', 'email', 'password', Plan.PLUS)
+        customer.subscription.add_websites(['url1', 'url2'])
+        customer.subscription.change_plan(Plan.SINGLE)
+        customer.subscription.enforce_allowance(['url2'])
+        self.assertEqual(
+            self.metrics.latency['Subscription.change_plan'].count, 1)
+        self.assertEqual(
+            self.metrics.latency['Subscription.enforce_allowance'].count, 1)
+
+    def test_render(self):
+        """Test the Prometheus text format."""
+        customer = Customer('name', 'email', 'password', Plan.SINGLE)
+        customer.subscription.add_website('url1')
+        with self.assertRaises(SubscriptionWebsiteLimitReached):
+            customer.subscription.add_website('url2')
+        lines = self.metrics.render().splitlines()
+        self.assertIn('# TYPE license_operation_seconds histogram', lines)
+        self.assertIn(
+            'license_operation_seconds_bucket{le="+Inf",'
+            'operation="Subscription.add_website"} 2', lines)
+        self.assertIn(
+            'license_operation_seconds_count'
+            '{operation="Subscription.add_website"} 2', lines)
+        self.assertIn(
+            'license_rejections_total{exception='
+            '"SubscriptionWebsiteLimitReached",'
+            'operation="Subscription.add_website"} 1', lines)
+        self.assertIn(
+            'license_subscription_enabled_websites_bucket{le="1"} 2', lines)
+        for line in lines:
+            if not line.startswith('#'):
+                float(line.rsplit(' ', 1)[1])
+
+
+class TestHistogram(unittest.TestCase):
+    """Tests for histogram."""
+
+    def test_cumulative(self):
+        """Test bucket counts are cumulative."""
+        histogram = instrumentation.Histogram((1, 10))
+        for value in (0, 1, 5, 50):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()),
+                         [(1, 2), (10, 3), ('+Inf', 4)])
+        self.assertEqual((histogram.sum, histogram.count), (56, 4))
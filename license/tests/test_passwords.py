@@ -0,0 +1,85 @@
+"""
+.. module: license.tests.test_passwords
+    :synopsis: Password hashing tests.
+"""
+
+from __future__ import unicode_literals
+import unittest
+from license import passwords
+from license.passwords import PasswordHasher
+
+
+class TestPasswordHasher(unittest.TestCase):
+    """Tests for password hasher."""
+
+    def setUp(self):
+        """Set up a cheap hasher."""
+        self.hasher = PasswordHasher(n=2 ** 4, r=1, iterations=1,
+                                     workers=2)
+
+    def tearDown(self):
+        """Stop the hashing threads."""
+        self.hasher.close()
+
+    def test_encode_verify(self):
+        """Test encoded passwords verify and are salted."""
+        encoded = self.hasher.encode('pässword')
+        self.assertTrue(passwords.is_encoded(encoded))
+        self.assertFalse(passwords.is_encoded('pässword'))
+        self.assertTrue(encoded.startswith(self.hasher.algorithm + '$'))
+        self.assertTrue(self.hasher.verify('pässword', encoded))
+        self.assertFalse(self.hasher.verify('password', encoded))
+        self.assertNotEqual(self.hasher.encode('pässword'), encoded)
+        self.assertFalse(self.hasher.verify('pässword', 'pässword'))
+        self.assertFalse(self.hasher.verify(
+            'pässword', encoded.rsplit('$', 1)[0] + '$!!'))
+
+    def test_pbkdf2(self):
+        """Test the PBKDF2 fallback."""
+        hasher = PasswordHasher(passwords.PBKDF2, iterations=10)
+        encoded = hasher.encode('password')
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$10$'))
+        self.assertTrue(hasher.verify('password', encoded))
+        self.assertTrue(self.hasher.verify('password', encoded))
+        self.assertTrue(self.hasher.needs_rehash(encoded))
+        with self.assertRaises(ValueError):
+            PasswordHasher('md5')
+
+    def test_needs_rehash(self):
+        """Test parameter changes require a rehash."""
+        encoded = self.hasher.encode('password')
+        self.assertFalse(self.hasher.needs_rehash(encoded))
+        self.assertTrue(PasswordHasher(n=2 ** 5, r=1, iterations=2)
+                        .needs_rehash(encoded))
+        self.assertTrue(self.hasher.needs_rehash('password'))
+
+    def test_async(self):
+        """Test hashing on the thread pool."""
+        encoded = self.hasher.encode_async('password').get(10)
+        self.assertTrue(
+            self.hasher.verify_async('password', encoded).get(10))
+        many = self.hasher.encode_many(['a', 'b', 'c'])
+        self.assertEqual(
+            [self.hasher.verify(password, encoded)
+             for password, encoded in zip('abc', many)],
+            [True, True, True])
+
+    def test_cache(self):
+        """Test successful verifications are cached."""
+        hasher = PasswordHasher(n=2 ** 4, r=1, iterations=1, cache_size=2)
+        encoded = hasher.encode('password')
+        self.assertFalse(hasher.verify('wrong', encoded))
+        self.assertTrue(hasher.verify('password', encoded))
+        self.assertTrue(hasher.verify('password', encoded))
+        self.assertFalse(hasher.verify('wrong', encoded))
+        self.assertEqual(hasher.stats()['cache_hits'], 1)
+        self.assertEqual(hasher.stats()['cache_size'], 1)
+        self.assertEqual(self.hasher.stats()['cache_size'], 0)
+
+    def test_make_password(self):
+        """Test passwords are always encoded."""
+        encoded = passwords.make_password('password')
+        self.assertTrue(passwords.hasher().verify('password', encoded))
+        self.assertNotEqual(passwords.make_password(encoded), encoded)
+        self.assertTrue(passwords.hasher().verify(
+            encoded, passwords.make_password(encoded)))